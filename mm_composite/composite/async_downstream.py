@@ -0,0 +1,134 @@
+"""
+Asynchronous counterpart of ``downstream.py`` for the async views.
+
+Each downstream service gets one ``httpx.AsyncClient`` per event loop, sharing
+the pool sizes and timeouts configured in ``DOWNSTREAM_SERVICES``. Under an
+ASGI server there is a single loop per worker process, so every in-flight
+aggregation shares the same keep-alive pools.
+
+``httpx`` is only required when ``COMPOSITE_ASYNC_VIEWS`` is enabled.
+"""
+
+import asyncio
+import time
+import weakref
+
+from django.core.exceptions import ImproperlyConfigured
+
+from . import httpcache, jsoncodec, metrics
+from .downstream import service_config, service_url
+from .logutil import request_id_headers
+from .resilience import (
+    CircuitOpen, DeadlineExceeded, budget_spent, call_budget, get_breaker)
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+# event loop -> {service: AsyncClient}
+_clients = weakref.WeakKeyDictionary()
+
+
+def get_client(service):
+    """Return the pooled async client for a service on the running loop."""
+    if httpx is None:
+        raise ImproperlyConfigured(
+            "The async composite views require httpx to be installed")
+
+    loop = asyncio.get_running_loop()
+    clients = _clients.setdefault(loop, {})
+    client = clients.get(service)
+    if client is None:
+        config = service_config(service)
+        client = clients[service] = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=config['POOL_SIZE'],
+                max_keepalive_connections=config['POOL_SIZE'],
+            ),
+            timeout=httpx.Timeout(
+                config['READ_TIMEOUT'], connect=config['CONNECT_TIMEOUT']),
+            # httpx only retries failed connection attempts
+            transport=httpx.AsyncHTTPTransport(retries=config['RETRIES']),
+        )
+    return client
+
+
+async def request(service, method, path, **kwargs):
+    """
+    Issue a request to a downstream service on its pooled async client.
+
+    :param service: Name of the service in ``DOWNSTREAM_SERVICES``
+    :param method: HTTP method
+    :param path: Path starting with ``/``
+    :param kwargs: Passed through to ``httpx.AsyncClient.request``
+    :return: ``httpx.Response``
+    :raises CircuitOpen: If the service's circuit breaker is open
+    :raises DeadlineExceeded: If the request's deadline has passed
+    """
+    if method == 'GET' and httpcache.enabled():
+        return await httpcache.get_http_cache().aget(
+            service, service_url(service, path), kwargs,
+            lambda **kwargs: send(service, method, path, **kwargs))
+    return await send(service, method, path, **kwargs)
+
+
+async def send(service, method, path, **kwargs):
+    """``request`` without the HTTP cache."""
+    config = service_config(service)
+    breaker = get_breaker(service)
+    try:
+        (connect, read), deadline_headers = call_budget(
+            config['CONNECT_TIMEOUT'], config['READ_TIMEOUT'])
+        breaker.before_call()
+    except (CircuitOpen, DeadlineExceeded) as e:
+        metrics.UPSTREAM_ERRORS.inc(service, type(e).__name__)
+        raise
+    kwargs.setdefault('timeout', httpx.Timeout(read, connect=connect))
+    kwargs['headers'] = {**deadline_headers, **request_id_headers(),
+                         **(kwargs.get('headers') or {})}
+
+    client = get_client(service)
+    metrics.UPSTREAM_IN_FLIGHT.inc(service)
+    start = time.perf_counter()
+    try:
+        response = await client.request(
+            method, service_url(service, path), **kwargs)
+    except httpx.HTTPError as e:
+        if budget_spent():
+            # Cut short by the caller's deadline, not by the service
+            breaker.record_inconclusive()
+        else:
+            breaker.record_failure()
+        metrics.UPSTREAM_ERRORS.inc(service, type(e).__name__)
+        raise
+    finally:
+        metrics.UPSTREAM_IN_FLIGHT.dec(service)
+        metrics.UPSTREAM_LATENCY.observe(
+            service, method, value=time.perf_counter() - start)
+    metrics.UPSTREAM_REQUESTS.inc(service, str(response.status_code))
+    if response.status_code >= 500:
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+    return response
+
+
+def decode(response, raw=False):
+    """``downstream.decode`` for ``httpx`` responses; raises ValueError."""
+    return jsoncodec.decode(response.content, raw)
+
+
+async def get(service, path, **kwargs):
+    return await request(service, 'GET', path, **kwargs)
+
+
+async def post(service, path, **kwargs):
+    return await request(service, 'POST', path, **kwargs)
+
+
+async def close_clients():
+    """Close the clients bound to the running loop."""
+    clients = _clients.pop(asyncio.get_running_loop(), {})
+    for client in clients.values():
+        await client.aclose()
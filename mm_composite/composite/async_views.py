@@ -0,0 +1,239 @@
+"""
+Async versions of the composite views.
+
+These mirror ``EventCreateView``, ``EnrichedEventView`` and
+``EnrichedAvailabilityView`` but keep all downstream I/O on the event loop
+(see ``async_downstream.py``), so under ASGI one worker can hold many
+aggregations in flight instead of one per thread. They are routed instead of
+the DRF views when ``COMPOSITE_ASYNC_VIEWS`` is enabled.
+
+They keep feature parity with the DRF views (idempotency keys, sparse
+fieldsets, the response cache with ETags, singleflight and ``?stream=``), so
+an A/B between the two modes measures the I/O model only. The list
+endpoint (``/getevents/``) and GraphQL have no async version: they are
+served by the same sync views in both modes.
+"""
+
+import logging
+import time
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import AuthenticationFailed
+
+from . import async_downstream, changes, invitations, jsoncodec, metrics
+from .enrichment import AVAILABILITY, EVENT, AsyncEnricher
+from .fieldsets import FieldSelection
+from .idempotency import aidempotent
+from .response_cache import get_response_cache
+from .streaming import aenrichment_records, stream_format, streaming_response
+from .tokencache import get_token_cache
+from .util import RemoteJWTAuthentication
+
+logger = logging.getLogger(__name__)
+
+
+async def authenticate(request):
+    """
+    Async equivalent of ``RemoteJWTAuthentication.authenticate``.
+
+    The DRF authentication class is reused, but its checks can block (a JWKS
+    refresh, the revocation list and the token cache's shared tier all do
+    I/O), so they run in one hop to a worker thread. Only a token cache miss
+    goes to the auth service, on the event loop, and none at all in local
+    mode.
+    """
+    authenticator = RemoteJWTAuthentication()
+    raw_token = authenticator.get_raw_token(request)
+    start = time.perf_counter()
+    validated_token, user_info, result = await sync_to_async(
+        resolve_locally, thread_sensitive=False)(authenticator, raw_token)
+    if user_info is None:
+        result = "remote"
+        try:
+            response = await async_downstream.get(
+                authenticator.AUTH_SERVICE, authenticator.AUTH_SERVICE_PATH,
+                headers={"Authorization": f"Bearer {validated_token}"}
+            )
+            if response.status_code == 200:
+                user_info = async_downstream.decode(response)
+        except Exception:
+            pass
+        if user_info:
+            await sync_to_async(get_token_cache().set, thread_sensitive=False)(
+                raw_token, user_info, exp=validated_token.get("exp"))
+
+    if not user_info:
+        result = "failed"
+    metrics.AUTH_LATENCY.observe(result, value=time.perf_counter() - start)
+    if not user_info:
+        raise AuthenticationFailed("User not found")
+
+    return authenticator.create_user_representation(user_info), validated_token
+
+
+def resolve_locally(authenticator, raw_token):
+    """
+    The blocking part of ``authenticate``.
+
+    :return: ``(validated_token, user_info, result)``; ``user_info`` is None
+             if the auth service has to be asked
+    """
+    validated_token = authenticator.get_validated_token(raw_token)
+    user_info = authenticator.local_user_info(validated_token)
+    result = "local"
+    if user_info is None and not authenticator.is_revoked(validated_token):
+        user_info = get_token_cache().get(raw_token)
+        result = "cached"
+    return validated_token, user_info, result
+
+
+def json_response(data, status=200):
+    """
+    ``JsonResponse`` encoded with the configured codec (see ``jsoncodec.py``).
+    A ``None`` body (e.g. a 304) is sent empty.
+    """
+    content = b"" if data is None else jsoncodec.encode(data)
+    return HttpResponse(content, status=status, content_type="application/json")
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncCompositeView(View):
+    """Authenticates the caller before running an async handler."""
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            request.user, request.auth = await authenticate(request)
+        except AuthenticationFailed as e:
+            return json_response({"detail": str(e.detail)}, status=401)
+        return await super().dispatch(request, *args, **kwargs)
+
+
+class AsyncEventCreateView(AsyncCompositeView):
+    async def post(self, request):
+        return await aidempotent(
+            request, lambda: self.create(request),
+            lambda body, status: json_response(body, status=status))
+
+    async def create(self, request):
+        try:
+            event_data = jsoncodec.loads(request.body or b"{}")
+        except ValueError:
+            return json_response({"detail": "Invalid JSON body"}, status=400)
+        if not isinstance(event_data, dict):
+            return json_response({"detail": "Event data must be a JSON object"},
+                                 status=400)
+
+        event_response = await async_downstream.post(
+            "scheduling", "/events/",
+            json=event_data,
+            headers={"Authorization": f"Bearer {request.auth}"}
+        )
+
+        if event_response.status_code == 201 or event_response.status_code == 200:
+            created_event = async_downstream.decode(event_response, raw=True)
+            if created_event.get('id') is not None:
+                await sync_to_async(changes.apply_changes, thread_sensitive=False)(
+                    [("event", created_event['id'], "created", created_event)],
+                    source="composite")
+            await self.send_event_emails(created_event, request.auth)
+        else:
+            created_event = async_downstream.decode(event_response)
+
+        return json_response(created_event, status=event_response.status_code)
+
+    async def send_event_emails(self, event, auth_token):
+        await sync_to_async(invitations.dispatch_event_emails)(
+            event, auth_token)
+
+
+async def get_enriched_event(request, event_id, selection):
+    """Async equivalent of ``views.get_enriched_event``."""
+    try:
+        event_data = await AsyncEnricher.for_request(request).get(
+            EVENT, event_id, only=selection.expansions(EVENT))
+    except Exception as e:
+        logger.warning("Error retrieving event %s: %s", event_id, e)
+        return None
+    return selection.apply(event_data)
+
+
+def parse_selection(request, resource):
+    """
+    :return: ``(selection, error_response)``; see ``views.parse_selection``
+    """
+    selection = FieldSelection.from_request(request)
+    try:
+        selection.expansions(resource)
+    except ValueError as e:
+        return None, json_response({"detail": str(e)}, status=400)
+    return selection, None
+
+
+class AsyncEnrichedEventView(AsyncCompositeView):
+    async def get(self, request, event_id):
+        selection, error = parse_selection(request, EVENT)
+        if error is not None:
+            return error
+
+        fmt = stream_format(request)
+        if fmt:
+            return await self.stream(request, event_id, fmt, selection)
+
+        response_cache = get_response_cache()
+        entry = await response_cache.aget_or_build(
+            "event", event_id, request,
+            lambda: get_enriched_event(request, event_id, selection),
+            variant=selection.key, depends_on=EVENT.embedded)
+
+        if entry is None:
+            return json_response({"detail": "Failed to retrieve event"}, status=500)
+
+        return response_cache.respond(request, entry, json_response)
+
+    async def stream(self, request, event_id, fmt, selection):
+        """See ``EnrichedEventView.stream``."""
+        enricher = AsyncEnricher.for_request(request)
+        try:
+            event_data = await enricher.fetch_one(EVENT, event_id)
+        except Exception as e:
+            logger.warning("Error retrieving event %s: %s", event_id, e)
+            return json_response({"detail": "Failed to retrieve event"}, status=500)
+
+        return streaming_response(fmt, aenrichment_records(
+            [("event", event_data)],
+            EVENT.wanted(event_data, selection.expansions(EVENT)).get("user", set()),
+            enricher.users))
+
+
+async def get_enriched_availability(request, availability_id, selection):
+    """Async equivalent of ``views.get_enriched_availability``."""
+    try:
+        availability_data = await AsyncEnricher.for_request(request).get(
+            AVAILABILITY, availability_id,
+            only=selection.expansions(AVAILABILITY))
+    except Exception as e:
+        logger.warning("Error retrieving availability %s: %s", availability_id, e)
+        return None
+    return selection.apply(availability_data)
+
+
+class AsyncEnrichedAvailabilityView(AsyncCompositeView):
+    async def get(self, request, availability_id):
+        selection, error = parse_selection(request, AVAILABILITY)
+        if error is not None:
+            return error
+
+        response_cache = get_response_cache()
+        entry = await response_cache.aget_or_build(
+            "availability", availability_id, request,
+            lambda: get_enriched_availability(request, availability_id, selection),
+            variant=selection.key, depends_on=AVAILABILITY.embedded)
+
+        if entry is None:
+            return json_response({"detail": "Failed to retrieve availability"}, status=500)
+
+        return response_cache.respond(request, entry, json_response)
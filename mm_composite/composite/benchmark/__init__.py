@@ -0,0 +1,7 @@
+"""
+Offline benchmark harness for the composite service.
+
+``stubs`` fakes the downstream services, ``server`` runs the composite
+in-process against them and ``driver`` generates load and collects the
+figures. Run it with ``python manage.py benchmark``.
+"""
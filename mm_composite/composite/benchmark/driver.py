@@ -0,0 +1,174 @@
+"""
+Closed-loop load generator for the composite endpoints.
+
+``concurrency`` client threads each send their next request as soon as the
+previous one returns, until ``requests`` requests have been made. Latency is
+measured per request on the client side; upstream calls are read from the
+stubs' counters before and after the run.
+"""
+
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+
+GRAPHQL_QUERY = """
+query ($eventId: Int!) {
+  enrichedEvent(eventId: $eventId) {
+    id title datetime
+    organizer { id username email }
+    participants { id username email }
+  }
+}
+"""
+
+
+class Scenario:
+    """
+    :param name: Label used in the report
+    :param build: Callable taking a random event/resource ID and returning
+                  ``(method, path, json_body)``
+    """
+
+    def __init__(self, name, build):
+        self.name = name
+        self.build = build
+
+
+def post_event(resource_id, participants):
+    return "POST", "/postevent/", {
+        "title": f"Benchmark {resource_id}",
+        "description": "Created by the benchmark",
+        "datetime": "2024-01-01T10:00:00Z",
+        "location": "Room 1",
+        "participant_ids": list(range(1, participants + 1)),
+    }
+
+
+def scenarios(participants):
+    return {
+        "postevent": Scenario(
+            "postevent", lambda rid: post_event(rid, participants)),
+        "getevent": Scenario(
+            "getevent", lambda rid: ("GET", f"/getevent/{rid}/", None)),
+        "getevents": Scenario(
+            "getevents", lambda rid: ("GET", "/getevents/?limit=25", None)),
+        "getavailability": Scenario(
+            "getavailability",
+            lambda rid: ("GET", f"/getavailability/{rid}/", None)),
+        "graphql": Scenario(
+            "graphql", lambda rid: ("POST", "/graphql/", {
+                "query": GRAPHQL_QUERY, "variables": {"eventId": rid}})),
+    }
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, round(fraction * len(values)) - 1))
+    return values[index]
+
+
+class Result:
+    def __init__(self, scenario, concurrency, latencies, errors, elapsed,
+                 upstream_calls):
+        self.scenario = scenario
+        self.concurrency = concurrency
+        self.latencies = sorted(latencies)
+        self.errors = errors
+        self.elapsed = elapsed
+        # {service: calls made during the run}
+        self.upstream_calls = upstream_calls
+
+    @property
+    def requests(self):
+        return len(self.latencies)
+
+    def as_dict(self):
+        count = self.requests or 1
+        return {
+            "scenario": self.scenario,
+            "concurrency": self.concurrency,
+            "requests": self.requests,
+            "errors": self.errors,
+            "throughput": self.requests / self.elapsed if self.elapsed else 0.0,
+            "p50_ms": percentile(self.latencies, 0.50) * 1000,
+            "p95_ms": percentile(self.latencies, 0.95) * 1000,
+            "p99_ms": percentile(self.latencies, 0.99) * 1000,
+            "upstream_calls_per_request": {
+                service: calls / count
+                for service, calls in sorted(self.upstream_calls.items())},
+        }
+
+
+def wait_for_quiet(stubs, settle=0.2, timeout=5.0):
+    """
+    Wait until no stub has been called for ``settle`` seconds, so work a
+    request left behind (e.g. queued invitation emails) is counted with it.
+    """
+    deadline = time.monotonic() + timeout
+    last = None
+    while time.monotonic() < deadline:
+        current = sum(stub.total_calls() for stub in stubs.values())
+        if current == last:
+            return
+        last = current
+        time.sleep(settle)
+
+
+def run(scenario, base_url, token, concurrency, total, stubs, id_range=1000):
+    """
+    Drive one scenario at one concurrency level.
+
+    :param base_url: Root URL of the composite service
+    :param token: Bearer token to send
+    :param total: Number of requests to make
+    :param stubs: ``{service: StubService}`` whose calls are counted
+    :param id_range: Resource IDs are drawn from ``1..id_range``
+    :return: ``Result``
+    """
+    headers = {"Authorization": f"Bearer {token}"}
+    remaining = iter(range(total))
+    remaining_lock = threading.Lock()
+    latencies, errors = [], []
+
+    def client():
+        # One session (and keep-alive connection) per client thread
+        session = requests.Session()
+        while True:
+            with remaining_lock:
+                if next(remaining, None) is None:
+                    return
+            method, path, body = scenario.build(random.randint(1, id_range))
+            start = time.perf_counter()
+            try:
+                response = session.request(
+                    method, base_url + path, json=body, headers=headers,
+                    timeout=30)
+                # Streamed bodies count until the last byte arrives
+                response.content
+                failed = response.status_code >= 400 or (
+                    scenario.name == "graphql" and "errors" in response.json())
+            except (requests.RequestException, json.JSONDecodeError):
+                failed = True
+            latencies.append(time.perf_counter() - start)
+            if failed:
+                errors.append(path)
+
+    wait_for_quiet(stubs)
+    before = {name: stub.total_calls() for name, stub in stubs.items()}
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(client)
+    elapsed = time.perf_counter() - start
+    wait_for_quiet(stubs)
+    upstream_calls = {name: stub.total_calls() - before[name]
+                      for name, stub in stubs.items()}
+    return Result(scenario.name, concurrency, latencies, len(errors), elapsed,
+                  upstream_calls)
@@ -0,0 +1,37 @@
+"""
+Serve the composite in-process for benchmarking.
+
+A threaded ``wsgiref`` server is not what production runs, but it is
+dependency-free and the same on every machine, so numbers from one commit
+compare with the next. Point ``benchmark --target`` at a real server
+(gunicorn, uvicorn) to measure that instead.
+"""
+
+import threading
+from socketserver import ThreadingMixIn
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+from django.core.wsgi import get_wsgi_application
+
+
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+    # Room for every benchmark client connecting at once
+    request_queue_size = 1024
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_composite(port=0):
+    """
+    :return: ``(server, base_url)``; call ``server.shutdown()`` when done
+    """
+    server = make_server("127.0.0.1", port, get_wsgi_application(),
+                         server_class=ThreadingWSGIServer,
+                         handler_class=QuietHandler)
+    threading.Thread(target=server.serve_forever, name="composite-server",
+                     daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
@@ -0,0 +1,217 @@
+"""
+Stand-ins for the scheduling, user and notification services.
+
+Each stub is a threaded HTTP server answering the handful of endpoints the
+composite calls, with fabricated but well-formed data. Every response is
+delayed by ``latency`` plus up to ``jitter`` seconds, and fails with a 503
+with probability ``error_rate``. Calls are counted per route so a benchmark
+can report how many upstream calls each composite request costs.
+"""
+
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class StubConfig:
+    def __init__(self, latency=0.02, jitter=0.005, error_rate=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+
+    def delay(self):
+        return self.latency + random.uniform(0, self.jitter)
+
+
+def user(user_id):
+    return {
+        "id": user_id,
+        "username": f"user{user_id}",
+        "first_name": f"User {user_id}",
+        "email": f"user{user_id}@example.com",
+    }
+
+
+def event(event_id, participants):
+    return {
+        "id": event_id,
+        "title": f"Event {event_id}",
+        "description": "Benchmark event",
+        "datetime": "2024-01-01T10:00:00Z",
+        "location": "Room 1",
+        "organizer_id": 1,
+        "organizer_profile": 1,
+        "participant_ids": [
+            (event_id + n) % 10000 + 1 for n in range(participants)],
+    }
+
+
+class StubService:
+    """
+    One stub service listening on ``127.0.0.1``.
+
+    :param name: Name of the service in ``DOWNSTREAM_SERVICES``
+    :param routes: ``[(method, path regex, route name, handler)]``; handlers
+                   take ``(match, query, body)`` and return ``(status, data)``
+    :param port: Port to bind, or 0 for any free port
+    """
+
+    def __init__(self, name, routes, config, port=0):
+        self.name = name
+        self.routes = [(method, re.compile(pattern + "$"), route, handler)
+                       for method, pattern, route, handler in routes]
+        self.config = config
+        self.counts = {}
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(
+            ("127.0.0.1", port), self._handler_class())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self.server.serve_forever, name=f"stub-{self.name}",
+            daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.counts)
+
+    def reset(self):
+        with self._lock:
+            self.counts.clear()
+
+    def total_calls(self):
+        with self._lock:
+            return sum(self.counts.values())
+
+    def dispatch(self, method, path, query, body):
+        for route_method, pattern, route, handler in self.routes:
+            match = pattern.match(path) if route_method == method else None
+            if match:
+                with self._lock:
+                    key = f"{method} {route}"
+                    self.counts[key] = self.counts.get(key, 0) + 1
+                time.sleep(self.config.delay())
+                if random.random() < self.config.error_rate:
+                    return 503, {"detail": "Injected failure"}
+                return handler(match, query, body)
+        return 404, {"detail": "Not found"}
+
+    def _handler_class(self):
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _handle(self, method):
+                url = urlparse(self.path)
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"null")
+                status, data = service.dispatch(
+                    method, url.path, parse_qs(url.query), body)
+                payload = json.dumps(data).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                self._handle("GET")
+
+            def do_POST(self):
+                self._handle("POST")
+
+        return Handler
+
+
+def scheduling_service(config, participants, port=0):
+    """:param participants: Participants on every stub event"""
+    created = iter(range(100000, 10 ** 9))
+
+    def get_event(match, query, body):
+        return 200, event(int(match.group(1)), participants)
+
+    def create_event(match, query, body):
+        body = dict(body or {})
+        body["id"] = next(created)
+        body.setdefault("organizer_id", 1)
+        body.setdefault("participant_ids", [])
+        return 201, body
+
+    def list_events(match, query, body):
+        page = [event(event_id, participants) for event_id in range(1, 26)]
+        return 200, {"count": 1000, "next": None, "previous": None,
+                     "results": page}
+
+    def get_availability(match, query, body):
+        availability_id = int(match.group(1))
+        return 200, {"id": availability_id,
+                     "participant_id": availability_id % 10000 + 1,
+                     "event_id": availability_id}
+
+    return StubService("scheduling", [
+        ("GET", r"/events/(\d+)/", "/events/{id}/", get_event),
+        ("POST", r"/events/", "/events/", create_event),
+        ("GET", r"/events/", "/events/", list_events),
+        ("GET", r"/availabilities/(\d+)/", "/availabilities/{id}/",
+         get_availability),
+    ], config, port)
+
+
+def user_service(config, port=0):
+    def get_user(match, query, body):
+        return 200, user(int(match.group(1)))
+
+    def get_caller(match, query, body):
+        # Every benchmark request is made as user 1
+        return 200, user(1)
+
+    return StubService("users", [
+        ("GET", r"/userinfo/(\d+)/", "/userinfo/{id}/", get_user),
+        ("GET", r"/userinfo/", "/userinfo/", get_caller),
+    ], config, port)
+
+
+def notification_service(config, port=0):
+    def send_email(match, query, body):
+        return 200, {"status": "sent"}
+
+    return StubService("notifications", [
+        ("POST", r"/send-email", "/send-email", send_email),
+    ], config, port)
+
+
+def start_stubs(config, participants, ports=None):
+    """
+    Start one stub per downstream service.
+
+    :param ports: Optional ``{service: port}``; unlisted services get any
+                  free port
+    :return: ``{service: StubService}``
+    """
+    ports = ports or {}
+    stubs = [
+        scheduling_service(config, participants, ports.get("scheduling", 0)),
+        user_service(config, ports.get("users", 0)),
+        notification_service(config, ports.get("notifications", 0)),
+    ]
+    return {stub.name: stub.start() for stub in stubs}
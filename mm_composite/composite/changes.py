@@ -0,0 +1,243 @@
+"""
+Change notifications from the upstream services.
+
+The scheduling and user services report writes to the composite service
+instead of letting its caches run out their TTLs. A notification names one
+changed object::
+
+    {"resource": "user", "id": 7, "action": "updated", "data": {...}}
+
+and is delivered either to the ``webhooks/changes/`` endpoint, signed with
+the sending service's shared secret, or through a message queue drained by
+``manage.py consume_changes``. Applying it:
+
+* ``user``: refreshes the cached profile and the replica row from ``data``
+  when it is sent, otherwise evicts them; forgets tokens resolved to the
+  user in this process; drops the user service's stored responses about the
+  user from the HTTP cache; retires every enriched aggregate embedding the
+  user.
+* ``event`` / ``availability``: drops the object's stored upstream response,
+  and every stored page of the listing it appears in (``/events/``, behind
+  ``getevents``), and retires its enriched aggregates, for every caller.
+
+Events created through ``postevent`` are applied the same way, as a
+``created`` change from the ``composite`` source.
+
+Invalidation only reaches other workers through shared caches, so once a
+source is configured the system check ``composite.E001`` rejects
+process-local (``LocMemCache``) backends for the caches it touches. With
+notifications flowing, ``USER_SERVICE['CACHE_TTL']`` and
+``RESPONSE_CACHE['TTL']`` can then be raised well above what staleness
+would otherwise allow.
+"""
+
+import hashlib
+import hmac
+import logging
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+
+from . import downstream, httpcache, jsoncodec, metrics, replica
+from .enrichment import AVAILABILITY, EVENT
+from .response_cache import get_response_cache, response_cache_setting
+from .tokencache import get_token_cache
+from .users import cache_users, evict_user, user_service_setting
+from .util import RemoteJWTAuthentication
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULTS = {
+    # {source: {'SECRET': str, 'RESOURCES': [resource, ...]}}; notifications
+    # from unlisted sources, or about other resources, are rejected
+    'SOURCES': {},
+    'SIGNATURE_HEADER': 'X-Webhook-Signature',
+    'SOURCE_HEADER': 'X-Webhook-Source',
+    # Redis pub/sub consumer used by ``manage.py consume_changes``
+    'REDIS_URL': 'redis://localhost:6379/0',
+    'CHANNELS': ['composite.changes'],
+}
+
+ACTIONS = ("created", "updated", "deleted")
+
+LOCAL_CACHE_BACKEND = 'django.core.cache.backends.locmem.LocMemCache'
+
+
+def changes_setting(name):
+    return getattr(settings, 'CHANGE_NOTIFICATIONS', {}).get(name, DEFAULTS[name])
+
+
+class InvalidChange(ValueError):
+    pass
+
+
+def enabled():
+    """:return: Whether any source may send notifications"""
+    return any(config.get('SECRET')
+               for config in changes_setting('SOURCES').values())
+
+
+def local_cache_aliases():
+    """
+    :return: Aliases of the caches notifications invalidate that are private
+             to each process
+    """
+    aliases = {response_cache_setting('BACKEND'),
+               user_service_setting('CACHE_BACKEND'),
+               httpcache.http_cache_setting('BACKEND')}
+    return sorted(
+        alias for alias in aliases if alias is not None
+        and settings.CACHES.get(alias, {}).get('BACKEND') == LOCAL_CACHE_BACKEND)
+
+
+def evict_upstream(service, path):
+    """Drop the stored upstream responses for a path from the HTTP cache."""
+    if httpcache.enabled():
+        httpcache.get_http_cache().evict(downstream.service_url(service, path))
+
+
+def parse_changes(payload):
+    """
+    :param payload: A single notification, or ``{"changes": [...]}``
+    :return: List of ``(resource, id, action, data)``
+    :raises InvalidChange: If a notification is malformed
+    """
+    items = payload.get("changes") if isinstance(payload, dict) else None
+    if items is None:
+        items = [payload]
+    changes = []
+    for item in items:
+        if not isinstance(item, dict) or item.get("id") is None:
+            raise InvalidChange("Each change needs a resource and an id")
+        action = item.get("action", "updated")
+        if action not in ACTIONS:
+            raise InvalidChange(f"Unknown action: {action}")
+        if item.get("resource") not in HANDLERS:
+            raise InvalidChange(f"Unknown resource: {item.get('resource')}")
+        changes.append((item["resource"], item["id"], action, item.get("data")))
+    return changes
+
+
+def apply_user_change(user_id, action, data):
+    if action != "deleted" and isinstance(data, dict):
+        cache_users(replica.project({user_id: data}))
+        replica.store([{**data, "id": user_id}])
+    else:
+        evict_user(user_id)
+        if action == "deleted":
+            replica.delete(user_id)
+    evict_upstream("users", user_service_setting('USERINFO_PATH').format(id=user_id))
+    if user_service_setting('BULK_PATH'):
+        evict_upstream("users", user_service_setting('BULK_PATH'))
+    # The caller lookup of tokens belonging to the user
+    evict_upstream(RemoteJWTAuthentication.AUTH_SERVICE,
+                   RemoteJWTAuthentication.AUTH_SERVICE_PATH)
+    get_token_cache().evict_user(user_id)
+    get_response_cache().invalidate("user", user_id)
+
+
+def apply_resource_change(resource):
+    def apply(resource_id, action, data):
+        evict_upstream(resource.service, resource.path.format(id=resource_id))
+        if resource.list_path:
+            evict_upstream(resource.service, resource.list_path)
+        get_response_cache().invalidate(resource.name, resource_id)
+    return apply
+
+
+HANDLERS = {
+    "user": apply_user_change,
+    "event": apply_resource_change(EVENT),
+    "availability": apply_resource_change(AVAILABILITY),
+}
+
+
+def apply_changes(changes, source=None):
+    """
+    :param changes: As returned by ``parse_changes``
+    :param source: Sending service, for logging and metrics
+    """
+    for resource, resource_id, action, data in changes:
+        HANDLERS[resource](resource_id, action, data)
+        metrics.CHANGES_APPLIED.inc(source or "unknown", resource, action)
+        logger.info("Applied %s %s %s from %s", resource, resource_id, action,
+                    source or "unknown")
+
+
+def verify_signature(secret, body, signature):
+    """
+    :param signature: ``sha256=<hex HMAC of the raw body>``
+    """
+    expected = "sha256=" + hmac.new(
+        secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature or "")
+
+
+@csrf_exempt
+@require_POST
+def change_webhook(request):
+    """Receive signed change notifications from an upstream service."""
+    source = request.headers.get(changes_setting('SOURCE_HEADER'))
+    config = changes_setting('SOURCES').get(source)
+    if not config or not config.get('SECRET') or not verify_signature(
+            config['SECRET'], request.body,
+            request.headers.get(changes_setting('SIGNATURE_HEADER'))):
+        logger.warning("Rejected change notification from %s", source)
+        return JsonResponse({"detail": "Invalid signature"}, status=403)
+
+    try:
+        changes = parse_changes(jsoncodec.loads(request.body))
+    except (ValueError, InvalidChange) as e:
+        return JsonResponse({"detail": str(e)}, status=400)
+    allowed = set(config.get('RESOURCES', HANDLERS))
+    for resource, resource_id, action, data in changes:
+        if resource not in allowed:
+            return JsonResponse(
+                {"detail": f"{source} may not report {resource} changes"},
+                status=403)
+
+    apply_changes(changes, source)
+    return JsonResponse({"applied": len(changes)}, status=202)
+
+
+class RedisConsumer:
+    """
+    Apply notifications published on Redis channels. Messages carry the same
+    JSON as the webhook plus a ``source`` field; the channel is trusted, so
+    they are not signed.
+    """
+
+    def __init__(self, url=None, channels=None):
+        if redis is None:
+            raise ImproperlyConfigured(
+                "Consuming change notifications requires redis to be installed")
+        if local_cache_aliases():
+            raise ImproperlyConfigured(
+                "Change notifications cannot reach the web workers through the "
+                f"process-local caches {', '.join(local_cache_aliases())}")
+        self.client = redis.Redis.from_url(url or changes_setting('REDIS_URL'))
+        self.channels = channels or changes_setting('CHANNELS')
+
+    def handle(self, raw):
+        """Apply one message; malformed messages are logged and dropped."""
+        try:
+            payload = jsoncodec.loads(raw)
+            source = payload.get("source") if isinstance(payload, dict) else None
+            apply_changes(parse_changes(payload), source)
+        except (ValueError, InvalidChange) as e:
+            logger.warning("Dropped change notification: %s", e)
+
+    def run(self):
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(*self.channels)
+        for message in pubsub.listen():
+            self.handle(message["data"])
@@ -0,0 +1,51 @@
+"""
+System checks for the composite service.
+"""
+
+from django.core.checks import Error, register
+from django.utils.module_loading import import_string
+
+from . import changes, invitations, tasks
+
+
+@register()
+def check_change_notification_caches(app_configs, **kwargs):
+    """
+    Change notifications are applied by whichever worker receives them, so
+    the caches they invalidate must be shared by every worker.
+    """
+    if not changes.enabled():
+        return []
+    return [
+        Error(
+            f"The '{alias}' cache is local to each process, so change "
+            "notifications would only invalidate it in the worker that "
+            "received them.",
+            hint="Point it at a shared backend such as Redis or Memcached, or "
+                 "disable CHANGE_NOTIFICATIONS sources.",
+            obj="CHANGE_NOTIFICATIONS",
+            id="composite.E001",
+        )
+        for alias in changes.local_cache_aliases()
+    ]
+
+
+@register()
+def check_invitation_service_token(app_configs, **kwargs):
+    """
+    Jobs in a durable queue outlive the request, so they cannot use the
+    caller's token to look participants up.
+    """
+    backend = import_string(tasks.task_queue_setting('BACKEND'))
+    if not backend.durable or invitations.service_token():
+        return []
+    return [
+        Error(
+            "Invitations queued in a durable task queue need a service token "
+            "to look participants up.",
+            hint="Set INVITATIONS['SERVICE_TOKEN'], or use "
+                 "composite.tasks.ThreadQueueBackend.",
+            obj="INVITATIONS",
+            id="composite.E002",
+        )
+    ]
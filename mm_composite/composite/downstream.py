@@ -0,0 +1,189 @@
+"""
+Pooled HTTP access to the downstream microservices.
+
+Every upstream the composite talks to gets one long-lived ``requests.Session``
+with its own keep-alive connection pool, connect/read timeouts and retry
+policy, all configured through ``DOWNSTREAM_SERVICES`` in settings. Call sites
+name the service and a path instead of hard-coding ``http://localhost:800x``.
+"""
+
+import logging
+import threading
+import time
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from . import httpcache, jsoncodec, metrics
+from .logutil import request_id_headers
+from .resilience import (
+    CircuitOpen, DeadlineExceeded, budget_spent, call_budget, get_breaker,
+    remaining_budget)
+
+logger = logging.getLogger(__name__)
+
+
+SERVICE_DEFAULTS = {
+    'BASE_URL': None,
+    # Keep-alive connections kept open to the service
+    'POOL_SIZE': 20,
+    'CONNECT_TIMEOUT': 2.0,
+    'READ_TIMEOUT': 10.0,
+    # Retries for idempotent requests on connection errors and 502/503/504
+    'RETRIES': 2,
+    'BACKOFF_FACTOR': 0.1,
+}
+
+RETRY_STATUSES = (502, 503, 504)
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+class DeadlineRetry(Retry):
+    """Retry policy that stops retrying once the request deadline is spent."""
+
+    def increment(self, *args, **kwargs):
+        remaining = remaining_budget()
+        if remaining is not None and remaining <= 0:
+            # Spend the remaining retries at once so urllib3 gives up
+            return Retry.increment(self.new(total=0), *args, **kwargs)
+        return super().increment(*args, **kwargs)
+
+
+def service_config(service):
+    try:
+        config = settings.DOWNSTREAM_SERVICES[service]
+    except (AttributeError, KeyError):
+        raise KeyError(f"Unknown downstream service: {service}")
+    return {**SERVICE_DEFAULTS, **config}
+
+
+def service_url(service, path):
+    """
+    Build the absolute URL of ``path`` on a downstream service.
+
+    :param service: Name of the service in ``DOWNSTREAM_SERVICES``
+    :param path: Path starting with ``/``
+    """
+    return service_config(service)['BASE_URL'].rstrip('/') + path
+
+
+def get_session(service):
+    """Return the shared, pooled session for a downstream service."""
+    session = _sessions.get(service)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(service)
+            if session is None:
+                session = _sessions[service] = build_session(service)
+    return session
+
+
+def build_session(service):
+    config = service_config(service)
+    retry = DeadlineRetry(
+        total=config['RETRIES'],
+        backoff_factor=config['BACKOFF_FACTOR'],
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=config['POOL_SIZE'],
+        max_retries=retry,
+        pool_block=False,
+    )
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def request(service, method, path, **kwargs):
+    """
+    Issue a request to a downstream service on its pooled session.
+
+    :param service: Name of the service in ``DOWNSTREAM_SERVICES``
+    :param method: HTTP method
+    :param path: Path starting with ``/``
+    :param kwargs: Passed through to ``requests.Session.request``; ``timeout``
+                   defaults to the service's (connect, read) timeouts, cut
+                   down to what is left of the request's deadline
+    :return: ``requests.Response``
+    :raises CircuitOpen: If the service's circuit breaker is open
+    :raises DeadlineExceeded: If the request's deadline has passed
+    """
+    if method == 'GET' and httpcache.enabled() and not kwargs.get('stream'):
+        return httpcache.get_http_cache().get(
+            service, service_url(service, path), kwargs,
+            lambda **kwargs: send(service, method, path, **kwargs))
+    return send(service, method, path, **kwargs)
+
+
+def send(service, method, path, **kwargs):
+    """``request`` without the HTTP cache."""
+    config = service_config(service)
+    breaker = get_breaker(service)
+    try:
+        timeout, deadline_headers = call_budget(
+            config['CONNECT_TIMEOUT'], config['READ_TIMEOUT'])
+        breaker.before_call()
+    except (CircuitOpen, DeadlineExceeded) as e:
+        metrics.UPSTREAM_ERRORS.inc(service, type(e).__name__)
+        raise
+    kwargs.setdefault('timeout', timeout)
+    kwargs['headers'] = {**deadline_headers, **request_id_headers(),
+                         **(kwargs.get('headers') or {})}
+
+    metrics.UPSTREAM_IN_FLIGHT.inc(service)
+    start = time.perf_counter()
+    try:
+        response = get_session(service).request(
+            method, service_url(service, path), **kwargs)
+    except requests.RequestException as e:
+        if budget_spent():
+            # Cut short by the caller's deadline, not by the service
+            breaker.record_inconclusive()
+        else:
+            breaker.record_failure()
+        metrics.UPSTREAM_ERRORS.inc(service, type(e).__name__)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        metrics.UPSTREAM_IN_FLIGHT.dec(service)
+        metrics.UPSTREAM_LATENCY.observe(service, method, value=elapsed)
+    metrics.UPSTREAM_REQUESTS.inc(service, str(response.status_code))
+    logger.debug("%s %s %s -> %s in %.3fs", service, method, path,
+                 response.status_code, elapsed)
+    if response.status_code >= 500:
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+    return response
+
+
+def decode(response, raw=False):
+    """
+    Decode a JSON response body with the configured codec.
+
+    :param raw: Keep the upstream bytes of an object for passthrough (see
+                ``jsoncodec.RawDocument``)
+    :raises requests.JSONDecodeError: If the body is not valid JSON, as
+                                      ``Response.json`` does
+    """
+    try:
+        return jsoncodec.decode(response.content, raw)
+    except ValueError as e:
+        raise requests.JSONDecodeError(str(e), "", 0) from e
+
+
+def get(service, path, **kwargs):
+    return request(service, 'GET', path, **kwargs)
+
+
+def post(service, path, **kwargs):
+    return request(service, 'POST', path, **kwargs)
@@ -0,0 +1,143 @@
+"""
+Invitation email rendering.
+
+An invitation differs between recipients only in a few fields (the greeting,
+essentially), so templates are rendered in two stages:
+
+1. Once per event and locale, the Django templates are rendered with every
+   recipient field replaced by a marker, and the output is split around the
+   markers (``SplitTemplate``).
+2. Per recipient, the literal pieces are joined with the recipient's values,
+   escaped for HTML bodies.
+
+Templates are loaded and compiled once per process. The subject, plain-text
+body and optional HTML body templates are set in ``INVITATIONS``; the locale
+is the recipient's ``locale`` field, else the event's, else ``LOCALE``.
+"""
+
+import re
+from datetime import datetime
+
+from django.conf import settings
+from django.template.loader import get_template
+from django.utils import translation
+from django.utils.dateparse import parse_datetime
+from django.utils.html import escape
+from django.utils.translation import gettext
+
+
+DEFAULTS = {
+    'SUBJECT_TEMPLATE': 'composite/invitation_subject.txt',
+    'TEXT_TEMPLATE': 'composite/invitation.txt',
+    # e.g. 'composite/invitation.html', sent as ``html_message``
+    'HTML_TEMPLATE': None,
+    # Locale used when neither the recipient nor the event names one
+    'LOCALE': None,
+}
+
+# Recipient fields the templates may use, with their fallback when unset
+RECIPIENT_FIELDS = {
+    "first_name": lambda: gettext("Participant"),
+}
+
+MARKER = re.compile("\x00([a-z_]+)\x00")
+
+
+def invitations_setting(name):
+    return getattr(settings, 'INVITATIONS', {}).get(name, DEFAULTS[name])
+
+
+class SplitTemplate:
+    """
+    Rendered output with holes for the recipient fields.
+
+    :param rendered: Template output containing ``MARKER``s
+    :param escape: Applied to recipient values, e.g. HTML escaping
+    """
+
+    def __init__(self, rendered, escape=str):
+        parts = MARKER.split(rendered.strip())
+        # Literals at even positions, field names at odd ones
+        self.literals = parts[::2]
+        self.fields = parts[1::2]
+        self.escape = escape
+
+    def render(self, values):
+        """:param values: Recipient field values, already defaulted"""
+        pieces = [self.literals[0]]
+        for field, literal in zip(self.fields, self.literals[1:]):
+            pieces.append(self.escape(values[field]))
+            pieces.append(literal)
+        return "".join(pieces)
+
+
+class EventInvitation:
+    """The invitation for one event in one locale, ready for any recipient."""
+
+    def __init__(self, templates, event, locale):
+        start = event.get('start_time') or event.get('datetime')
+        context = {
+            "event": event,
+            "start": (parse_datetime(start) or start) if start else None,
+            "locale": locale or settings.LANGUAGE_CODE,
+            "recipient": {field: f"\x00{field}\x00" for field in RECIPIENT_FIELDS},
+        }
+        with translation.override(locale or translation.get_language()):
+            self.subject = templates["subject"].render(context).strip()
+            self.text = SplitTemplate(templates["text"].render(context))
+            self.html = (SplitTemplate(templates["html"].render(context), escape)
+                         if templates["html"] else None)
+            self.defaults = {field: default()
+                             for field, default in RECIPIENT_FIELDS.items()}
+        self.time = datetime.now().strftime("%Y-%m-%d %H:%M")
+
+    def email(self, recipient):
+        """:return: Email data for the notifications service"""
+        values = {field: recipient.get(field) or self.defaults[field]
+                  for field in RECIPIENT_FIELDS}
+        email_data = {
+            "subject": self.subject,
+            "body": self.text.render(values),
+            "recipient_list": recipient.get('email'),
+            "time": self.time,
+        }
+        if self.html is not None:
+            email_data["html_message"] = self.html.render(values)
+        return email_data
+
+
+class InvitationRenderer:
+    def __init__(self):
+        html = invitations_setting('HTML_TEMPLATE')
+        self.templates = {
+            "subject": get_template(invitations_setting('SUBJECT_TEMPLATE')),
+            "text": get_template(invitations_setting('TEXT_TEMPLATE')),
+            "html": get_template(html) if html else None,
+        }
+
+    def for_event(self, event):
+        """
+        :return: Callable building the email for a recipient; the event is
+                 rendered once per locale among its recipients
+        """
+        invitations = {}
+        default_locale = event.get('locale') or invitations_setting('LOCALE')
+
+        def email(recipient):
+            locale = recipient.get('locale') or default_locale
+            if locale not in invitations:
+                invitations[locale] = EventInvitation(
+                    self.templates, event, locale)
+            return invitations[locale].email(recipient)
+
+        return email
+
+
+_renderer = None
+
+
+def get_renderer():
+    global _renderer
+    if _renderer is None:
+        _renderer = InvitationRenderer()
+    return _renderer
@@ -0,0 +1,281 @@
+"""
+Declarative enrichment of upstream resources.
+
+A ``Resource`` says where a document comes from and which of its fields
+refer to other objects (``Reference``). The ``Enricher`` does the rest for
+any mix of documents:
+
+1. collect every referenced ID, per target, across all the documents;
+2. resolve each target with one batched call (users go through
+   ``UserInfoClient.get_many``, so coalescing, bulk lookups and the fan-out
+   limits apply);
+3. attach the resolved objects, with placeholders and a ``degraded`` flag
+   for anything that could not be resolved.
+
+The REST views, the async views and the GraphQL schema all read references
+through these declarations, so they agree on field names (an event's
+organizer is ``organizer_id``, falling back to ``organizer_profile``) and a
+new composite resource needs a declaration rather than its own fetch loop.
+"""
+
+import logging
+
+from . import async_downstream, downstream
+from .fanout import fan_out
+from .users import AsyncUserInfoClient, UserInfoClient
+
+logger = logging.getLogger(__name__)
+
+
+def unresolved(object_id):
+    """Placeholder for an object whose details could not be fetched in time."""
+    return {"id": object_id, "unresolved": True}
+
+
+class Reference:
+    """
+    A field holding the ID (or, with ``many``, the list of IDs) of another
+    object, which is attached to the document under ``name``.
+
+    :param name: Field the resolved object is attached as
+    :param sources: Field, or fields in order of preference, holding the ID
+    :param target: Kind of object referred to, a key of the enricher's loaders
+    """
+
+    def __init__(self, name, sources, target="user", many=False):
+        self.name = name
+        self.sources = (sources,) if isinstance(sources, str) else tuple(sources)
+        self.target = target
+        self.many = many
+
+    def value(self, doc):
+        """:return: The referenced ID (list of IDs with ``many``), if any"""
+        for source in self.sources:
+            value = doc.get(source)
+            if value:
+                return value
+        return None
+
+    def ids(self, doc):
+        value = self.value(doc)
+        if not value:
+            return []
+        return [item for item in value if item is not None] if self.many else [value]
+
+    def attach(self, doc, resolved):
+        """
+        :param resolved: Dict of the target objects that could be resolved
+        :return: Whether every referenced object was resolved
+        """
+        value = self.value(doc)
+        if not value:
+            return True
+        if self.many:
+            doc[self.name] = [resolved.get(item, unresolved(item)) for item in value]
+            return all(item in resolved for item in value)
+        doc[self.name] = resolved.get(value, unresolved(value))
+        return value in resolved
+
+
+class Resource:
+    """
+    :param name: Resource name, as used for response caching
+    :param service: Service in ``DOWNSTREAM_SERVICES`` serving the resource
+    :param path: Path template of a single resource, with an ``{id}`` field
+    :param references: ``Reference`` declarations
+    :param links: ``{field: (source field, URL template)}`` attached as links
+                  instead of embedded objects
+    :param list_path: Path of the listing the resource appears in, if any
+    """
+
+    def __init__(self, name, service, path, references=(), links=None,
+                 list_path=None):
+        self.name = name
+        self.service = service
+        self.path = path
+        self.list_path = list_path
+        self.references = list(references)
+        self.links = links or {}
+
+    def reference(self, name):
+        for reference in self.references:
+            if reference.name == name:
+                return reference
+        raise KeyError(f"{self.name} has no reference {name}")
+
+    def selected(self, only=None):
+        """:param only: Names of the references wanted, or None for all"""
+        if only is None:
+            return self.references
+        return [reference for reference in self.references
+                if reference.name in only]
+
+    def embedded(self, doc):
+        """:return: ``(target, id)`` of every resolved object attached to it"""
+        pairs = []
+        for reference in self.references:
+            value = doc.get(reference.name)
+            for item in value if isinstance(value, list) else [value]:
+                if isinstance(item, dict) and "id" in item:
+                    pairs.append((reference.target, item["id"]))
+        return pairs
+
+    def wanted(self, doc, only=None):
+        """:return: ``{target: set of IDs}`` referenced by the document"""
+        wanted = {}
+        for reference in self.selected(only):
+            wanted.setdefault(reference.target, set()).update(reference.ids(doc))
+        return wanted
+
+    def attach(self, doc, resolved, only=None):
+        """
+        Attach resolved objects and links to a document in place.
+
+        :param resolved: ``{target: {id: object}}``
+        :return: The document
+        """
+        complete = True
+        for reference in self.selected(only):
+            complete &= reference.attach(doc, resolved.get(reference.target, {}))
+        for field, (source, template) in self.links.items():
+            if doc.get(source):
+                doc[field] = template.format(doc[source])
+        if not complete:
+            doc["degraded"] = True
+        return doc
+
+
+EVENT = Resource("event", "scheduling", "/events/{id}/", [
+    # Older scheduling payloads only carry organizer_profile
+    Reference("organizer", ("organizer_id", "organizer_profile")),
+    Reference("participants", "participant_ids", many=True),
+], list_path="/events/")
+
+AVAILABILITY = Resource(
+    "availability", "scheduling", "/availabilities/{id}/",
+    [Reference("participant", "participant_id")],
+    # TODO: Proper HATEOS setup here
+    links={"event": ("event_id", "http://localhost:8002/getevent/{}/")},
+)
+
+
+def merge_wanted(items, only=None):
+    """
+    :param items: Iterable of ``(resource, doc)``
+    :return: ``{target: set of IDs}`` referenced by all the documents
+    """
+    wanted = {}
+    for resource, doc in items:
+        for target, ids in resource.wanted(doc, only).items():
+            wanted.setdefault(target, set()).update(ids)
+    return wanted
+
+
+class Enricher:
+    """
+    Fetches and enriches resources on behalf of one caller.
+
+    :param auth_header: Authorization header forwarded upstream
+    """
+
+    def __init__(self, auth_header=None):
+        self.headers = {"Authorization": auth_header} if auth_header else {}
+        self.users = UserInfoClient(auth_header)
+        # target -> callable taking a list of IDs and returning the resolved
+        self.loaders = {"user": self.users.get_many}
+
+    @classmethod
+    def for_request(cls, request):
+        """Build an enricher forwarding the bearer token of a DRF request."""
+        return cls(f"Bearer {request.auth}" if request.auth else None)
+
+    def fetch_one(self, resource, resource_id):
+        """
+        :return: The resource document as returned upstream
+        :raises requests.RequestException: If it could not be retrieved
+        """
+        response = downstream.get(
+            resource.service, resource.path.format(id=resource_id),
+            headers=self.headers)
+        response.raise_for_status()
+        return downstream.decode(response, raw=True)
+
+    def fetch(self, resource, resource_ids):
+        """
+        Fetch several documents of one resource concurrently.
+
+        :return: Dict of the documents that could be retrieved
+        """
+        docs, failures = fan_out(
+            lambda resource_id: self.fetch_one(resource, resource_id),
+            resource_ids)
+        for resource_id, e in failures.items():
+            logger.warning("Error retrieving %s %s: %s", resource.name,
+                           resource_id, e)
+        return docs
+
+    def resolve(self, wanted):
+        """
+        :param wanted: ``{target: IDs}``
+        :return: ``{target: {id: object}}`` with one batched call per target
+        """
+        return {target: self.loaders[target](list(ids)) if ids else {}
+                for target, ids in wanted.items()}
+
+    def enrich(self, items, only=None):
+        """
+        Enrich documents of any mix of resources in place, resolving the
+        objects they reference together.
+
+        :param items: List of ``(resource, doc)``
+        :param only: Names of the references to resolve, or None for all
+        :return: The documents
+        """
+        resolved = self.resolve(merge_wanted(items, only))
+        return [resource.attach(doc, resolved, only) for resource, doc in items]
+
+    def get(self, resource, resource_id, only=None):
+        """
+        Fetch and enrich a single document.
+
+        :raises requests.RequestException: If it could not be retrieved
+        """
+        doc = self.fetch_one(resource, resource_id)
+        return self.enrich([(resource, doc)], only)[0]
+
+
+class AsyncEnricher:
+    """Async counterpart of ``Enricher`` for the async views."""
+
+    def __init__(self, auth_header=None):
+        self.headers = {"Authorization": auth_header} if auth_header else {}
+        self.users = AsyncUserInfoClient(auth_header)
+        self.loaders = {"user": self.users.get_many}
+
+    @classmethod
+    def for_request(cls, request):
+        return cls(f"Bearer {request.auth}" if request.auth else None)
+
+    async def fetch_one(self, resource, resource_id):
+        """
+        :raises httpx.HTTPError: If the document could not be retrieved
+        """
+        response = await async_downstream.get(
+            resource.service, resource.path.format(id=resource_id),
+            headers=self.headers)
+        response.raise_for_status()
+        return async_downstream.decode(response, raw=True)
+
+    async def resolve(self, wanted):
+        resolved = {}
+        for target, ids in wanted.items():
+            resolved[target] = await self.loaders[target](list(ids)) if ids else {}
+        return resolved
+
+    async def enrich(self, items, only=None):
+        resolved = await self.resolve(merge_wanted(items, only))
+        return [resource.attach(doc, resolved, only) for resource, doc in items]
+
+    async def get(self, resource, resource_id, only=None):
+        doc = await self.fetch_one(resource, resource_id)
+        return (await self.enrich([(resource, doc)], only))[0]
@@ -0,0 +1,230 @@
+"""
+Bounded concurrent fan-out for downstream lookups.
+
+Enrichment needs one upstream call per referenced resource. Running those
+calls one after another makes latency grow with the size of the event, so
+they are dispatched on a shared thread pool instead, with a cap on how many
+are in flight for a single request and an overall deadline.
+"""
+
+import asyncio
+import contextvars
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+
+from . import metrics
+from .resilience import remaining_budget
+
+
+DEFAULTS = {
+    # Size of the process-wide pool shared by every request
+    'POOL_SIZE': 64,
+    # Maximum number of concurrent calls issued on behalf of one request
+    'MAX_IN_FLIGHT': 16,
+    # Overall deadline (seconds) for one fan-out
+    'TIMEOUT': 10.0,
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class FanOutTimeout(Exception):
+    """Raised (as a failure value) for items that missed the deadline."""
+
+
+def fanout_setting(name):
+    return getattr(settings, 'COMPOSITE_FANOUT', {}).get(name, DEFAULTS[name])
+
+
+def fanout_timeout(timeout):
+    """The fan-out deadline, never beyond the request's own deadline."""
+    if timeout is None:
+        timeout = fanout_setting('TIMEOUT')
+    remaining = remaining_budget()
+    if remaining is not None:
+        timeout = max(min(timeout, remaining), 0)
+    return timeout
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=fanout_setting('POOL_SIZE'),
+                    thread_name_prefix='composite-fanout',
+                )
+    return _executor
+
+
+def fan_out(func, items, max_in_flight=None, timeout=None):
+    """
+    Call ``func(item)`` for every unique item concurrently.
+
+    :param func: Callable taking a single item
+    :param items: Iterable of hashable items (duplicates are dropped)
+    :param max_in_flight: Cap on concurrent calls (defaults to settings)
+    :param timeout: Overall deadline in seconds (defaults to settings)
+    :return: ``(results, failures)`` dicts keyed by item; failures hold the
+             raised exception, or ``FanOutTimeout`` for unfinished items
+    """
+    results, failures = {}, {}
+    for item, result, error in iter_fan_out(func, items, max_in_flight, timeout):
+        if error is None:
+            results[item] = result
+        else:
+            failures[item] = error
+    return results, failures
+
+
+def iter_fan_out(func, items, max_in_flight=None, timeout=None):
+    """
+    Like ``fan_out``, but yield ``(item, result, error)`` as each call
+    completes; ``error`` is None on success. Items that miss the deadline
+    are yielded last with a ``FanOutTimeout``.
+    """
+    items = list(dict.fromkeys(items))
+    if not items:
+        return
+    metrics.FANOUT_SIZE.observe(value=len(items))
+
+    # Nothing to overlap: skip the pool hand-off entirely
+    if len(items) == 1:
+        try:
+            result = func(items[0])
+        except Exception as e:
+            yield items[0], None, e
+        else:
+            yield items[0], result, None
+        return
+
+    if max_in_flight is None:
+        max_in_flight = fanout_setting('MAX_IN_FLIGHT')
+    deadline = time.monotonic() + fanout_timeout(timeout)
+
+    executor = get_executor()
+    queued = iter(items)
+    pending = {}
+
+    def submit_next():
+        for item in queued:
+            # Run in a copy of the caller's context so the request deadline
+            # applies inside the worker thread too
+            context = contextvars.copy_context()
+            pending[executor.submit(context.run, func, item)] = item
+            if len(pending) >= max_in_flight:
+                return
+
+    try:
+        submit_next()
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            done, _ = wait(pending, timeout=remaining,
+                           return_when=FIRST_COMPLETED)
+            for future in done:
+                item = pending.pop(future)
+                try:
+                    yield item, future.result(), None
+                except Exception as e:
+                    yield item, None, e
+            submit_next()
+
+        # Anything left over missed the deadline
+        for future, item in list(pending.items()):
+            future.cancel()
+            yield item, None, FanOutTimeout(f"Timed out fetching {item}")
+        pending.clear()
+        for item in queued:
+            yield item, None, FanOutTimeout(f"Timed out fetching {item}")
+    finally:
+        # The consumer went away (e.g. a closed stream): stop queued work
+        for future in pending:
+            future.cancel()
+
+
+async def async_fan_out(func, items, max_in_flight=None, timeout=None):
+    """
+    Await ``func(item)`` for every unique item concurrently on the running
+    event loop. Same contract as ``fan_out``.
+
+    :param func: Coroutine function taking a single item
+    """
+    items = list(dict.fromkeys(items))
+    results, failures = {}, {}
+    if not items:
+        return results, failures
+    metrics.FANOUT_SIZE.observe(value=len(items))
+
+    if max_in_flight is None:
+        max_in_flight = fanout_setting('MAX_IN_FLIGHT')
+    timeout = fanout_timeout(timeout)
+    semaphore = asyncio.Semaphore(max_in_flight)
+
+    async def run(item):
+        async with semaphore:
+            return await func(item)
+
+    tasks = {asyncio.ensure_future(run(item)): item for item in items}
+    done, pending = await asyncio.wait(tasks, timeout=timeout)
+    for task in done:
+        item = tasks[task]
+        if task.exception() is not None:
+            failures[item] = task.exception()
+        else:
+            results[item] = task.result()
+    for task in pending:
+        task.cancel()
+        failures[tasks[task]] = FanOutTimeout(f"Timed out fetching {tasks[task]}")
+
+    return results, failures
+
+
+async def async_iter_fan_out(func, items, max_in_flight=None, timeout=None):
+    """
+    Like ``async_fan_out``, but yield ``(item, result, error)`` as each call
+    completes. Same contract as ``iter_fan_out``.
+    """
+    items = list(dict.fromkeys(items))
+    if not items:
+        return
+    metrics.FANOUT_SIZE.observe(value=len(items))
+
+    if max_in_flight is None:
+        max_in_flight = fanout_setting('MAX_IN_FLIGHT')
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + fanout_timeout(timeout)
+    semaphore = asyncio.Semaphore(max_in_flight)
+
+    async def run(item):
+        async with semaphore:
+            return await func(item)
+
+    tasks = {asyncio.ensure_future(run(item)): item for item in items}
+    pending = set(tasks)
+    try:
+        while pending:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            done, pending = await asyncio.wait(
+                pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    yield tasks[task], None, task.exception()
+                else:
+                    yield tasks[task], task.result(), None
+
+        for task in pending:
+            task.cancel()
+            yield tasks[task], None, FanOutTimeout(f"Timed out fetching {tasks[task]}")
+    finally:
+        # The consumer went away (e.g. a closed stream): stop the lookups
+        for task in pending:
+            task.cancel()
@@ -0,0 +1,103 @@
+"""
+Sparse fieldsets for the REST enrichment endpoints.
+
+``?expand=organizer,participants`` names the references to resolve. A
+reference that is not expanded costs no upstream call; the document keeps
+just its ID field (``organizer_id``, ``participant_ids``). Without
+``expand``, everything is expanded, as before, unless ``fields`` is given,
+in which case only the references it mentions are.
+
+``?fields=id,title,participants.username`` names the fields to return.
+Dotted names select fields of an expanded object. Naming only the object
+(``participants``) keeps it whole. ``degraded`` and ``unresolved`` markers
+are always kept.
+"""
+
+
+ALWAYS_KEPT = {"id", "degraded", "unresolved"}
+
+
+def split_param(value):
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+class FieldSelection:
+    """
+    :param fields: Field names, dotted for nested fields, or None for all
+    :param expand: Reference names to resolve, or None for the default
+    """
+
+    def __init__(self, fields=None, expand=None):
+        self.fields = None
+        # top-level field -> nested fields to keep, or None for all of them
+        self.nested = {}
+        if fields is not None:
+            self.fields = set()
+            for name in fields:
+                top, _, rest = name.partition(".")
+                self.fields.add(top)
+                if rest:
+                    if self.nested.get(top, set()) is not None:
+                        self.nested.setdefault(top, set()).add(rest)
+                else:
+                    self.nested[top] = None
+        self.expand = set(expand) if expand is not None else None
+
+    @classmethod
+    def from_request(cls, request):
+        params = getattr(request, "query_params", request.GET)
+        fields = params.get("fields")
+        expand = params.get("expand")
+        return cls(
+            fields=split_param(fields) if fields is not None else None,
+            expand=split_param(expand) if expand is not None else None,
+        )
+
+    @property
+    def key(self):
+        """Canonical form of the selection, for cache keys."""
+        if self.fields is None and self.expand is None:
+            return ""
+        fields = ",".join(sorted(
+            top if nested is None else ",".join(
+                f"{top}.{name}" for name in sorted(nested))
+            for top, nested in self.nested.items()))
+        expand = ",".join(sorted(self.expand)) if self.expand is not None else "*"
+        return f"fields={fields if self.fields is not None else '*'};expand={expand}"
+
+    def expansions(self, resource):
+        """
+        :return: Names of the resource's references to resolve, or None for
+                 all of them
+        :raises ValueError: If an unknown reference is asked for
+        """
+        names = {reference.name for reference in resource.references}
+        if self.expand is not None:
+            unknown = self.expand - names
+            if unknown:
+                raise ValueError(
+                    f"Unknown expansion: {', '.join(sorted(unknown))}")
+            return self.expand
+        if self.fields is not None:
+            return names & self.fields
+        return None
+
+    def apply(self, doc):
+        """:return: A copy of the document with only the selected fields"""
+        if self.fields is None:
+            return doc
+        return {
+            name: self._prune(value, self.nested.get(name))
+            for name, value in doc.items()
+            if name in self.fields or name in ALWAYS_KEPT
+        }
+
+    def _prune(self, value, nested):
+        if nested is None:
+            return value
+        if isinstance(value, list):
+            return [self._prune(item, nested) for item in value]
+        if isinstance(value, dict):
+            return {name: item for name, item in value.items()
+                    if name in nested or name in ALWAYS_KEPT}
+        return value
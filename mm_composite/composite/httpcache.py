@@ -0,0 +1,346 @@
+"""
+HTTP cache for GET requests to the downstream services.
+
+``downstream.get`` and ``async_downstream.get`` go through it, so every
+upstream read (events, user profiles, the caller lookup in ``util.py``)
+benefits. Responses are stored with their validators in the Django cache
+``HTTP_CACHE['BACKEND']`` and reused following the upstream's own headers:
+
+* within ``Cache-Control: max-age`` (or ``Expires``) the stored body is
+  served without contacting the service;
+* past it, the request is revalidated with ``If-None-Match`` /
+  ``If-Modified-Since``; a bodiless 304 refreshes the stored entry;
+* within ``stale-while-revalidate`` the stale body is served at once and
+  revalidated in the background;
+* ``no-store`` responses, ``Vary: *`` and responses with neither validators
+  nor a freshness lifetime are not stored; ``no-cache`` ones are always
+  revalidated.
+
+Entries are keyed by URL, query parameters and a hash of the forwarded
+``Authorization`` header, so one caller's responses are never served to
+another. Each URL also has a generation number in the key; ``evict`` bumps
+it, retiring every caller's copy at once (see ``changes.py``).
+"""
+
+import asyncio
+import contextvars
+import hashlib
+import logging
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import requests
+from django.conf import settings
+from django.core.cache import caches
+from requests.structures import CaseInsensitiveDict
+
+from . import metrics
+from .fanout import get_executor
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULTS = {
+    # Django cache alias holding upstream responses, or None to disable
+    'BACKEND': None,
+    # Larger bodies are not stored
+    'MAX_ENTRY_SIZE': 1024 * 1024,
+    # Seconds a stale entry is kept around for revalidation
+    'RETAIN': 3600,
+}
+
+# Response headers kept with the body
+STORED_HEADERS = ("Content-Type", "ETag", "Last-Modified", "Cache-Control",
+                  "Expires", "Date")
+# Request headers the cache key already covers; any other Vary disables it
+KEYED_HEADERS = {"authorization", "accept", "accept-encoding"}
+
+
+def http_cache_setting(name):
+    return getattr(settings, 'HTTP_CACHE', {}).get(name, DEFAULTS[name])
+
+
+def enabled():
+    return http_cache_setting('BACKEND') is not None
+
+
+def cache_control(headers):
+    """:return: ``{directive: value or True}`` of a Cache-Control header"""
+    directives = {}
+    for part in (headers.get("Cache-Control") or "").split(","):
+        name, _, value = part.strip().partition("=")
+        if name:
+            directives[name.lower()] = value.strip('"') if value else True
+    return directives
+
+
+def seconds(value):
+    try:
+        return max(0, int(value))
+    except (TypeError, ValueError):
+        return 0
+
+
+def lifetimes(headers):
+    """
+    :return: ``(max_age, stale_while_revalidate)`` in seconds, or None if
+             the response may not be stored
+    """
+    directives = cache_control(headers)
+    vary = {name.strip().lower()
+            for name in (headers.get("Vary") or "").split(",") if name.strip()}
+    if "no-store" in directives or not vary <= KEYED_HEADERS:
+        return None
+    if "no-cache" in directives:
+        max_age = 0
+    elif "max-age" in directives:
+        max_age = seconds(directives["max-age"])
+    elif headers.get("Expires"):
+        try:
+            max_age = max(0, int(parsedate_to_datetime(headers["Expires"]).timestamp()
+                                 - time.time()))
+        except (TypeError, ValueError):
+            max_age = 0
+    else:
+        max_age = None
+    has_validators = headers.get("ETag") or headers.get("Last-Modified")
+    if max_age is None:
+        if not has_validators:
+            return None
+        max_age = 0
+    elif not max_age and not has_validators:
+        return None
+    return max_age, seconds(directives.get("stale-while-revalidate"))
+
+
+class HTTPCache:
+    """
+    :param alias: Django cache alias holding the entries
+    """
+
+    key_prefix = "composite:http"
+
+    def __init__(self, alias):
+        self.alias = alias
+        # Keys being revalidated in the background
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        # Background revalidations of the async client, kept referenced
+        self._tasks = set()
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def generation_key(self, url):
+        digest = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return f"{self.key_prefix}:generation:{digest}"
+
+    def key(self, url, kwargs, generation):
+        headers = {name.lower(): value
+                   for name, value in (kwargs.get("headers") or {}).items()}
+        params = kwargs.get("params") or {}
+        if isinstance(params, dict):
+            params = sorted(params.items())
+        variant = repr((url, generation, params,
+                        [(name, headers.get(name)) for name in sorted(KEYED_HEADERS)]))
+        digest = hashlib.sha256(variant.encode("utf-8")).hexdigest()
+        return f"{self.key_prefix}:{digest}"
+
+    def evict(self, url):
+        """Drop every caller's stored responses for ``url``, whatever the query."""
+        key = self.generation_key(url)
+        try:
+            self.cache.incr(key)
+        except ValueError:
+            # Never bumped before: any value other than the implied 0 works
+            self.cache.set(key, 1, timeout=None)
+
+    def entry(self, status, headers, content, previous=None):
+        """
+        :param previous: Entry being revalidated, whose body a 304 reuses
+        :return: Entry to store, or None if the response is not storable
+        """
+        if previous is not None:
+            headers = {**previous["headers"], **{
+                name: headers[name] for name in STORED_HEADERS if name in headers}}
+            status, content = previous["status"], previous["content"]
+        policy = lifetimes(CaseInsensitiveDict(headers))
+        if (policy is None or status != 200
+                or len(content) > http_cache_setting('MAX_ENTRY_SIZE')):
+            return None
+        max_age, stale = policy
+        return {
+            "status": status,
+            "headers": {name: headers[name] for name in STORED_HEADERS
+                        if name in headers},
+            "content": content,
+            "fresh_until": time.time() + max_age,
+            "stale_until": time.time() + max_age + stale,
+        }
+
+    def conditional_headers(self, entry):
+        headers = {}
+        if entry["headers"].get("ETag"):
+            headers["If-None-Match"] = entry["headers"]["ETag"]
+        if entry["headers"].get("Last-Modified"):
+            headers["If-Modified-Since"] = entry["headers"]["Last-Modified"]
+        return headers
+
+    def timeout(self, entry):
+        return max(1, int(entry["stale_until"] - time.time())
+                   + http_cache_setting('RETAIN'))
+
+    def store(self, key, entry):
+        if entry is None:
+            self.cache.delete(key)
+        else:
+            self.cache.set(key, entry, timeout=self.timeout(entry))
+
+    async def astore(self, key, entry):
+        if entry is None:
+            await self.cache.adelete(key)
+        else:
+            await self.cache.aset(key, entry, timeout=self.timeout(entry))
+
+    def _claim_refresh(self, key):
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            return True
+
+    def _release_refresh(self, key):
+        with self._lock:
+            self._refreshing.discard(key)
+
+    def with_validators(self, kwargs, entry):
+        """:return: Request arguments making the request conditional"""
+        if entry is None:
+            return kwargs
+        return {**kwargs, "headers": {
+            **(kwargs.get("headers") or {}), **self.conditional_headers(entry)}}
+
+    def revalidated(self, response, entry):
+        """:return: The entry refreshed by a 304 response"""
+        return self.entry(304, response.headers, b"", previous=entry) or {
+            **entry, "fresh_until": time.time()}
+
+    def get(self, service, url, kwargs, send):
+        """
+        Serve a GET from the cache where HTTP allows it.
+
+        :param url: Absolute URL requested
+        :param send: Callable ``(**kwargs)`` making the actual request
+        :return: ``requests.Response``
+        """
+        key = self.key(url, kwargs, self.cache.get(self.generation_key(url), 0))
+        entry = self.cache.get(key)
+        now = time.time()
+        if entry is not None and now < entry["fresh_until"]:
+            metrics.HTTP_CACHE.inc(service, "fresh")
+            return requests_response(entry, url)
+        if entry is not None and now < entry["stale_until"]:
+            if self._claim_refresh(key):
+                # In a copy of the caller's context, as ``fan_out`` does
+                context = contextvars.copy_context()
+                get_executor().submit(context.run, self._refresh, service, url,
+                                      key, entry, kwargs, send)
+            metrics.HTTP_CACHE.inc(service, "stale")
+            return requests_response(entry, url)
+        return self._revalidate(service, url, key, entry, kwargs, send)
+
+    def _revalidate(self, service, url, key, entry, kwargs, send):
+        response = send(**self.with_validators(kwargs, entry))
+        if entry is not None and response.status_code == 304:
+            metrics.HTTP_CACHE.inc(service, "revalidated")
+            entry = self.revalidated(response, entry)
+            self.store(key, entry)
+            return requests_response(entry, url)
+        metrics.HTTP_CACHE.inc(service, "miss")
+        if response.status_code == 200:
+            self.store(key, self.entry(200, response.headers, response.content))
+        return response
+
+    def _refresh(self, service, url, key, entry, kwargs, send):
+        try:
+            self._revalidate(service, url, key, entry, kwargs, send)
+        except Exception:
+            # Nobody waits on the result: an error would otherwise vanish
+            logger.exception("Background revalidation of %s failed", url)
+        finally:
+            self._release_refresh(key)
+
+    async def aget(self, service, url, kwargs, send):
+        """Async ``get`` for ``async_downstream``; returns ``httpx.Response``."""
+        generation = await self.cache.aget(self.generation_key(url), 0)
+        key = self.key(url, kwargs, generation)
+        entry = await self.cache.aget(key)
+        now = time.time()
+        if entry is not None and now < entry["fresh_until"]:
+            metrics.HTTP_CACHE.inc(service, "fresh")
+            return httpx_response(entry, url)
+        if entry is not None and now < entry["stale_until"]:
+            if self._claim_refresh(key):
+                task = asyncio.create_task(
+                    self._arefresh(service, url, key, entry, kwargs, send))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+            metrics.HTTP_CACHE.inc(service, "stale")
+            return httpx_response(entry, url)
+        return await self._arevalidate(service, url, key, entry, kwargs, send)
+
+    async def _arevalidate(self, service, url, key, entry, kwargs, send):
+        response = await send(**self.with_validators(kwargs, entry))
+        if entry is not None and response.status_code == 304:
+            metrics.HTTP_CACHE.inc(service, "revalidated")
+            entry = self.revalidated(response, entry)
+            await self.astore(key, entry)
+            return httpx_response(entry, url)
+        metrics.HTTP_CACHE.inc(service, "miss")
+        if response.status_code == 200:
+            await self.astore(
+                key, self.entry(200, response.headers, response.content))
+        return response
+
+    async def _arefresh(self, service, url, key, entry, kwargs, send):
+        try:
+            await self._arevalidate(service, url, key, entry, kwargs, send)
+        except Exception:
+            logger.exception("Background revalidation of %s failed", url)
+        finally:
+            self._release_refresh(key)
+
+
+def requests_response(entry, url):
+    """Rebuild a ``requests.Response`` from a cache entry."""
+    response = requests.Response()
+    response.status_code = entry["status"]
+    response.reason = "OK"
+    response.url = url
+    response.headers = CaseInsensitiveDict(entry["headers"])
+    response._content = entry["content"]
+    response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+    return response
+
+
+def httpx_response(entry, url):
+    return httpx.Response(entry["status"], headers=entry["headers"],
+                          content=entry["content"],
+                          request=httpx.Request("GET", url))
+
+
+_http_cache = None
+
+
+def get_http_cache():
+    global _http_cache
+    if _http_cache is None:
+        _http_cache = HTTPCache(http_cache_setting('BACKEND'))
+    return _http_cache
@@ -0,0 +1,282 @@
+"""
+``Idempotency-Key`` support for event creation.
+
+A client that times out on ``postevent/`` and retries would otherwise create
+the event twice and invite everybody twice. When a request carries an
+``Idempotency-Key`` header, its outcome is recorded in the
+``IdempotencyRecord`` table, per caller:
+
+* the first request claims the key and runs; its response is stored,
+  unless it asks the client to retry (a 5xx, 408, 409 or 429), in which
+  case the key is left free for that retry;
+* a duplicate arriving while it runs waits for it, up to ``WAIT_TIMEOUT``
+  and the request's deadline, then gets a 409;
+* later duplicates get the stored response replayed, marked with
+  ``Idempotent-Replayed: true``, without any upstream work;
+* reusing a key with a different body is a 422.
+
+Records are kept for ``TTL`` seconds. An attempt that has not completed
+after ``LOCK_TIMEOUT`` seconds (its worker died) can be taken over.
+"""
+
+import hashlib
+import logging
+import time
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, OperationalError, transaction
+from django.utils import timezone
+
+from . import jsoncodec
+from .models import IdempotencyRecord
+from .resilience import remaining_budget
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULTS = {
+    'HEADER': 'Idempotency-Key',
+    # Seconds a completed outcome is replayed for
+    'TTL': 24 * 3600,
+    # Seconds before an unfinished attempt may be taken over
+    'LOCK_TIMEOUT': 60,
+    # Longest a duplicate waits for the original, within the deadline
+    'WAIT_TIMEOUT': 10.0,
+    'POLL_INTERVAL': 0.1,
+    # Seconds between purges of expired records
+    'PURGE_INTERVAL': 300,
+}
+
+REPLAYED_HEADER = 'Idempotent-Replayed'
+
+# Below 500, the statuses telling the client to try again
+RETRYABLE_STATUSES = {408, 409, 429}
+
+_last_purge = 0.0
+
+
+def idempotency_setting(name):
+    return getattr(settings, 'IDEMPOTENCY', {}).get(name, DEFAULTS[name])
+
+
+class KeyReused(Exception):
+    """The key was first used for a different request."""
+
+
+class StillInProgress(Exception):
+    """The original request did not finish while the duplicate waited."""
+
+
+def fingerprint(request):
+    digest = hashlib.sha256()
+    for part in (request.method, request.path):
+        digest.update(part.encode("utf-8") + b"\0")
+    digest.update(request.body)
+    return digest.hexdigest()
+
+
+def purge_expired():
+    """Delete expired records, at most every ``PURGE_INTERVAL`` seconds."""
+    global _last_purge
+    if time.monotonic() - _last_purge < idempotency_setting('PURGE_INTERVAL'):
+        return
+    _last_purge = time.monotonic()
+    cutoff = timezone.now() - timedelta(seconds=idempotency_setting('TTL'))
+    try:
+        IdempotencyRecord.objects.filter(created_at__lt=cutoff).delete()
+    except OperationalError as e:
+        # A locked database; the next purge gets them
+        logger.warning("Could not purge idempotency records: %s", e)
+
+
+def try_claim(scope, key, request_hash):
+    """
+    :return: ``(record, owned)`` as for ``claim``, or None while another
+             request holds the key
+    :raises KeyReused: If the key belongs to a different request
+    """
+    while True:
+        now = timezone.now()
+        try:
+            with transaction.atomic():
+                return IdempotencyRecord.objects.create(
+                    scope=scope, key=key, fingerprint=request_hash,
+                    started_at=now), True
+        except IntegrityError:
+            pass
+
+        record = IdempotencyRecord.objects.filter(scope=scope, key=key).first()
+        if record is None:
+            # Released (or purged) in the meantime: try again
+            continue
+        if record.fingerprint != request_hash:
+            raise KeyReused(key)
+        if record.created_at < now - timedelta(seconds=idempotency_setting('TTL')):
+            record.delete()
+            continue
+        if record.state == IdempotencyRecord.COMPLETED:
+            return record, False
+
+        stale = now - timedelta(seconds=idempotency_setting('LOCK_TIMEOUT'))
+        if record.started_at < stale and IdempotencyRecord.objects.filter(
+                pk=record.pk, state=IdempotencyRecord.IN_PROGRESS,
+                started_at=record.started_at).update(started_at=now):
+            logger.warning("Taking over abandoned request for key %s", key)
+            record.started_at = now
+            return record, True
+        return None
+
+
+def claim(scope, key, request_hash):
+    """
+    Claim a key, or wait for whoever holds it.
+
+    :return: ``(record, owned)``; an owned record must be completed or
+             released, any other one is completed
+    :raises KeyReused: If the key belongs to a different request
+    :raises StillInProgress: If the holder did not finish in time
+    """
+    purge_expired()
+    budget = remaining_budget()
+    wait = idempotency_setting('WAIT_TIMEOUT')
+    deadline = time.monotonic() + (wait if budget is None else min(wait, budget))
+    while True:
+        try:
+            claimed = try_claim(scope, key, request_hash)
+        except OperationalError:
+            # SQLite fails a write racing another one with "database is
+            # locked" rather than an IntegrityError: poll as for a held key
+            if time.monotonic() >= deadline:
+                raise
+            claimed = None
+        if claimed is not None:
+            return claimed
+        if time.monotonic() >= deadline:
+            raise StillInProgress(key)
+        time.sleep(idempotency_setting('POLL_INTERVAL'))
+
+
+def complete(record, status_code, body):
+    record.state = IdempotencyRecord.COMPLETED
+    record.status_code = status_code
+    record.response = body
+    record.save(update_fields=["state", "status_code", "response"])
+
+
+def release(record):
+    """Give the key up so the request can be retried."""
+    IdempotencyRecord.objects.filter(pk=record.pk).delete()
+
+
+def response_body(response):
+    data = getattr(response, "data", None)
+    if data is not None:
+        return data
+    return jsoncodec.loads(response.content) if response.content else None
+
+
+def finish(record, response):
+    """
+    Record the handler's outcome. Writes refused by a locked database are
+    retried for up to ``WAIT_TIMEOUT``; if they still fail, the key is left
+    to be taken over after ``LOCK_TIMEOUT`` rather than failing a request
+    whose work is done.
+    """
+    deadline = time.monotonic() + idempotency_setting('WAIT_TIMEOUT')
+    while True:
+        try:
+            if (response.status_code >= 500
+                    or response.status_code in RETRYABLE_STATUSES):
+                release(record)
+            else:
+                complete(record, response.status_code, response_body(response))
+            return
+        except OperationalError as e:
+            if time.monotonic() >= deadline:
+                logger.error("Could not record the outcome for idempotency "
+                             "key %s: %s", record.key, e)
+                return
+        time.sleep(idempotency_setting('POLL_INTERVAL'))
+
+
+def replay(record, respond):
+    response = respond(record.response, record.status_code)
+    response[REPLAYED_HEADER] = "true"
+    return response
+
+
+def key_error(key, respond):
+    """:return: Error response for an unusable key, if it is one"""
+    if len(key) > IdempotencyRecord._meta.get_field("key").max_length:
+        return respond({"detail": "Idempotency key is too long"}, 400)
+    return None
+
+
+def idempotent(request, handler, respond):
+    """
+    Run ``handler`` at most once per idempotency key.
+
+    :param handler: Callable returning the response
+    :param respond: Callable ``(body, status)`` building a response
+    :return: The handler's response, the replayed one, or an error response
+    """
+    key = request.headers.get(idempotency_setting('HEADER'))
+    if not key:
+        return handler()
+    error = key_error(key, respond)
+    if error is not None:
+        return error
+
+    scope = f"user={getattr(request.user, 'id', None)}"
+    try:
+        record, owned = claim(scope, key, fingerprint(request))
+    except KeyReused:
+        return respond({"detail": "Idempotency key was already used for a "
+                                  "different request"}, 422)
+    except StillInProgress:
+        return respond({"detail": "A request with this idempotency key is "
+                                  "still in progress"}, 409)
+    if not owned:
+        return replay(record, respond)
+
+    try:
+        response = handler()
+    except BaseException:
+        release(record)
+        raise
+    finish(record, response)
+    return response
+
+
+async def aidempotent(request, handler, respond):
+    """``idempotent`` for the async views; ``handler`` is a coroutine function."""
+    key = request.headers.get(idempotency_setting('HEADER'))
+    if not key:
+        return await handler()
+    error = key_error(key, respond)
+    if error is not None:
+        return error
+
+    scope = f"user={getattr(request.user, 'id', None)}"
+    try:
+        # Waiting for the original must not hold up the shared sync thread
+        record, owned = await sync_to_async(claim, thread_sensitive=False)(
+            scope, key, fingerprint(request))
+    except KeyReused:
+        return respond({"detail": "Idempotency key was already used for a "
+                                  "different request"}, 422)
+    except StillInProgress:
+        return respond({"detail": "A request with this idempotency key is "
+                                  "still in progress"}, 409)
+    if not owned:
+        return replay(record, respond)
+
+    try:
+        response = await handler()
+    except BaseException:
+        await sync_to_async(release)(record)
+        raise
+    await sync_to_async(finish, thread_sensitive=False)(record, response)
+    return response
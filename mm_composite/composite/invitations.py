@@ -0,0 +1,122 @@
+"""
+Invitation emails for newly created events.
+
+``EventCreateView`` only queues the work (see ``tasks.py``); the participant
+lookups and the batched deliveries to the notifications service (see
+``notifications.py``) run on a background worker, so the 201 goes back to
+the client regardless of how many participants there are. Each event's
+invitation is rendered once and only personalised per participant (see
+``emails.py``).
+
+The worker looks participants up with ``INVITATIONS['SERVICE_TOKEN']`` if
+set, else with the caller's token. Jobs in a durable queue (and its dead
+letters) outlive the request, so they never carry the caller's token: a
+durable queue requires a service token (system check composite.E002).
+"""
+
+import logging
+
+from django.conf import settings
+
+from . import tasks
+from .emails import get_renderer
+from .notifications import get_dispatcher
+from .users import UserInfoClient
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULTS = {
+    # Bearer token the background worker looks participants up with
+    'SERVICE_TOKEN': None,
+}
+
+SEND_EVENT_EMAILS = 'composite.invitations.send_event_emails'
+
+
+def service_token():
+    return getattr(settings, 'INVITATIONS', {}).get(
+        'SERVICE_TOKEN', DEFAULTS['SERVICE_TOKEN'])
+
+
+def dispatch_event_emails(event, auth_token):
+    """
+    Queue email notifications to all participants about a newly created event.
+    If the queue is full the emails are sent inline instead.
+
+    :param event: Dict containing event details
+    :param auth_token: Caller's token, used without a service token
+    """
+    auth_header = f"Bearer {auth_token}" if auth_token else None
+    payload = {"event": event}
+    if not service_token() and not tasks.get_queue().durable:
+        # Only ever held in this process's memory
+        payload["auth_header"] = auth_header
+    try:
+        tasks.enqueue(SEND_EVENT_EMAILS, payload)
+    except tasks.QueueFull as e:
+        logger.warning("%s; sending invitations inline", e)
+        try:
+            send_event_emails(payload, auth_header=auth_header)
+        except tasks.Retry as e:
+            logger.warning("Failed to send some invitations: %s", e)
+
+
+def service_auth_header():
+    token = service_token()
+    return f"Bearer {token}" if token else None
+
+
+def send_event_emails(payload, auth_header=None):
+    """
+    Background task: send the invitation to every participant.
+
+    Participants whose lookup or delivery failed are retried on their own,
+    so nobody already notified gets a second email.
+
+    :param payload: Dict with ``event``, optionally the ``participant_ids``
+                    still to notify and the caller's ``auth_header``
+    :param auth_header: Authorization for the participant lookups; defaults
+                        to the service token, then the payload's
+    """
+    event = payload["event"]
+    participant_ids = payload.get(
+        "participant_ids", event.get('participant_ids', []))
+    auth_header = (auth_header or service_auth_header()
+                   or payload.get("auth_header"))
+    participants = UserInfoClient(auth_header).get_many(participant_ids)
+
+    email_for = get_renderer().for_event(event)
+    failed, emails = [], {}
+    for participant_id in participant_ids:
+        participant = participants.get(participant_id)
+        if participant is None:
+            failed.append(participant_id)
+            continue
+        emails[participant_id] = email_for(participant)
+
+    # Delivered in batches shared with other events' invitations
+    results = get_dispatcher().send_many(emails)
+    for participant_id, error in results.items():
+        if error is None:
+            logger.debug("Email sent to participant %s", participant_id)
+        else:
+            logger.warning("Failed to send email to participant %s: %s",
+                           participant_id, error)
+            failed.append(participant_id)
+
+    if failed:
+        raise tasks.Retry({**payload, "participant_ids": failed},
+                          f"{len(failed)} invitation(s) not delivered")
+
+
+def construct_event_email_body(event, participant):
+    """
+    Construct a personalized email body for the event invitation.
+
+    :param event: Dict containing event details
+    :param participant: Dict containing participant details
+    :return: Formatted email body
+    """
+    return get_renderer().for_event(event)(participant)["body"]
+
@@ -0,0 +1,273 @@
+"""
+JSON encoding and decoding for the composite service.
+
+An aggregate is decoded from the scheduling service's response, gets the
+users attached, and is encoded again for the client; for large events the
+two passes through the standard ``json`` module dominate the request's CPU
+time. Every upstream body, request body and response body therefore goes
+through the codec selected by ``JSON_CODEC['BACKEND']``: orjson or msgspec
+when installed, the standard library otherwise. ``JSONRenderer`` and
+``JSONParser`` plug it into DRF; the async views use ``encode`` directly.
+
+With ``RAW_PASSTHROUGH`` enabled, event and availability documents are
+decoded into ``RawDocument``s that keep the upstream bytes. As long as only
+new fields are added to them (which is all enrichment does), encoding one
+re-emits the upstream bytes as they are and encodes just the added fields.
+It is off by default: the upstream's own formatting (e.g. of floats and
+non-ASCII text) then reaches clients, and mutations inside nested upstream
+values are not detected.
+"""
+
+import json
+import logging
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework import parsers, renderers
+from rest_framework.exceptions import ParseError
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULTS = {
+    # 'auto' (orjson, then msgspec, then the standard library), 'orjson',
+    # 'msgspec' or 'json'
+    'BACKEND': 'auto',
+    # Re-emit untouched upstream documents instead of re-encoding them
+    'RAW_PASSTHROUGH': False,
+}
+
+
+def json_codec_setting(name):
+    return getattr(settings, 'JSON_CODEC', {}).get(name, DEFAULTS[name])
+
+
+def default(obj):
+    """Encode what the fast codecs do not support natively, as DRF does."""
+    if isinstance(obj, dict):
+        return dict(obj)
+    return JSONEncoder().default(obj)
+
+
+class StdlibCodec:
+    name = "json"
+
+    def dumps(self, data, sort_keys=False):
+        # Same output as DRF's own renderer
+        return json.dumps(data, cls=JSONEncoder, ensure_ascii=False,
+                          allow_nan=False, separators=(",", ":"),
+                          sort_keys=sort_keys).encode("utf-8")
+
+    def loads(self, content):
+        return json.loads(content)
+
+
+class OrjsonCodec:
+    name = "orjson"
+
+    def __init__(self):
+        # Datetimes are left to DRF's encoder so the output does not change
+        self.options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+    def dumps(self, data, sort_keys=False):
+        options = self.options | orjson.OPT_SORT_KEYS if sort_keys else self.options
+        return orjson.dumps(data, default=default, option=options)
+
+    def loads(self, content):
+        return orjson.loads(content)
+
+
+class MsgspecCodec:
+    name = "msgspec"
+
+    def __init__(self):
+        self.encoder = msgspec.json.Encoder(enc_hook=default)
+        self.sorted_encoder = msgspec.json.Encoder(enc_hook=default, order="sorted")
+        self.decoder = msgspec.json.Decoder()
+
+    def dumps(self, data, sort_keys=False):
+        return (self.sorted_encoder if sort_keys else self.encoder).encode(data)
+
+    def loads(self, content):
+        if isinstance(content, str):
+            content = content.encode("utf-8")
+        try:
+            return self.decoder.decode(content)
+        except msgspec.DecodeError as e:
+            raise ValueError(str(e)) from e
+
+
+CODECS = {
+    "orjson": (lambda: orjson, OrjsonCodec),
+    "msgspec": (lambda: msgspec, MsgspecCodec),
+    "json": (lambda: json, StdlibCodec),
+}
+
+
+def build_codec(backend):
+    if backend == "auto":
+        for module, codec_class in CODECS.values():
+            if module() is not None:
+                return codec_class()
+    try:
+        module, codec_class = CODECS[backend]
+    except KeyError:
+        raise ImproperlyConfigured(f"Unknown JSON codec: {backend}")
+    if module() is None:
+        raise ImproperlyConfigured(
+            f"The {backend} JSON codec requires {backend} to be installed")
+    return codec_class()
+
+
+_codec = None
+
+
+def get_codec():
+    global _codec
+    if _codec is None:
+        _codec = build_codec(json_codec_setting('BACKEND'))
+        logger.debug("Using the %s JSON codec", _codec.name)
+    return _codec
+
+
+class RawDocument(dict):
+    """
+    A decoded upstream JSON object that keeps its encoded form.
+
+    Assigning a field the upstream sent, or removing one, marks the document
+    as modified, after which it is encoded like any other dict.
+
+    :param raw: The encoded object, as received
+    :param upstream: Names of the fields in ``raw``
+    """
+
+    def __init__(self, data, raw, upstream=None):
+        super().__init__(data)
+        self.raw = raw
+        self.upstream = frozenset(data) if upstream is None else upstream
+        self.intact = True
+
+    def __setitem__(self, key, value):
+        if key in self.upstream:
+            self.intact = False
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key):
+        self.intact = False
+        super().__delitem__(key)
+
+    def pop(self, *args):
+        self.intact = False
+        return super().pop(*args)
+
+    def popitem(self):
+        self.intact = False
+        return super().popitem()
+
+    def clear(self):
+        self.intact = False
+        super().clear()
+
+    def update(self, *args, **kwargs):
+        self.intact = False
+        super().update(*args, **kwargs)
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def __ior__(self, other):
+        self.intact = False
+        return super().__ior__(other)
+
+    def __reduce__(self):
+        # Cached copies stay raw only while they still match the bytes
+        if not self.intact:
+            return dict, (dict(self),)
+        return RawDocument, (dict(self), self.raw, self.upstream)
+
+    def encode(self, codec):
+        """:return: The upstream bytes with the added fields spliced in"""
+        added = [codec.dumps(str(key)) + b":" + codec.dumps(value)
+                 for key, value in self.items() if key not in self.upstream]
+        if not added:
+            return self.raw
+        head = self.raw.rstrip()[:-1].rstrip()
+        separator = b"," if self.upstream else b""
+        return head + separator + b",".join(added) + b"}"
+
+
+def dumps(data, sort_keys=False):
+    """:return: ``data`` encoded as UTF-8 JSON bytes"""
+    return get_codec().dumps(data, sort_keys=sort_keys)
+
+
+def loads(content):
+    """
+    :param content: JSON as bytes or str
+    :raises ValueError: If it is not valid JSON
+    """
+    return get_codec().loads(content)
+
+
+def encode(data):
+    """``dumps`` for response bodies, re-emitting intact ``RawDocument``s."""
+    codec = get_codec()
+    if isinstance(data, RawDocument) and data.intact:
+        return data.encode(codec)
+    return codec.dumps(data)
+
+
+def decode(content, raw=False):
+    """
+    :param raw: Return objects as ``RawDocument`` when ``RAW_PASSTHROUGH``
+                is enabled
+    :raises ValueError: If the content is not valid JSON
+    """
+    data = get_codec().loads(content)
+    if raw and isinstance(data, dict) and json_codec_setting('RAW_PASSTHROUGH'):
+        if isinstance(content, str):
+            content = content.encode("utf-8")
+        return RawDocument(data, content)
+    return data
+
+
+class JSONRenderer(renderers.JSONRenderer):
+    """
+    DRF renderer using the configured codec. Indented output (requested with
+    an ``indent`` media type parameter, or by the browsable API) is still
+    produced by DRF's own renderer.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        return encode(data)
+
+
+class JSONParser(parsers.JSONParser):
+    """DRF parser using the configured codec for UTF-8 request bodies."""
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        if encoding.lower().replace("_", "-") not in ("utf-8", "utf8"):
+            return super().parse(stream, media_type, parser_context)
+        try:
+            return loads(stream.read())
+        except ValueError as exc:
+            raise ParseError(f"JSON parse error - {exc}")
@@ -0,0 +1,302 @@
+"""
+Local verification of access tokens.
+
+simplejwt already checks a token's signature locally against the key in
+``SIMPLE_JWT``. With ``JWKS_PATH`` set, the verifying keys are instead taken
+from the auth service's JWKS document. It is fetched through the pooled
+downstream client and cached, and fetched again when it expires or when a
+token names a key ID it does not contain, which is how key rotation shows up.
+A token is only accepted with the algorithm of the key it names (the key's
+``alg``, or the default for its type), optionally narrowed to
+``ALGORITHMS``. RSA and EC keys require ``cryptography``.
+
+In ``local`` mode the caller is built from the token claims, without asking
+the user service who the token belongs to. The remote lookup still happens
+when a claim is missing, or when the token is on the revocation list
+published by the auth service (refreshed in the background, so checking it
+never blocks a request).
+"""
+
+import logging
+import threading
+import time
+
+import jwt
+import requests
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from jwt.algorithms import has_crypto
+from rest_framework_simplejwt.backends import TokenBackend
+from rest_framework_simplejwt.exceptions import (
+    TokenBackendError, TokenBackendExpiredToken)
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import downstream
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULTS = {
+    # 'remote': ask the user service who the token belongs to (cached);
+    # 'local': trust the signed claims
+    'MODE': 'remote',
+    # Service publishing the JWKS document and revocation list
+    'AUTH_SERVICE': 'users',
+    # Path of the JWKS document; None verifies with SIMPLE_JWT's key
+    'JWKS_PATH': None,
+    # Seconds a fetched JWKS document is used before it is fetched again
+    'JWKS_TTL': 3600,
+    # Minimum seconds between fetches triggered by unknown key IDs
+    'JWKS_MIN_REFRESH_INTERVAL': 30,
+    # Algorithms JWKS-verified tokens may use, e.g. ['RS256', 'ES256'];
+    # None accepts the algorithm of whichever key the token names
+    'ALGORITHMS': None,
+    # User fields -> token claims they are read from in local mode
+    'CLAIMS': {'id': 'user_id', 'username': 'username', 'email': 'email'},
+    # Path of the list of revoked token IDs; None disables the check
+    'REVOCATION_PATH': None,
+    # Seconds between revocation list refreshes
+    'REVOCATION_REFRESH': 30,
+}
+
+
+def jwt_setting(name):
+    return getattr(settings, 'JWT_VERIFICATION', {}).get(name, DEFAULTS[name])
+
+
+class KeySet:
+    """
+    The auth service's signing keys, by key ID.
+
+    :param service: Name of the service in ``DOWNSTREAM_SERVICES``
+    :param path: Path of the JWKS document on that service
+    """
+
+    def __init__(self, service, path, ttl, min_refresh_interval):
+        self.service = service
+        self.path = path
+        self.ttl = ttl
+        self.min_refresh_interval = min_refresh_interval
+        self._keys = {}
+        self._fetched_at = None
+        self._lock = threading.Lock()
+
+    def verifying_key(self, token):
+        """
+        :param token: Encoded token
+        :return: ``jwt.PyJWK`` to verify the token's signature with
+        :raises TokenBackendError: If no key matches the token
+        """
+        try:
+            kid = jwt.get_unverified_header(token).get("kid")
+        except jwt.InvalidTokenError as e:
+            raise TokenBackendError("Token is invalid") from e
+
+        if self._stale(self.ttl):
+            self.refresh()
+        key = self._lookup(kid)
+        # An unknown key ID usually means the keys were rotated
+        if key is None and self._stale(self.min_refresh_interval):
+            self.refresh()
+            key = self._lookup(kid)
+        if key is None:
+            raise TokenBackendError("Token is signed with an unknown key")
+        return key
+
+    def _lookup(self, kid):
+        keys = self._keys
+        if kid is None and len(keys) == 1:
+            return next(iter(keys.values()))
+        return keys.get(kid)
+
+    def _stale(self, age):
+        fetched_at = self._fetched_at
+        return fetched_at is None or time.monotonic() - fetched_at >= age
+
+    def refresh(self):
+        with self._lock:
+            # Another thread may have refreshed while we waited
+            if not self._stale(self.min_refresh_interval):
+                return
+            try:
+                response = downstream.get(self.service, self.path)
+                response.raise_for_status()
+                document = downstream.decode(response)
+                check_crypto(document)
+                key_set = jwt.PyJWKSet.from_dict(document)
+            except (requests.RequestException, ValueError,
+                    jwt.PyJWKSetError) as e:
+                # Keep verifying with the keys we have
+                logger.warning("Could not refresh JWKS: %s", e)
+                self._fetched_at = time.monotonic()
+                return
+            self._keys = {key.key_id: key for key in key_set.keys}
+            self._fetched_at = time.monotonic()
+
+
+def check_crypto(document):
+    """
+    :raises ImproperlyConfigured: If the JWKS document holds public keys
+                                  and cryptography is not installed
+    """
+    keys = document.get("keys") if isinstance(document, dict) else None
+    if not has_crypto and any(isinstance(key, dict) and key.get("kty") != "oct"
+                              for key in keys or ()):
+        raise ImproperlyConfigured(
+            "Verifying tokens with RSA or EC keys from a JWKS document "
+            "requires cryptography to be installed")
+
+
+class JWKSTokenBackend(TokenBackend):
+    """
+    simplejwt token backend verifying signatures with the shared KeySet.
+    Unlike simplejwt's, it takes the accepted algorithm from the key rather
+    than from ``SIMPLE_JWT['ALGORITHM']``.
+    """
+
+    def get_verifying_key(self, token):
+        return get_key_set().verifying_key(token).key
+
+    def decode(self, token, verify=True):
+        key = get_key_set().verifying_key(token)
+        allowed = jwt_setting('ALGORITHMS')
+        if allowed is not None and key.algorithm_name not in allowed:
+            raise TokenBackendError("Token is signed with a disallowed algorithm")
+        try:
+            return jwt.decode(
+                token, key.key,
+                algorithms=[key.algorithm_name],
+                audience=self.audience,
+                issuer=self.issuer,
+                leeway=self.get_leeway(),
+                options={
+                    "verify_aud": self.audience is not None,
+                    "verify_signature": verify,
+                },
+            )
+        except jwt.ExpiredSignatureError as e:
+            raise TokenBackendExpiredToken("Token is expired") from e
+        except jwt.InvalidTokenError as e:
+            raise TokenBackendError("Token is invalid") from e
+
+
+class JWKSAccessToken(AccessToken):
+    def get_token_backend(self):
+        return get_token_backend()
+
+    def __str__(self):
+        # Forwarded downstream as-is: we hold no key to re-sign it with
+        token = self.token
+        return token.decode("utf-8") if isinstance(token, bytes) else token
+
+
+class RevocationList:
+    """
+    IDs (``jti``) of revoked tokens, refreshed from the auth service by a
+    background thread. Tokens can also be revoked locally, e.g. on a
+    notification from the auth service.
+    """
+
+    def __init__(self, service, path, interval):
+        self.service = service
+        self.path = path
+        self.interval = interval
+        self._remote = frozenset()
+        self._local = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is None and self.path:
+                self._thread = threading.Thread(
+                    target=self._run, name="jwt-revocations", daemon=True)
+                self._thread.start()
+
+    def contains(self, token):
+        jti = token.get(api_settings.JTI_CLAIM)
+        return jti is not None and (jti in self._remote or jti in self._local)
+
+    def revoke(self, jti):
+        with self._lock:
+            self._local.add(jti)
+
+    def refresh(self):
+        try:
+            response = downstream.get(self.service, self.path)
+            response.raise_for_status()
+            data = downstream.decode(response)
+        except (requests.RequestException, ValueError) as e:
+            logger.warning("Could not refresh the revocation list: %s", e)
+            return
+        if isinstance(data, dict):
+            data = data.get("revoked", [])
+        self._remote = frozenset(data)
+
+    def _run(self):
+        while True:
+            self.refresh()
+            time.sleep(self.interval)
+
+
+def claims_user_info(token):
+    """
+    Build the user info the user service would return from the token claims.
+
+    :param token: Validated simplejwt token
+    :return: User info dict, or None if a claim is missing
+    """
+    user_info = {}
+    for field, claim in jwt_setting('CLAIMS').items():
+        value = token.get(claim)
+        if value is None:
+            return None
+        user_info[field] = value
+    # The user service returns numeric IDs; simplejwt stores them as strings
+    if isinstance(user_info.get("id"), str) and user_info["id"].isdigit():
+        user_info["id"] = int(user_info["id"])
+    return user_info
+
+
+_key_set = None
+_token_backend = None
+_revocation_list = None
+_lock = threading.Lock()
+
+
+def get_key_set():
+    global _key_set
+    if _key_set is None:
+        with _lock:
+            if _key_set is None:
+                _key_set = KeySet(
+                    jwt_setting('AUTH_SERVICE'), jwt_setting('JWKS_PATH'),
+                    jwt_setting('JWKS_TTL'),
+                    jwt_setting('JWKS_MIN_REFRESH_INTERVAL'))
+    return _key_set
+
+
+def get_token_backend():
+    global _token_backend
+    if _token_backend is None:
+        # The algorithm is only used for encoding, which this backend never does
+        _token_backend = JWKSTokenBackend(
+            api_settings.ALGORITHM,
+            audience=api_settings.AUDIENCE,
+            issuer=api_settings.ISSUER,
+            leeway=api_settings.LEEWAY,
+        )
+    return _token_backend
+
+
+def get_revocation_list():
+    global _revocation_list
+    if _revocation_list is None:
+        with _lock:
+            if _revocation_list is None:
+                _revocation_list = RevocationList(
+                    jwt_setting('AUTH_SERVICE'), jwt_setting('REVOCATION_PATH'),
+                    jwt_setting('REVOCATION_REFRESH'))
+                _revocation_list.start()
+    return _revocation_list
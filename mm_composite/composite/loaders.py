@@ -0,0 +1,79 @@
+"""
+Per-request batching loaders for the GraphQL schema.
+
+A loader collects the keys a request is going to need and fetches them in a
+single batch the first time one of them is actually read. Results are kept
+for the rest of the request, so every key is fetched at most once however
+many times it is referenced.
+
+graphql-core resolves a synchronous query depth-first, so the schema queues
+keys for the whole operation up front (see ``schema.plan_operation``) before
+the first value is read.
+"""
+
+from .enrichment import EVENT, Enricher
+
+
+class DataLoader:
+    """
+    :param batch_load_fn: Callable taking a list of keys and returning a dict
+                          of the keys it could resolve
+    """
+
+    def __init__(self, batch_load_fn):
+        self.batch_load_fn = batch_load_fn
+        self._results = {}
+        self._queued = {}
+        self.batches = 0
+
+    def prefetch(self, keys):
+        """Queue keys for the next batch without fetching anything yet."""
+        for key in keys:
+            if key is not None and key not in self._results:
+                self._queued[key] = None
+
+    def load(self, key):
+        """
+        Return the value for a key, fetching it together with every queued
+        key if it is not known yet.
+
+        :return: The value, or None if the key could not be resolved
+        """
+        if key is None:
+            return None
+        if key not in self._results:
+            self._queued[key] = None
+            self.dispatch()
+        return self._results.get(key)
+
+    def load_many(self, keys):
+        """:return: Dict of the keys that could be resolved"""
+        self.prefetch(keys)
+        if any(key not in self._results for key in keys if key is not None):
+            self.dispatch()
+        return {key: self._results[key] for key in keys
+                if self._results.get(key) is not None}
+
+    def dispatch(self):
+        keys = [key for key in self._queued if key not in self._results]
+        self._queued = {}
+        if not keys:
+            return
+        self.batches += 1
+        results = self.batch_load_fn(keys)
+        for key in keys:
+            self._results[key] = results.get(key)
+
+
+class Loaders:
+    """The loaders of one GraphQL request, sharing its Authorization header."""
+
+    def __init__(self, request):
+        auth_token = request.headers.get('Authorization') if request else None
+        self.enricher = Enricher(auth_token)
+        self.users = DataLoader(self.enricher.loaders["user"])
+        self.events = DataLoader(
+            lambda event_ids: self.enricher.fetch(EVENT, event_ids))
+        # Set once the operation's keys have been queued
+        self.planned = False
+
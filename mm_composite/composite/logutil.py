@@ -0,0 +1,179 @@
+"""
+Structured, non-blocking logging for the composite service.
+
+Request threads only filter a record and put it on a queue;
+``QueueStreamHandler`` formats and writes it from a background listener
+thread, so a slow or contended stdout never stalls a request. The pieces are
+wired together by ``LOGGING`` in settings:
+
+* ``SamplingFilter`` keeps a fraction of high-volume debug records;
+* ``RedactingFilter`` masks bearer tokens and JWTs before anything leaves the
+  request thread;
+* ``RequestIdFilter`` stamps every record with the current request ID, which
+  ``RequestIdMiddleware`` assigns and the downstream clients forward;
+* ``StructuredFormatter`` writes one JSON object per line.
+"""
+
+import atexit
+import contextvars
+import json
+import logging
+import queue
+import random
+import re
+import sys
+import uuid
+from logging.handlers import QueueHandler, QueueListener
+
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+
+# ID of the request being served, if any
+_request_id = contextvars.ContextVar('composite_request_id', default=None)
+
+# Incoming IDs are reused only if they look like IDs
+_valid_request_id = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+
+def start_request(incoming=None):
+    """
+    Set the request ID for the current request.
+
+    :param incoming: ID sent by the caller, reused if well-formed
+    :return: ``(request_id, token)``; pass the token to ``end_request``
+    """
+    if incoming and _valid_request_id.match(incoming):
+        request_id = incoming
+    else:
+        request_id = uuid.uuid4().hex
+    return request_id, _request_id.set(request_id)
+
+
+def end_request(token):
+    _request_id.reset(token)
+
+
+def current_request_id():
+    return _request_id.get()
+
+
+def request_id_headers():
+    """:return: Headers forwarding the current request ID downstream"""
+    request_id = _request_id.get()
+    return {REQUEST_ID_HEADER: request_id} if request_id else {}
+
+
+REDACTIONS = (
+    (re.compile(r'(?i)\b(bearer\s+)[^\s"\',]+'), r'\1[REDACTED]'),
+    (re.compile(r'\beyJ[\w-]*\.[\w-]+\.[\w-]*'), '[REDACTED]'),
+)
+
+
+def redact(text):
+    for pattern, replacement in REDACTIONS:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+# Attributes every LogRecord has; anything else was passed through ``extra``
+STANDARD_ATTRS = frozenset(vars(logging.makeLogRecord({}))) | {
+    'message', 'asctime', 'request_id'}
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep only a ``rate`` fraction of records at or below ``level``; records
+    above it always pass.
+    """
+
+    def __init__(self, rate=1.0, level='DEBUG'):
+        super().__init__()
+        self.rate = float(rate)
+        self.level = logging.getLevelName(level) if isinstance(level, str) else level
+
+    def filter(self, record):
+        return record.levelno > self.level or random.random() < self.rate
+
+
+class RedactingFilter(logging.Filter):
+    """Mask credentials in the message and in string ``extra`` fields."""
+
+    def filter(self, record):
+        # Resolve the arguments now: they are not safe to format later on
+        # another thread anyway
+        record.msg = redact(record.getMessage())
+        record.args = None
+        for name, value in vars(record).items():
+            if name not in STANDARD_ATTRS and isinstance(value, str):
+                setattr(record, name, redact(value))
+        return True
+
+
+class RequestIdFilter(logging.Filter):
+    def filter(self, record):
+        record.request_id = _request_id.get()
+        return True
+
+
+class StructuredFormatter(logging.Formatter):
+    """Format records as single-line JSON objects."""
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        request_id = getattr(record, 'request_id', None)
+        if request_id:
+            entry["request_id"] = request_id
+        for name, value in vars(record).items():
+            if name not in STANDARD_ATTRS:
+                entry[name] = value
+        if record.exc_info:
+            entry["exception"] = redact(self.formatException(record.exc_info))
+        return json.dumps(entry, default=str)
+
+
+class QueueStreamHandler(QueueHandler):
+    """
+    Hand records to a background thread that formats them and writes them to
+    ``stream``. When the queue is full, records are dropped (and counted)
+    rather than blocking the caller.
+    """
+
+    def __init__(self, stream=None, maxsize=10000):
+        super().__init__(queue.Queue(maxsize))
+        self.dropped = 0
+        self.target = logging.StreamHandler(stream or sys.stdout)
+        self.listener = QueueListener(self.queue, self.target)
+        self.listener.start()
+        atexit.register(self.stop)
+
+    def setFormatter(self, fmt):
+        # Formatting happens on the listener thread
+        self.target.setFormatter(fmt)
+
+    def prepare(self, record):
+        # Arguments may change once the caller moves on; exc_info is kept
+        # for the target's formatter, which runs in this process
+        if record.args:
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def stop(self):
+        """Write out whatever is queued and stop the listener thread."""
+        if self.listener._thread is not None:
+            self.listener.stop()
+
+    def close(self):
+        self.stop()
+        super().close()
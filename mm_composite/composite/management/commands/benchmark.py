@@ -0,0 +1,156 @@
+import json
+import logging
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from composite.benchmark import driver
+from composite.benchmark.server import serve_composite
+from composite.benchmark.stubs import StubConfig, start_stubs
+
+
+class BenchmarkUser:
+    id = pk = 1
+    username = "user1"
+    email = "user1@example.com"
+    is_active = True
+
+
+def benchmark_token():
+    """:return: An access token for ``BenchmarkUser``, as the stubs expect"""
+    token = AccessToken.for_user(BenchmarkUser())
+    token["username"] = BenchmarkUser.username
+    token["email"] = BenchmarkUser.email
+    return str(token)
+
+
+def int_list(value):
+    return [int(item) for item in value.split(",") if item]
+
+
+class Command(BaseCommand):
+    help = ("Benchmark the composite endpoints against local stub services "
+            "and report throughput, latency percentiles and upstream calls.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--scenarios", default="postevent,getevent,getavailability,graphql",
+            help="Comma-separated scenarios: postevent, getevent, getevents, "
+                 "getavailability, graphql")
+        parser.add_argument(
+            "--concurrency", type=int_list, default=[1, 8, 32],
+            help="Comma-separated numbers of concurrent clients")
+        parser.add_argument(
+            "--requests", type=int, default=200,
+            help="Requests per scenario and concurrency level")
+        parser.add_argument(
+            "--latency", type=float, default=20,
+            help="Stub response latency in milliseconds")
+        parser.add_argument(
+            "--jitter", type=float, default=5,
+            help="Random extra stub latency, up to this many milliseconds")
+        parser.add_argument(
+            "--error-rate", type=float, default=0.0,
+            help="Fraction of stub responses that fail with a 503")
+        parser.add_argument(
+            "--participants", type=int, default=20,
+            help="Participants per event")
+        parser.add_argument(
+            "--ids", type=int, default=1000,
+            help="Resource IDs are drawn at random from 1..IDS")
+        parser.add_argument(
+            "--target",
+            help="Benchmark an already running composite at this URL instead "
+                 "of serving it in-process; it must use the stub ports")
+        parser.add_argument(
+            "--stub-ports", default="8000,8001,8003",
+            help="Ports for the scheduling, users and notifications stubs "
+                 "with --target")
+        parser.add_argument(
+            "--json", action="store_true",
+            help="Print the results as JSON")
+
+    def handle(self, *args, **options):
+        available = driver.scenarios(options["participants"])
+        names = [name for name in options["scenarios"].split(",") if name]
+        unknown = set(names) - set(available)
+        if unknown:
+            raise CommandError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+        if options["verbosity"] < 2:
+            # Injected upstream failures would otherwise flood the output
+            logging.getLogger("composite").setLevel(logging.ERROR)
+
+        config = StubConfig(
+            latency=options["latency"] / 1000, jitter=options["jitter"] / 1000,
+            error_rate=options["error_rate"])
+        ports = {}
+        if options["target"]:
+            ports = dict(zip(("scheduling", "users", "notifications"),
+                             int_list(options["stub_ports"])))
+        stubs = start_stubs(config, options["participants"], ports)
+
+        token = benchmark_token()
+
+        try:
+            if options["target"]:
+                results = self.run_all(
+                    options, names, available, options["target"].rstrip("/"),
+                    token, stubs)
+            else:
+                results = self.run_in_process(
+                    options, names, available, token, stubs)
+        finally:
+            for stub in stubs.values():
+                stub.stop()
+
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+        else:
+            self.report(results, list(stubs))
+
+    def run_in_process(self, options, names, available, token, stubs):
+        services = {
+            name: {**settings.DOWNSTREAM_SERVICES.get(name, {}),
+                   'BASE_URL': stub.base_url}
+            for name, stub in stubs.items()
+        }
+        with override_settings(DOWNSTREAM_SERVICES=services,
+                               ALLOWED_HOSTS=["127.0.0.1", "localhost"]):
+            server, base_url = serve_composite()
+            try:
+                return self.run_all(
+                    options, names, available, base_url, token, stubs)
+            finally:
+                server.shutdown()
+                server.server_close()
+
+    def run_all(self, options, names, available, base_url, token, stubs):
+        results = []
+        for name in names:
+            for concurrency in options["concurrency"]:
+                result = driver.run(
+                    available[name], base_url, token, concurrency,
+                    options["requests"], stubs, id_range=options["ids"])
+                results.append(result.as_dict())
+                if options["verbosity"] > 1:
+                    self.stderr.write(f"{name} x{concurrency} done")
+        return results
+
+    def report(self, results, services):
+        header = (f"{'scenario':<16}{'conc':>5}{'reqs':>6}{'errs':>6}"
+                  f"{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}  "
+                  + "  ".join(f"{service + '/req':>16}" for service in services))
+        self.stdout.write(header)
+        self.stdout.write("-" * len(header))
+        for result in results:
+            calls = result["upstream_calls_per_request"]
+            self.stdout.write(
+                f"{result['scenario']:<16}{result['concurrency']:>5}"
+                f"{result['requests']:>6}{result['errors']:>6}"
+                f"{result['throughput']:>9.1f}{result['p50_ms']:>9.1f}"
+                f"{result['p95_ms']:>9.1f}{result['p99_ms']:>9.1f}  "
+                + "  ".join(f"{calls.get(service, 0):>16.2f}"
+                            for service in services))
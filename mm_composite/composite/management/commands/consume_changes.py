@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from composite.changes import RedisConsumer, changes_setting
+
+
+class Command(BaseCommand):
+    help = ("Apply change notifications published by the upstream services "
+            "on Redis to the composite caches.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--url", default=changes_setting('REDIS_URL'),
+            help="Redis URL to subscribe to")
+        parser.add_argument(
+            "--channels", default=",".join(changes_setting('CHANNELS')),
+            help="Comma-separated channels to subscribe to")
+
+    def handle(self, *args, **options):
+        channels = [name for name in options["channels"].split(",") if name]
+        consumer = RedisConsumer(options["url"], channels)
+        self.stdout.write(f"Consuming changes from {', '.join(channels)}")
+        consumer.run()
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from composite.tasks import get_queue, task_queue_setting
+
+
+class Command(BaseCommand):
+    help = "Run background task workers against the durable task queue."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers", type=int, default=task_queue_setting('WORKERS') or 4,
+            help="Number of worker threads to run")
+
+    def handle(self, *args, **options):
+        queue = get_queue()
+        if not queue.durable:
+            raise CommandError(
+                "runworkers needs a durable backend such as "
+                "composite.tasks.SqliteQueueBackend")
+        self.stdout.write(
+            f"Running {options['workers']} task workers, queue depth {queue.depth()}")
+        queue.start(workers=options['workers'], block=True)
@@ -0,0 +1,37 @@
+import time
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+
+from composite import replica
+
+
+class Command(BaseCommand):
+    help = ("Copy changed user profiles from the user service into the local "
+            "user replica.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--full", action="store_true",
+            help="Ignore the stored cursor and replicate every user (backfill)")
+        parser.add_argument(
+            "--follow", action="store_true",
+            help="Keep syncing every USER_REPLICA['SYNC_INTERVAL'] seconds")
+
+    def handle(self, *args, **options):
+        if not replica.enabled():
+            raise CommandError("Set USER_REPLICA['ENABLED'] to sync users")
+
+        full = options["full"]
+        while True:
+            try:
+                written = replica.sync(full=full)
+                self.stdout.write(f"Synced {written} users")
+                full = False
+            except requests.RequestException as e:
+                if not options["follow"]:
+                    raise CommandError(f"User sync failed: {e}")
+                self.stderr.write(f"User sync failed, retrying: {e}")
+            if not options["follow"]:
+                return
+            time.sleep(replica.replica_setting('SYNC_INTERVAL'))
@@ -0,0 +1,328 @@
+"""
+In-process metrics in the Prometheus text exposition format.
+
+A deliberately small registry: counters, gauges and histograms with labels,
+each guarded by its own lock, so recording a sample costs a dict lookup and
+an addition. ``metrics_view`` renders everything on ``/metrics``; values kept
+elsewhere (cache counters, breaker states, queue depth) are read at scrape
+time through collectors instead of being updated on the hot path.
+
+The endpoint describes upstream services and their failures, so it is only
+served to the addresses in ``METRICS['ALLOWED_IPS']`` or to scrapers sending
+``METRICS['TOKEN']`` as a bearer token.
+"""
+
+import bisect
+import hmac
+import ipaddress
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.http import HttpResponse
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULTS = {
+    # Bearer token scrapers may authenticate with
+    'TOKEN': None,
+    # Addresses or networks served without a token
+    'ALLOWED_IPS': ['127.0.0.1', '::1'],
+}
+
+
+def metrics_setting(name):
+    return getattr(settings, 'METRICS', {}).get(name, DEFAULTS[name])
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+
+def format_labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(
+        '{}="{}"'.format(name, str(value).replace('\\', r'\\').replace('"', r'\"'))
+        for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.register(self)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.documentation}",
+                f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def expose(self):
+        with self._lock:
+            values = dict(self._values)
+        return self.header() + [
+            f"{self.name}{format_labels(self.label_names, labels)} {value}"
+            for labels, value in sorted(values.items())
+        ]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, *labels, value):
+        with self._lock:
+            self._values[labels] = value
+
+    @contextmanager
+    def track(self, *labels):
+        self.inc(*labels)
+        try:
+            yield
+        finally:
+            self.dec(*labels)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        super().__init__(name, documentation, labels)
+
+    def observe(self, *labels, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                # Per-bucket counts (the last one is +Inf), sum
+                series = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    @contextmanager
+    def time(self, *labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(*labels, value=time.perf_counter() - start)
+
+    def expose(self):
+        with self._lock:
+            values = {labels: (list(counts), total)
+                      for labels, (counts, total) in self._values.items()}
+        lines = self.header()
+        names = self.label_names + ("le",)
+        for labels, (counts, total) in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket"
+                             f"{format_labels(names, labels + (bound,))} {cumulative}")
+            plain = format_labels(self.label_names, labels)
+            lines.append(f"{self.name}_sum{plain} {total}")
+            lines.append(f"{self.name}_count{plain} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+
+    def register_collector(self, collector):
+        """
+        :param collector: Callable returning ``(name, kind, documentation,
+                          {label_dict_tuple: value})`` tuples at scrape time
+        """
+        self._collectors.append(collector)
+
+    def expose(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.expose())
+        for collector in self._collectors:
+            try:
+                samples = collector()
+            except Exception:
+                logger.exception("Metrics collector failed")
+                continue
+            for name, kind, documentation, values in samples:
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in values.items():
+                    label_names = tuple(label for label, _ in labels)
+                    label_values = tuple(value for _, value in labels)
+                    lines.append(
+                        f"{name}{format_labels(label_names, label_values)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+# Downstream calls
+UPSTREAM_LATENCY = Histogram(
+    "composite_upstream_request_duration_seconds",
+    "Latency of calls to downstream services.", ("service", "method"))
+UPSTREAM_REQUESTS = Counter(
+    "composite_upstream_requests_total",
+    "Calls to downstream services by response status.", ("service", "status"))
+UPSTREAM_ERRORS = Counter(
+    "composite_upstream_errors_total",
+    "Downstream calls that failed without a response.", ("service", "reason"))
+UPSTREAM_IN_FLIGHT = Gauge(
+    "composite_upstream_in_flight",
+    "Downstream calls currently in progress.", ("service",))
+HTTP_CACHE = Counter(
+    "composite_http_cache_lookups_total",
+    "Upstream GETs by HTTP cache outcome: fresh, stale, revalidated or miss.",
+    ("service", "result"))
+
+# Enrichment
+FANOUT_SIZE = Histogram(
+    "composite_fanout_size",
+    "Number of lookups issued by one fan-out.", (), buckets=SIZE_BUCKETS)
+AUTH_LATENCY = Histogram(
+    "composite_auth_duration_seconds",
+    "Time spent authenticating a request.", ("result",))
+
+REPLICA_LOOKUPS = Counter(
+    "composite_user_replica_lookups_total",
+    "Users looked up in the local replica, by outcome.", ("result",))
+
+# Change notifications
+CHANGES_APPLIED = Counter(
+    "composite_changes_applied_total",
+    "Change notifications applied to the caches.",
+    ("source", "resource", "action"))
+
+# Incoming requests
+VIEW_LATENCY = Histogram(
+    "composite_view_duration_seconds",
+    "Total time to serve a request, by view.", ("view", "method", "status"))
+VIEW_IN_FLIGHT = Gauge(
+    "composite_requests_in_flight",
+    "Requests currently being served.", ())
+
+
+def collect_components():
+    """
+    Report the counters the caches, breakers and task queue already keep.
+    Components that have not been created yet are skipped rather than
+    instantiated by a scrape.
+    """
+    from . import resilience, response_cache, singleflight, tasks, tokencache
+
+    samples = []
+    token_cache = tokencache._token_cache
+    if token_cache is not None:
+        stats = token_cache.stats()
+        samples.append((
+            "composite_token_cache_lookups_total", "counter",
+            "Token cache lookups by outcome.",
+            {(("result", "hit"),): stats["hits"],
+             (("result", "miss"),): stats["misses"]}))
+        samples.append((
+            "composite_token_cache_entries", "gauge",
+            "Entries held in the in-process token cache.",
+            {(): stats["size"]}))
+
+    cache = response_cache._response_cache
+    if cache is not None:
+        stats = cache.stats()
+        samples.append((
+            "composite_response_cache_lookups_total", "counter",
+            "Response cache lookups by outcome.",
+            {(("result", "hit"),): stats["hits"],
+             (("result", "miss"),): stats["misses"]}))
+        samples.append((
+            "composite_response_cache_hit_ratio", "gauge",
+            "Share of response cache lookups served from the cache.",
+            {(): stats["hit_ratio"]}))
+        samples.append((
+            "composite_response_cache_served_age_seconds", "gauge",
+            "Age of the cached aggregates served, i.e. their staleness.",
+            {(("stat", "avg"),): stats["served_age_avg"],
+             (("stat", "max"),): stats["served_age_max"]}))
+        samples.append((
+            "composite_response_cache_not_modified_total", "counter",
+            "Responses answered with 304 Not Modified.",
+            {(): stats["not_modified"]}))
+        samples.append((
+            "composite_response_cache_invalidations_total", "counter",
+            "Resources whose cached aggregates were retired by a write.",
+            {(): stats["invalidations"]}))
+
+    flights = singleflight._singleflight
+    if flights is not None:
+        stats = flights.stats()
+        samples.append((
+            "composite_singleflight_calls_total", "counter",
+            "Aggregations built (led) or shared with an identical one.",
+            {(("result", "led"),): stats["led"],
+             (("result", "shared"),): stats["shared"],
+             (("result", "shared_remote"),): stats["shared_remote"]}))
+
+    states = (resilience.CircuitBreaker.CLOSED, resilience.CircuitBreaker.OPEN,
+              resilience.CircuitBreaker.HALF_OPEN)
+    samples.append((
+        "composite_circuit_breaker_state", "gauge",
+        "1 for the current state of each upstream's circuit breaker.",
+        {(("service", name), ("state", state)): int(breaker.state == state)
+         for name, breaker in sorted(resilience._breakers.items())
+         for state in states}))
+
+    queue = tasks._queue
+    if queue is not None:
+        samples.append((
+            "composite_task_queue_depth", "gauge",
+            "Jobs waiting in the background task queue.",
+            {(): queue.depth()}))
+    return samples
+
+
+REGISTRY.register_collector(collect_components)
+
+
+def scrape_allowed(request):
+    token = metrics_setting('TOKEN')
+    authorization = request.headers.get("Authorization") or ""
+    if token and hmac.compare_digest(authorization, f"Bearer {token}"):
+        return True
+    try:
+        address = ipaddress.ip_address(request.META.get("REMOTE_ADDR", ""))
+    except ValueError:
+        return False
+    return any(address in ipaddress.ip_network(allowed, strict=False)
+               for allowed in metrics_setting('ALLOWED_IPS'))
+
+
+def metrics_view(request):
+    if not scrape_allowed(request):
+        return HttpResponse("Forbidden\n", status=403, content_type="text/plain")
+    return HttpResponse(REGISTRY.expose(),
+                        content_type="text/plain; version=0.0.4; charset=utf-8")
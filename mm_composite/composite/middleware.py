@@ -0,0 +1,185 @@
+"""
+Middleware for the composite service.
+
+Each middleware here runs natively in both modes: under ASGI with the async
+views (``COMPOSITE_ASYNC_VIEWS``), a sync-only middleware would make Django
+run the rest of the request in a thread and undo the point of those views.
+
+The deadline and the request ID live in context variables that are reset
+once the view returns, but a streamed body (``?stream=``, ``getevents``)
+is generated after that; ``hold_context`` runs it in the context the view
+returned in.
+"""
+
+import asyncio
+import contextvars
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from . import logutil, metrics
+from .resilience import end_deadline, resilience_setting, start_deadline
+
+
+def hold_context(response):
+    """
+    Make a streamed response generate its body in the current context.
+
+    :return: The response
+    """
+    if not response.streaming:
+        return response
+    context = contextvars.copy_context()
+    content = response.streaming_content
+    if response.is_async:
+        response.streaming_content = _arun_in(context, content)
+    else:
+        response.streaming_content = _run_in(context, content)
+    return response
+
+
+def _run_in(context, iterable):
+    iterator = iter(iterable)
+    while True:
+        try:
+            chunk = context.run(next, iterator)
+        except StopIteration:
+            return
+        yield chunk
+
+
+async def _arun_in(context, iterable):
+    iterator = aiter(iterable)
+    done = object()
+
+    async def step():
+        try:
+            return await anext(iterator)
+        except StopAsyncIteration:
+            return done
+
+    while True:
+        chunk = await asyncio.create_task(step(), context=context)
+        if chunk is done:
+            return
+        yield chunk
+
+
+class HybridMiddleware:
+    """
+    Base for middleware that is both sync and async capable. Subclasses
+    implement ``__call__`` and ``__acall__``; ``__call__`` hands off to
+    ``__acall__`` when the middleware was set up in async mode.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+
+class DeadlineMiddleware(HybridMiddleware):
+    """
+    Give every request a deadline budget for its downstream calls. A caller
+    may shorten it by sending its own remaining budget in the deadline
+    header.
+    """
+
+    def budget(self, request):
+        budget = resilience_setting('REQUEST_BUDGET')
+        incoming = request.headers.get(resilience_setting('DEADLINE_HEADER'))
+        if incoming:
+            try:
+                budget = min(budget, int(incoming) / 1000)
+            except ValueError:
+                pass
+        return budget
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        token = start_deadline(self.budget(request))
+        try:
+            return hold_context(self.get_response(request))
+        finally:
+            end_deadline(token)
+
+    async def __acall__(self, request):
+        token = start_deadline(self.budget(request))
+        try:
+            return hold_context(await self.get_response(request))
+        finally:
+            end_deadline(token)
+
+
+class RequestIdMiddleware(HybridMiddleware):
+    """
+    Give every request an ID: the caller's ``X-Request-ID`` if it sent a
+    sane one, a fresh one otherwise. It is attached to every log record,
+    forwarded on downstream calls and echoed on the response.
+    """
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        request_id, token = logutil.start_request(
+            request.headers.get(logutil.REQUEST_ID_HEADER))
+        try:
+            response = hold_context(self.get_response(request))
+        finally:
+            logutil.end_request(token)
+        response[logutil.REQUEST_ID_HEADER] = request_id
+        return response
+
+    async def __acall__(self, request):
+        request_id, token = logutil.start_request(
+            request.headers.get(logutil.REQUEST_ID_HEADER))
+        try:
+            response = hold_context(await self.get_response(request))
+        finally:
+            logutil.end_request(token)
+        response[logutil.REQUEST_ID_HEADER] = request_id
+        return response
+
+
+class MetricsMiddleware(HybridMiddleware):
+    """
+    Record the total time spent serving each request, labelled by URL route
+    so that path parameters do not multiply the series. Streamed bodies are
+    timed up to the point the response starts.
+    """
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        start = time.perf_counter()
+        status = 500
+        with metrics.VIEW_IN_FLIGHT.track():
+            try:
+                response = self.get_response(request)
+                status = response.status_code
+                return response
+            finally:
+                self.observe(request, status, start)
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        status = 500
+        with metrics.VIEW_IN_FLIGHT.track():
+            try:
+                response = await self.get_response(request)
+                status = response.status_code
+                return response
+            finally:
+                self.observe(request, status, start)
+
+    def observe(self, request, status, start):
+        match = request.resolver_match
+        view = match.route if match is not None else "unmatched"
+        metrics.VIEW_LATENCY.observe(
+            view, request.method, str(status),
+            value=time.perf_counter() - start)
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncCursor',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('value', models.CharField(blank=True, max_length=255)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='UserReplica',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('username', models.CharField(blank=True, max_length=150)),
+                ('first_name', models.CharField(blank=True, max_length=150)),
+                ('email', models.CharField(blank=True, max_length=254)),
+                ('updated_at', models.DateTimeField(blank=True, null=True)),
+                ('synced_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('composite', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdempotencyRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=255)),
+                ('scope', models.CharField(max_length=100)),
+                ('fingerprint', models.CharField(max_length=64)),
+                ('state', models.CharField(default='in_progress', max_length=20)),
+                ('status_code', models.IntegerField(blank=True, null=True)),
+                ('response', models.JSONField(blank=True, null=True)),
+                ('started_at', models.DateTimeField()),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('scope', 'key'), name='unique_idempotency_key')],
+            },
+        ),
+    ]
@@ -1,3 +1,58 @@
 from django.db import models
 
-# Create your models here.
+
+class UserReplica(models.Model):
+    """
+    Local copy of the user profile fields the composite service embeds,
+    kept in sync with the user service (see ``replica.py``).
+    """
+
+    # The user service's ID, not a local sequence
+    id = models.BigIntegerField(primary_key=True)
+    username = models.CharField(max_length=150, blank=True)
+    first_name = models.CharField(max_length=150, blank=True)
+    email = models.CharField(max_length=254, blank=True)
+    # When the user service last changed the profile, as reported by it
+    updated_at = models.DateTimeField(null=True, blank=True)
+    synced_at = models.DateTimeField(auto_now=True)
+
+    FIELDS = ("id", "username", "first_name", "email")
+
+    def as_user_info(self):
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+
+class SyncCursor(models.Model):
+    """Position of an incremental sync, e.g. the user service's changed-since."""
+
+    name = models.CharField(max_length=50, primary_key=True)
+    value = models.CharField(max_length=255, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+
+class IdempotencyRecord(models.Model):
+    """
+    Outcome of a request made with an ``Idempotency-Key`` header, replayed
+    to retries of it (see ``idempotency.py``).
+    """
+
+    IN_PROGRESS = "in_progress"
+    COMPLETED = "completed"
+
+    key = models.CharField(max_length=255)
+    # Whose key it is: keys are only unique per caller
+    scope = models.CharField(max_length=100)
+    # Hash of the method, path and body the key was first used with
+    fingerprint = models.CharField(max_length=64)
+    state = models.CharField(max_length=20, default=IN_PROGRESS)
+    status_code = models.IntegerField(null=True, blank=True)
+    response = models.JSONField(null=True, blank=True)
+    # When the current attempt started; stale attempts can be taken over
+    started_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["scope", "key"],
+                                    name="unique_idempotency_key"),
+        ]
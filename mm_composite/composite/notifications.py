@@ -0,0 +1,235 @@
+"""
+Batching dispatcher for the notifications service.
+
+Rendered emails are submitted one at a time and grouped into batch payloads
+that are flushed once ``BATCH_SIZE`` emails are waiting or ``FLUSH_INTERVAL``
+has passed since the first one, so invitations for concurrent events share
+batches too. Each submitted email gets its own future, which reports whether
+that recipient was delivered.
+
+When no batch endpoint is configured, or the notifications service turns out
+not to have one, batches are delivered as bounded-parallel single sends, on
+a pool of their own so slow sends never hold up the request-path fan-out.
+
+Outcomes are only reported once known: a send is never given up on while
+it may still go through, since the invitation task would then retry the
+recipient and deliver twice. Every send is bounded by the notifications
+service's timeouts instead; ``WAIT_TIMEOUT`` only keeps a worker from
+waiting forever on an outcome that was lost.
+"""
+
+import contextvars
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+
+import requests
+from django.conf import settings
+
+from . import downstream
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULTS = {
+    'SEND_PATH': '/send-email',
+    # e.g. '/send-email/batch', called with {"emails": [...]}
+    'BATCH_PATH': None,
+    'BATCH_SIZE': 50,
+    # Seconds a partial batch may wait for more emails
+    'FLUSH_INTERVAL': 0.05,
+    # Concurrent single sends when falling back
+    'MAX_IN_FLIGHT': 8,
+    # Longest send_many waits for the outcomes of its emails
+    'WAIT_TIMEOUT': 300.0,
+}
+
+# Statuses meaning the notifications service has no batch endpoint
+NO_BATCH_STATUSES = (404, 405, 501)
+
+
+def notifications_setting(name):
+    return getattr(settings, 'NOTIFICATIONS', {}).get(name, DEFAULTS[name])
+
+
+class DeliveryFailed(Exception):
+    """A recipient the notifications service reported as not delivered."""
+
+
+class NotificationDispatcher:
+    """
+    Groups emails into batches for the notifications service.
+
+    :param batch_size: Emails per batch payload
+    :param flush_interval: Seconds before a partial batch is sent anyway
+    """
+
+    def __init__(self, batch_size=None, flush_interval=None):
+        self.batch_size = batch_size or notifications_setting('BATCH_SIZE')
+        self.flush_interval = (flush_interval if flush_interval is not None
+                               else notifications_setting('FLUSH_INTERVAL'))
+        self.batch_path = notifications_setting('BATCH_PATH')
+        self._pending = []
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def submit(self, email_data):
+        """
+        Queue one email for the next batch.
+
+        :param email_data: Dict containing email details
+        :return: Future resolving to None once delivered, or failing with the
+                 reason the recipient was not delivered
+        """
+        future = Future()
+        batch = None
+        with self._lock:
+            self._pending.append((email_data, future))
+            if len(self._pending) >= self.batch_size:
+                batch = self._take()
+            elif self._timer is None:
+                self._timer = threading.Timer(self.flush_interval, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        if batch:
+            self._deliver(batch)
+        return future
+
+    def send_many(self, emails):
+        """
+        Deliver a set of emails and wait for the per-recipient outcome.
+
+        :param emails: Dict mapping a caller-chosen key to email data
+        :return: Dict mapping each key to None (delivered) or the exception
+                 explaining why it was not delivered
+        """
+        futures = {key: self.submit(email_data)
+                   for key, email_data in emails.items()}
+        timeout = notifications_setting('WAIT_TIMEOUT')
+        wait(futures.values(), timeout=timeout)
+        return {
+            key: (future.exception() if future.done() else DeliveryFailed(
+                f"No delivery outcome after {timeout}s"))
+            for key, future in futures.items()
+        }
+
+    def flush(self):
+        """Send whatever is waiting right away."""
+        with self._lock:
+            batch = self._take()
+        if batch:
+            self._deliver(batch)
+
+    def _take(self):
+        batch, self._pending = self._pending, []
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        return batch
+
+    def _deliver(self, batch):
+        try:
+            if self.batch_path:
+                try:
+                    self._deliver_batch(batch)
+                    return
+                except requests.HTTPError as e:
+                    if e.response.status_code not in NO_BATCH_STATUSES:
+                        self._fail(batch, e)
+                        return
+                    logger.info("Notifications service has no batch endpoint, "
+                                "sending emails individually")
+                    self.batch_path = None
+                except requests.RequestException as e:
+                    self._fail(batch, e)
+                    return
+            self._deliver_singles(batch)
+        except Exception as e:
+            # Whoever waits on these futures must hear back
+            logger.exception("Failed to deliver %d email(s)", len(batch))
+            self._fail(batch, e)
+
+    def _deliver_batch(self, batch):
+        response = downstream.post(
+            "notifications", self.batch_path,
+            json={"emails": [email_data for email_data, _ in batch]}
+        )
+        response.raise_for_status()
+        try:
+            results = downstream.decode(response).get("results")
+        except (ValueError, AttributeError):
+            results = None
+
+        # Without per-recipient results a 2xx means the whole batch went out
+        if not isinstance(results, list) or len(results) != len(batch):
+            results = [{}] * len(batch)
+        for (email_data, future), result in zip(batch, results):
+            if not isinstance(result, dict):
+                result = {}
+            if result.get("ok", True) and result.get("status", "sent") == "sent":
+                future.set_result(None)
+            else:
+                future.set_exception(DeliveryFailed(
+                    result.get("error") or f"Not delivered to {email_data.get('recipient_list')}"))
+
+    def _deliver_singles(self, batch):
+        # Not fan_out: its deadline would report sends still in progress as
+        # failed
+        def send_one(email_data, future):
+            try:
+                send_email(email_data)
+            except Exception as e:
+                future.set_exception(e)
+            else:
+                future.set_result(None)
+
+        executor = get_send_executor()
+        for email_data, future in batch:
+            context = contextvars.copy_context()
+            executor.submit(context.run, send_one, email_data, future)
+
+    def _fail(self, batch, error):
+        for _, future in batch:
+            if not future.done():
+                future.set_exception(error)
+
+
+def send_email(email_data):
+    """
+    Send a single email via the notifications service.
+
+    :param email_data: Dict containing email details
+    :raises requests.RequestException: If the email could not be delivered
+    """
+    email_response = downstream.post(
+        "notifications", notifications_setting('SEND_PATH'),
+        json=email_data
+    )
+    email_response.raise_for_status()
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+_send_executor = None
+
+
+def get_send_executor():
+    """The pool single sends run on, ``MAX_IN_FLIGHT`` at a time."""
+    global _send_executor
+    if _send_executor is None:
+        with _dispatcher_lock:
+            if _send_executor is None:
+                _send_executor = ThreadPoolExecutor(
+                    max_workers=notifications_setting('MAX_IN_FLIGHT'),
+                    thread_name_prefix='composite-notifications',
+                )
+    return _send_executor
+
+
+def get_dispatcher():
+    global _dispatcher
+    if _dispatcher is None:
+        with _dispatcher_lock:
+            if _dispatcher is None:
+                _dispatcher = NotificationDispatcher()
+    return _dispatcher
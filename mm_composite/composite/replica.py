@@ -0,0 +1,190 @@
+"""
+Local replica of the user directory.
+
+Enrichment only embeds a handful of profile fields (``UserReplica.FIELDS``).
+With ``USER_REPLICA['ENABLED']``, ``UserInfoClient`` reads them from the
+``UserReplica`` table in one indexed ``IN (...)`` query and only asks the
+user service for users missing from it, whose profiles are then written
+through. An event's participants therefore cost no upstream call at all
+once the replica is warm, however many there are.
+
+The replica is kept fresh by:
+
+* ``manage.py sync_users``, which pages through the user service's
+  changed-since endpoint (``SYNC_PATH``) from the stored cursor
+  (``--full`` starts over, as a backfill; ``--follow`` keeps polling);
+* user change notifications (see ``changes.py``), applied as they arrive.
+
+``SYNC_PATH`` is called with
+``?since=<updated_at>&since_id=<id>&limit=<PAGE_SIZE>`` and returns the
+users changed after that position, ordered by ``(updated_at, id)``, either
+as a list or as ``{"results": [...], "cursor": ...}``. Without a ``cursor`` the next position is the last user's
+``(updated_at, id)``: a timestamp alone would skip users changed at the same
+instant as the last one of a page. A ``cursor`` is sent back as ``since``.
+
+Profiles fetched from the user service are reduced to ``FIELDS`` as well
+(see ``project``), so a user looks the same whether or not it came from the
+replica.
+"""
+
+import json
+import logging
+
+from django.conf import settings
+from django.utils.dateparse import parse_datetime
+
+from . import downstream, metrics
+from .models import SyncCursor, UserReplica
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULTS = {
+    'ENABLED': False,
+    'SYNC_PATH': '/userinfo/changes/',
+    'PAGE_SIZE': 500,
+    # Seconds between incremental syncs with ``sync_users --follow``
+    'SYNC_INTERVAL': 60,
+    # Bearer token the sync authenticates with, if the endpoint needs one
+    'SERVICE_TOKEN': None,
+}
+
+CURSOR_NAME = "users"
+
+# bulk_create arguments turning inserts of known users into updates
+UPSERT = {
+    "update_conflicts": True,
+    "unique_fields": ["id"],
+    "update_fields": [*UserReplica.FIELDS[1:], "updated_at", "synced_at"],
+}
+
+
+def replica_setting(name):
+    return getattr(settings, 'USER_REPLICA', {}).get(name, DEFAULTS[name])
+
+
+def enabled():
+    return replica_setting('ENABLED')
+
+
+def rows(users):
+    """:return: ``UserReplica`` rows for profiles from the user service"""
+    return [
+        UserReplica(
+            updated_at=parse_datetime(user["updated_at"])
+            if user.get("updated_at") else None,
+            **{field: user.get(field) or "" for field in UserReplica.FIELDS},
+        )
+        for user in users if user.get("id") is not None
+    ]
+
+
+def project(user_details):
+    """
+    :param user_details: Dict mapping user ID to profiles from the user service
+    :return: The profiles as ``lookup`` returns them, when the replica is on
+    """
+    if not enabled():
+        return user_details
+    return {
+        uid: {"id": user.get("id", uid),
+              **{field: user.get(field) or "" for field in UserReplica.FIELDS[1:]}}
+        for uid, user in user_details.items()
+    }
+
+
+def lookup(user_ids):
+    """:return: Dict of the users found in the replica"""
+    if not enabled() or not user_ids:
+        return {}
+    found = {replica.id: replica.as_user_info()
+             for replica in UserReplica.objects.filter(id__in=user_ids)}
+    metrics.REPLICA_LOOKUPS.inc("hit", amount=len(found))
+    metrics.REPLICA_LOOKUPS.inc("miss", amount=len(user_ids) - len(found))
+    return found
+
+
+async def alookup(user_ids):
+    if not enabled() or not user_ids:
+        return {}
+    found = {replica.id: replica.as_user_info()
+             async for replica in UserReplica.objects.filter(id__in=user_ids)}
+    metrics.REPLICA_LOOKUPS.inc("hit", amount=len(found))
+    metrics.REPLICA_LOOKUPS.inc("miss", amount=len(user_ids) - len(found))
+    return found
+
+
+def store(users):
+    """Insert or update profiles returned by the user service."""
+    if enabled() and users:
+        UserReplica.objects.bulk_create(rows(users), **UPSERT)
+
+
+async def astore(users):
+    if enabled() and users:
+        await UserReplica.objects.abulk_create(rows(users), **UPSERT)
+
+
+def delete(user_id):
+    if enabled():
+        UserReplica.objects.filter(id=user_id).delete()
+
+
+def load_position(value):
+    """:return: The query parameters resuming a sync from a stored cursor"""
+    if not value:
+        return {}
+    try:
+        position = json.loads(value)
+    except ValueError:
+        position = None
+    # Cursors stored before ``since_id`` was sent are plain timestamps
+    return position if isinstance(position, dict) else {"since": value}
+
+
+def next_position(payload, users):
+    """:return: The position after a page, or None if it cannot advance"""
+    if isinstance(payload, dict) and payload.get("cursor"):
+        return {"since": str(payload["cursor"])}
+    last = users[-1]
+    if not last.get("updated_at") or last.get("id") is None:
+        return None
+    return {"since": str(last["updated_at"]), "since_id": str(last["id"])}
+
+
+def sync(full=False):
+    """
+    Apply every change the user service reports since the stored cursor.
+
+    :param full: Start from the beginning, replicating every user
+    :return: Number of users written
+    :raises requests.RequestException: If a page could not be retrieved;
+                                       pages already applied are kept
+    """
+    cursor, _ = SyncCursor.objects.get_or_create(name=CURSOR_NAME)
+    position = {} if full else load_position(cursor.value)
+    token = replica_setting('SERVICE_TOKEN')
+    headers = {"Authorization": f"Bearer {token}"} if token else {}
+    size = replica_setting('PAGE_SIZE')
+    written = 0
+    while True:
+        params = {"limit": size, **position}
+        response = downstream.get("users", replica_setting('SYNC_PATH'),
+                                  params=params, headers=headers)
+        response.raise_for_status()
+        payload = downstream.decode(response)
+        users = payload.get("results", []) if isinstance(payload, dict) else payload
+        if not users:
+            break
+        store(users)
+        written += len(users)
+        following = next_position(payload, users)
+        if not following or following == position:
+            break
+        position = following
+        cursor.value = json.dumps(position)
+        cursor.save()
+        if len(users) < size:
+            break
+    logger.info("Synced %d users, cursor %s", written, cursor.value or "-")
+    return written
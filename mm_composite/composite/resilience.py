@@ -0,0 +1,208 @@
+"""
+Circuit breakers and deadline budgets for downstream calls.
+
+Every upstream service has a circuit breaker. It opens when the failure rate
+over a sliding time window crosses a threshold, rejects calls while open, and
+after a cool-down lets a few trial calls through (half-open) to decide
+whether to close again. A slow service therefore fails fast instead of tying
+up every worker thread.
+
+Every incoming request gets a deadline (``DeadlineMiddleware``). Downstream
+calls never wait longer than what is left of it, and forward the remainder
+in a header so upstreams can give up early too. A call that fails because
+the deadline ran out, which a caller can force by sending a short budget,
+is not held against the upstream's breaker. Both failure modes raise
+subclasses of ``requests.RequestException``, so existing error handling
+degrades the response instead of failing it.
+"""
+
+import collections
+import contextvars
+import threading
+import time
+
+import requests
+from django.conf import settings
+
+
+DEFAULTS = {
+    # Seconds an incoming request may spend on downstream work
+    'REQUEST_BUDGET': 8.0,
+    # Seconds of the budget kept back for building the response
+    'RESPONSE_RESERVE': 0.1,
+    # Header carrying the remaining budget in milliseconds, both ways
+    'DEADLINE_HEADER': 'X-Request-Deadline-Ms',
+    # Sliding window (seconds) over which the failure rate is measured
+    'BREAKER_WINDOW': 30,
+    # Calls needed in the window before the breaker may open
+    'BREAKER_MIN_CALLS': 10,
+    'BREAKER_FAILURE_RATE': 0.5,
+    # Seconds the breaker stays open before allowing trial calls
+    'BREAKER_OPEN_SECONDS': 15,
+    # Trial calls allowed while half-open
+    'BREAKER_HALF_OPEN_CALLS': 3,
+}
+
+
+def resilience_setting(name):
+    return getattr(settings, 'RESILIENCE', {}).get(name, DEFAULTS[name])
+
+
+class CircuitOpen(requests.RequestException):
+    """The upstream's circuit breaker is rejecting calls."""
+
+
+class DeadlineExceeded(requests.RequestException):
+    """The request's deadline budget is used up."""
+
+
+# Absolute time.monotonic() deadline of the request being served, if any
+_deadline = contextvars.ContextVar('composite_deadline', default=None)
+
+
+def start_deadline(budget):
+    """
+    Set the deadline for the current request.
+
+    :param budget: Seconds available from now
+    :return: Token for ``end_deadline``
+    """
+    return _deadline.set(time.monotonic() + budget)
+
+
+def end_deadline(token):
+    _deadline.reset(token)
+
+
+def remaining_budget():
+    """
+    :return: Seconds left for downstream work, or None outside a request
+    """
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic() - resilience_setting('RESPONSE_RESERVE')
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name):
+        self.name = name
+        self.window = resilience_setting('BREAKER_WINDOW')
+        self.min_calls = resilience_setting('BREAKER_MIN_CALLS')
+        self.failure_rate = resilience_setting('BREAKER_FAILURE_RATE')
+        self.open_seconds = resilience_setting('BREAKER_OPEN_SECONDS')
+        self.half_open_calls = resilience_setting('BREAKER_HALF_OPEN_CALLS')
+        self.state = self.CLOSED
+        self._calls = collections.deque()  # (timestamp, succeeded)
+        self._opened_at = 0.0
+        self._trials = 0
+        self._trial_successes = 0
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """
+        :raises CircuitOpen: If the call must not be made
+        """
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.open_seconds:
+                    raise CircuitOpen(f"Circuit for {self.name} is open")
+                self._half_open()
+            if self.state == self.HALF_OPEN:
+                if self._trials >= self.half_open_calls:
+                    # Trial calls that never reported back (e.g. cancelled)
+                    # must not wedge the breaker half-open forever
+                    if time.monotonic() - self._opened_at < 2 * self.open_seconds:
+                        raise CircuitOpen(f"Circuit for {self.name} is half-open")
+                    self._half_open()
+                self._trials += 1
+
+    def record_success(self):
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._trial_successes += 1
+                if self._trial_successes >= self.half_open_calls:
+                    self.state = self.CLOSED
+                    self._calls.clear()
+                return
+            self._record(True)
+
+    def record_inconclusive(self):
+        """
+        Report a call that says nothing about the service's health, e.g. one
+        cut short by its caller's deadline. A half-open trial slot is freed.
+        """
+        with self._lock:
+            if self.state == self.HALF_OPEN and self._trials:
+                self._trials -= 1
+
+    def record_failure(self):
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._open()
+                return
+            self._record(False)
+            failures = sum(1 for _, ok in self._calls if not ok)
+            if (len(self._calls) >= self.min_calls
+                    and failures / len(self._calls) >= self.failure_rate):
+                self._open()
+
+    def _record(self, succeeded):
+        now = time.monotonic()
+        self._calls.append((now, succeeded))
+        while self._calls and self._calls[0][0] < now - self.window:
+            self._calls.popleft()
+
+    def _half_open(self):
+        self.state = self.HALF_OPEN
+        self._opened_at = time.monotonic() - self.open_seconds
+        self._trials = self._trial_successes = 0
+
+    def _open(self):
+        self.state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._calls.clear()
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(service):
+    breaker = _breakers.get(service)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.setdefault(service, CircuitBreaker(service))
+    return breaker
+
+
+def budget_spent():
+    """
+    :return: Whether the current request's deadline has passed, e.g. to tell
+             a call that timed out because the caller allowed too little
+             time from a slow service
+    """
+    remaining = remaining_budget()
+    return remaining is not None and remaining <= 0
+
+
+def call_budget(connect_timeout, read_timeout):
+    """
+    Fit a downstream call's timeouts into the request's remaining budget.
+
+    :return: ``(timeout, headers)``: the ``(connect, read)`` timeout to use
+             and the headers forwarding the remaining budget
+    :raises DeadlineExceeded: If nothing is left of the budget
+    """
+    remaining = remaining_budget()
+    if remaining is None:
+        return (connect_timeout, read_timeout), {}
+    if budget_spent():
+        raise DeadlineExceeded("Request deadline exceeded")
+    timeout = (min(connect_timeout, remaining), min(read_timeout, remaining))
+    headers = {resilience_setting('DEADLINE_HEADER'): str(int(remaining * 1000))}
+    return timeout, headers
@@ -0,0 +1,243 @@
+"""
+Response-level cache for enriched aggregates.
+
+Enriched events and availabilities are cached per resource and per caller
+(the aggregate is built with the caller's token, so it is never shared
+between users) for ``RESPONSE_CACHE['TTL']`` seconds. Every response carries
+an ETag; a matching ``If-None-Match`` gets a bodiless 304.
+
+Each resource has a version number stored next to the entries. Writes bump
+it, which orphans every caller's cached copy at once without having to know
+who cached it. An aggregate also records the versions of the objects it
+embeds (e.g. its participants' profiles, as ``("user", id)``), so a change
+notification for any of them (see ``changes.py``) retires it as well.
+
+Concurrent misses for the same aggregate are collapsed into one build (see
+``singleflight.py``).
+"""
+
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.response import Response
+
+from .jsoncodec import dumps
+from .singleflight import authorization_scope, get_singleflight
+
+
+DEFAULTS = {
+    # Django cache alias holding the responses
+    'BACKEND': 'default',
+    # Seconds a cached aggregate is served before it is rebuilt
+    'TTL': 30,
+}
+
+
+def response_cache_setting(name):
+    return getattr(settings, 'RESPONSE_CACHE', {}).get(name, DEFAULTS[name])
+
+
+def compute_etag(data):
+    return '"' + hashlib.sha1(dumps(data, sort_keys=True)).hexdigest() + '"'
+
+
+def etag_matches(request, etag):
+    header = request.headers.get("If-None-Match")
+    if not header:
+        return False
+    candidates = [tag.strip() for tag in header.split(",")]
+    # Weak comparison, as RFC 9110 requires for If-None-Match
+    return "*" in candidates or etag.removeprefix("W/") in (
+        tag.removeprefix("W/") for tag in candidates)
+
+
+class ResponseCache:
+    key_prefix = "composite:response"
+
+    def __init__(self, alias=None, ttl=None):
+        self.alias = alias or response_cache_setting('BACKEND')
+        self.ttl = ttl if ttl is not None else response_cache_setting('TTL')
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.invalidations = 0
+        # Age of served cached entries, for staleness reporting
+        self.served_age_total = 0.0
+        self.served_age_max = 0.0
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def _version_key(self, resource, resource_id):
+        return f"{self.key_prefix}:version:{resource}:{resource_id}"
+
+    def _entry_key(self, resource, resource_id, caller_id, version, variant):
+        key = f"{self.key_prefix}:{resource}:{resource_id}:v{version}:{caller_id}"
+        # Variants (e.g. sparse fieldsets) are hashed to keep keys short
+        if variant:
+            key += ":" + hashlib.sha1(variant.encode("utf-8")).hexdigest()
+        return key
+
+    def _version(self, resource, resource_id):
+        return self.cache.get(self._version_key(resource, resource_id), 0)
+
+    def _versions(self, keys):
+        """:return: ``{version key: version}``, in one cache round trip"""
+        keys = list(dict.fromkeys(keys))
+        found = self.cache.get_many(keys) if keys else {}
+        return {key: found.get(key, 0) for key in keys}
+
+    async def _aversions(self, keys):
+        keys = list(dict.fromkeys(keys))
+        found = await self.cache.aget_many(keys) if keys else {}
+        return {key: found.get(key, 0) for key in keys}
+
+    def _current(self, entry):
+        """:return: Whether none of the entry's dependencies changed since"""
+        depends = entry.get("depends")
+        return not depends or self._versions(depends) == depends
+
+    async def _acurrent(self, entry):
+        depends = entry.get("depends")
+        return not depends or await self._aversions(depends) == depends
+
+    def _hit(self, entry):
+        age = time.time() - entry["stored_at"]
+        with self._lock:
+            self.hits += 1
+            self.served_age_total += age
+            self.served_age_max = max(self.served_age_max, age)
+
+    def _miss(self, resource, resource_id, request, version, variant):
+        """:return: The singleflight key of the build"""
+        with self._lock:
+            self.misses += 1
+        return (f"{resource}:{resource_id}:v{version}:"
+                f"{authorization_scope(request)}:{variant}")
+
+    def get_or_build(self, resource, resource_id, request, build, variant="",
+                     depends_on=None):
+        """
+        Return the cached aggregate for this caller, building it on a miss.
+
+        :param resource: Resource name, e.g. ``"event"``
+        :param resource_id: ID of the resource
+        :param request: The incoming request (identifies the caller)
+        :param build: Callable returning the aggregate, or None on failure
+        :param variant: Distinguishes representations of the same resource
+        :param depends_on: Callable taking the aggregate and returning the
+                           ``(resource, id)`` pairs it embeds
+        :return: ``{"body", "etag", "stored_at"}``, or None if build failed
+        """
+        caller_id = getattr(request.user, "id", None)
+        version = self._version(resource, resource_id)
+        key = self._entry_key(resource, resource_id, caller_id, version, variant)
+        entry = self.cache.get(key)
+        if entry is not None and self._current(entry):
+            self._hit(entry)
+            return entry
+
+        flight = self._miss(resource, resource_id, request, version, variant)
+        body = get_singleflight().do(flight, build)
+        if body is None:
+            return None
+        entry = {"body": body, "etag": compute_etag(body),
+                 "stored_at": time.time()}
+        if depends_on is not None:
+            # Read after the build: a change landing mid-build is only
+            # caught by the TTL
+            entry["depends"] = self._versions(
+                self._version_key(*dependency) for dependency in depends_on(body))
+        # A degraded aggregate is served once but never cached
+        if not body.get("degraded"):
+            self.cache.set(key, entry, timeout=self.ttl)
+        return entry
+
+    async def aget_or_build(self, resource, resource_id, request, build,
+                            variant="", depends_on=None):
+        """
+        ``get_or_build`` for the async views: ``build`` is a coroutine
+        function, and the cache is used through its async API.
+        """
+        caller_id = getattr(request.user, "id", None)
+        version = await self.cache.aget(self._version_key(resource, resource_id), 0)
+        key = self._entry_key(resource, resource_id, caller_id, version, variant)
+        entry = await self.cache.aget(key)
+        if entry is not None and await self._acurrent(entry):
+            self._hit(entry)
+            return entry
+
+        flight = self._miss(resource, resource_id, request, version, variant)
+        body = await get_singleflight().ado(flight, build)
+        if body is None:
+            return None
+        entry = {"body": body, "etag": compute_etag(body),
+                 "stored_at": time.time()}
+        if depends_on is not None:
+            entry["depends"] = await self._aversions(
+                self._version_key(*dependency) for dependency in depends_on(body))
+        if not body.get("degraded"):
+            await self.cache.aset(key, entry, timeout=self.ttl)
+        return entry
+
+    def respond(self, request, entry, respond=None):
+        """
+        Build the response for a cache entry, honouring If-None-Match.
+
+        :param respond: Callable ``(body, status)`` building the response,
+                        DRF's ``Response`` by default
+        """
+        respond = respond or (lambda body, status: Response(body, status=status))
+        if etag_matches(request, entry["etag"]):
+            with self._lock:
+                self.not_modified += 1
+            response = respond(None, 304)
+        else:
+            response = respond(entry["body"], 200)
+        response["ETag"] = entry["etag"]
+        if entry["body"].get("degraded"):
+            response["Cache-Control"] = "no-store"
+        else:
+            response["Cache-Control"] = f"private, max-age={self.ttl}"
+        return response
+
+    def invalidate(self, resource, resource_id):
+        """Drop every caller's cached copy of a resource."""
+        key = self._version_key(resource, resource_id)
+        try:
+            self.cache.incr(key)
+        except ValueError:
+            # No version yet: start one above the implicit 0. Entries must
+            # outlive the version, so it is kept without expiry.
+            self.cache.set(key, 1, timeout=None)
+        with self._lock:
+            self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "not_modified": self.not_modified,
+                "invalidations": self.invalidations,
+                "served_age_avg": (self.served_age_total / self.hits
+                                   if self.hits else 0.0),
+                "served_age_max": self.served_age_max,
+            }
+
+
+_response_cache = None
+
+
+def get_response_cache():
+    global _response_cache
+    if _response_cache is None:
+        _response_cache = ResponseCache()
+    return _response_cache
@@ -1,14 +1,88 @@
 import graphene
 from graphene.types.generic import GenericScalar  # For dynamic user data
+from graphql import FieldNode, FragmentSpreadNode, InlineFragmentNode
+from graphql import value_from_ast_untyped
 import datetime
-import requests
+
+from .enrichment import EVENT
+
+
+# Fields of UserType that can be answered without fetching the user
+USER_KEY_FIELDS = {"id", "__typename"}
+
+
+def iter_fields(selection_set, info):
+    """Yield the field nodes of a selection set, expanding fragments."""
+    if selection_set is None:
+        return
+    for selection in selection_set.selections:
+        if isinstance(selection, FieldNode):
+            yield selection
+        elif isinstance(selection, InlineFragmentNode):
+            yield from iter_fields(selection.selection_set, info)
+        elif isinstance(selection, FragmentSpreadNode):
+            fragment = info.fragments.get(selection.name.value)
+            if fragment is not None:
+                yield from iter_fields(fragment.selection_set, info)
+
+
+def selects_user_data(field_node, info):
+    """Whether a UserType selection needs more than the user's ID."""
+    return any(node.name.value not in USER_KEY_FIELDS
+               for node in iter_fields(field_node.selection_set, info))
+
+
+def plan_operation(info):
+    """
+    Queue every event and user the operation will need, so that all
+    ``enrichedEvent`` fields (including aliases) share one batched event
+    fetch and one batched user fetch. Users are only queued for
+    ``organizer`` / ``participants`` selections that ask for user data.
+    """
+    loaders = info.context.loaders
+    if loaders.planned:
+        return
+    loaders.planned = True
+
+    requested = []
+    for node in iter_fields(info.operation.selection_set, info):
+        if node.name.value != "enrichedEvent":
+            continue
+        for argument in node.arguments:
+            if argument.name.value == "eventId":
+                event_id = value_from_ast_untyped(
+                    argument.value, info.variable_values)
+                requested.append((event_id, node))
+
+    events = loaders.events.load_many([event_id for event_id, _ in requested])
+
+    for event_id, node in requested:
+        event_data = events.get(event_id)
+        if event_data is None:
+            continue
+        for field in iter_fields(node.selection_set, info):
+            if not selects_user_data(field, info):
+                continue
+            name = field.name.value
+            if name in ("organizer", "participants"):
+                loaders.users.prefetch(EVENT.reference(name).ids(event_data))
 
 
 class UserType(graphene.ObjectType):
+    """Resolved from a user ID through the request's user loader."""
     id = graphene.Int()
     username = graphene.String()  # Replace with actual user fields
     email = graphene.String()  # Replace with actual user fields
 
+    def resolve_id(root, info):
+        return root
+
+    def resolve_username(root, info):
+        return (info.context.loaders.users.load(root) or {}).get("username")
+
+    def resolve_email(root, info):
+        return (info.context.loaders.users.load(root) or {}).get("email")
+
 
 class EnrichedEventType(graphene.ObjectType):
     id = graphene.Int()
@@ -19,6 +93,33 @@ class EnrichedEventType(graphene.ObjectType):
     organizer = graphene.Field(UserType)
     participants = graphene.List(UserType)
 
+    def resolve_datetime(root, info):
+        # Handle datetime conversion
+        datetime_str = root.get("datetime")
+        if not datetime_str:
+            return None
+        try:
+            return datetime.datetime.fromisoformat(
+                datetime_str.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+
+    def resolve_organizer(root, info):
+        organizer_id = EVENT.reference("organizer").value(root)
+        if organizer_id and selects_user_data(info.field_nodes[0], info):
+            # Unknown users resolve to null, as before
+            if info.context.loaders.users.load(organizer_id) is None:
+                return None
+        return organizer_id
+
+    def resolve_participants(root, info):
+        participant_ids = EVENT.reference("participants").ids(root)
+        if not selects_user_data(info.field_nodes[0], info):
+            return participant_ids
+        # Only list participants whose details could be resolved
+        users = info.context.loaders.users.load_many(participant_ids)
+        return [pid for pid in participant_ids if pid in users]
+
 
 class Query(graphene.ObjectType):
     enriched_event = graphene.Field(
@@ -27,72 +128,8 @@ class Query(graphene.ObjectType):
     )
 
     def resolve_enriched_event(self, info, event_id):
-        request = info.context.request
-        # print(f"headers = {info.context.request.headers}")
-        auth_token = request.headers.get('Authorization') if request else None
-
-        headers = {}
-        if auth_token:
-            headers["Authorization"] = auth_token
-
-        try:
-            # Retrieve event from the scheduling service (No auth if unnecessary)
-            event_response = requests.get(
-                f"http://localhost:8000/events/{event_id}/",
-                headers=headers  # Add Authorization only if the token is present
-            )
-            event_response.raise_for_status()
-            event_data = event_response.json()
-
-            # Handle datetime conversion
-            datetime_str = event_data.get("datetime")
-            if datetime_str:
-                try:
-                    event_datetime = datetime.datetime.fromisoformat(
-                        datetime_str.replace("Z", "+00:00"))
-                except ValueError:
-                    event_datetime = None
-            else:
-                event_datetime = None
-
-            # Collect unique user IDs
-            user_ids = set()
-            if event_data.get('organizer_profile'):
-                user_ids.add(event_data['organizer_profile'])
-            if event_data.get('participant_ids'):
-                user_ids.update(event_data['participant_ids'])
-
-            # Fetch user details
-            user_details = {}
-            for user_id in user_ids:
-                try:
-                    user_response = requests.get(
-                        f"http://localhost:8001/userinfo/{user_id}/",
-                        headers=headers  # Add Authorization only if the token is present
-                    )
-                    user_response.raise_for_status()
-                    user_details[user_id] = user_response.json()
-                except requests.RequestException as e:
-                    print(f"Failed to fetch user {user_id}: {e}")
-
-            # Enrich event data
-            enriched_event = {
-                "id": event_data["id"],
-                "title": event_data["title"],
-                "description": event_data.get("description"),
-                "datetime": event_datetime,
-                "location": event_data.get("location"),
-                "organizer": user_details.get(event_data.get("organizer_profile")),
-                "participants": [
-                    user_details.get(pid) for pid in event_data.get("participant_ids", [])
-                    if pid in user_details
-                ],
-            }
-            return enriched_event
-
-        except requests.RequestException as e:
-            print(f"Error retrieving event: {e}")
-            return None
+        plan_operation(info)
+        return info.context.loaders.events.load(event_id)
 
 
 schema = graphene.Schema(query=Query)
@@ -0,0 +1,265 @@
+"""
+Collapse concurrent identical aggregations into one.
+
+When an event is announced, hundreds of participants open it within seconds
+and every request misses the response cache at once. ``SingleFlight.do``
+lets the first request for a key (the leader) build the aggregate while the
+others wait for and share its result, so the upstream fan-out runs once.
+
+Within a process, followers wait on the leader's future (``ado`` is the
+same for the async views, with flights per event loop). With
+``SINGLEFLIGHT['SHARED_BACKEND']`` set, the leader also takes a short lock
+in that Django cache and publishes its result there, so leaders in other
+workers wait for it instead of building their own. A follower that waits
+past its deadline, or finds no result once the lock is released, builds the
+aggregate itself: the lock only saves work, it never blocks a request.
+
+Flights are keyed by resource and authorization scope. By default the scope
+is the caller, since aggregates are built with the caller's token; set
+``SCOPE_CLAIM`` to a token claim (e.g. a tenant or role claim) whose value
+determines what the upstream services return, to share flights between
+callers holding the same value.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+import uuid
+import weakref
+from concurrent.futures import Future, TimeoutError
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .resilience import remaining_budget
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULTS = {
+    # Token claim flights are shared by, or None for one flight per caller
+    'SCOPE_CLAIM': None,
+    # Optional Django cache alias coordinating workers, e.g. 'default'
+    'SHARED_BACKEND': None,
+    # Longest a cross-worker lock is held if its leader dies
+    'LOCK_TIMEOUT': 10,
+    # Seconds a published result stays available to late followers
+    'RESULT_TTL': 5,
+    # Longest a follower waits, within the request's deadline
+    'WAIT_TIMEOUT': 10.0,
+    'POLL_INTERVAL': 0.05,
+}
+
+
+def singleflight_setting(name):
+    return getattr(settings, 'SINGLEFLIGHT', {}).get(name, DEFAULTS[name])
+
+
+def authorization_scope(request):
+    """:return: The part of the caller's authorization aggregates depend on"""
+    claim = singleflight_setting('SCOPE_CLAIM')
+    if claim and request.auth is not None:
+        value = request.auth.get(claim)
+        if value is not None:
+            return f"{claim}={value}"
+    return f"user={getattr(request.user, 'id', None)}"
+
+
+class SingleFlight:
+    """
+    :param shared_backend: Optional Django cache alias shared by workers
+    """
+
+    key_prefix = "composite:flight"
+
+    def __init__(self, shared_backend=None):
+        self.shared_backend = shared_backend
+        # key -> Future of the leader's result
+        self._flights = {}
+        # event loop -> {key: asyncio.Future of the leader's result}
+        self._async_flights = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self.led = 0
+        self.shared = 0
+        self.shared_remote = 0
+
+    @classmethod
+    def from_settings(cls):
+        return cls(shared_backend=singleflight_setting('SHARED_BACKEND'))
+
+    def _wait_timeout(self):
+        budget = remaining_budget()
+        timeout = singleflight_setting('WAIT_TIMEOUT')
+        return timeout if budget is None else max(0.0, min(timeout, budget))
+
+    def do(self, key, func):
+        """
+        Call ``func`` unless a call for the same key is already in progress,
+        in which case wait for and return its result.
+
+        :raises: Whatever the leader's call raised
+        """
+        with self._lock:
+            future = self._flights.get(key)
+            leader = future is None
+            if leader:
+                future = self._flights[key] = Future()
+                self.led += 1
+            else:
+                self.shared += 1
+
+        if not leader:
+            try:
+                return future.result(timeout=self._wait_timeout())
+            except TimeoutError:
+                logger.warning("Gave up waiting for flight %s", key)
+                return func()
+
+        try:
+            result = self._run(key, func)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+        return result
+
+    async def ado(self, key, func):
+        """
+        ``do`` for a coroutine function, sharing flights between the tasks
+        of the running event loop.
+
+        :raises: Whatever the leader's call raised
+        """
+        loop = asyncio.get_running_loop()
+        flights = self._async_flights.setdefault(loop, {})
+        future = flights.get(key)
+        if future is not None:
+            with self._lock:
+                self.shared += 1
+            try:
+                return await asyncio.wait_for(asyncio.shield(future),
+                                              self._wait_timeout())
+            except asyncio.TimeoutError:
+                logger.warning("Gave up waiting for flight %s", key)
+                return await func()
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                # The leader's request went away, not ours
+                return await func()
+
+        future = flights[key] = loop.create_future()
+        with self._lock:
+            self.led += 1
+        try:
+            result = await self._arun(key, func)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Followers are optional: don't log it as never retrieved
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+        finally:
+            flights.pop(key, None)
+        return result
+
+    def _run(self, key, func):
+        if not self.shared_backend:
+            return func()
+
+        cache = caches[self.shared_backend]
+        lock_key = f"{self.key_prefix}:lock:{key}"
+        result_key = f"{self.key_prefix}:result:{key}"
+        owner = uuid.uuid4().hex
+        deadline = time.monotonic() + self._wait_timeout()
+        waited = False
+        while not cache.add(lock_key, owner,
+                            timeout=singleflight_setting('LOCK_TIMEOUT')):
+            # Another worker leads: wait for it to release the lock
+            waited = True
+            if time.monotonic() >= deadline:
+                return func()
+            time.sleep(singleflight_setting('POLL_INTERVAL'))
+
+        if waited:
+            # The lock went away: its leader has most likely just published
+            result = cache.get(result_key)
+            if result is not None:
+                cache.delete(lock_key)
+                with self._lock:
+                    self.shared_remote += 1
+                return result
+
+        try:
+            result = func()
+            if result is not None:
+                cache.set(result_key, result,
+                          timeout=singleflight_setting('RESULT_TTL'))
+            return result
+        finally:
+            if cache.get(lock_key) == owner:
+                cache.delete(lock_key)
+
+    async def _arun(self, key, func):
+        if not self.shared_backend:
+            return await func()
+
+        cache = caches[self.shared_backend]
+        lock_key = f"{self.key_prefix}:lock:{key}"
+        result_key = f"{self.key_prefix}:result:{key}"
+        owner = uuid.uuid4().hex
+        deadline = time.monotonic() + self._wait_timeout()
+        waited = False
+        while not await cache.aadd(lock_key, owner,
+                                   timeout=singleflight_setting('LOCK_TIMEOUT')):
+            waited = True
+            if time.monotonic() >= deadline:
+                return await func()
+            await asyncio.sleep(singleflight_setting('POLL_INTERVAL'))
+
+        if waited:
+            result = await cache.aget(result_key)
+            if result is not None:
+                await cache.adelete(lock_key)
+                with self._lock:
+                    self.shared_remote += 1
+                return result
+
+        try:
+            result = await func()
+            if result is not None:
+                await cache.aset(result_key, result,
+                                 timeout=singleflight_setting('RESULT_TTL'))
+            return result
+        finally:
+            if await cache.aget(lock_key) == owner:
+                await cache.adelete(lock_key)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "led": self.led,
+                "shared": self.shared,
+                "shared_remote": self.shared_remote,
+                "in_flight": len(self._flights) + sum(
+                    len(flights) for flights in list(self._async_flights.values())),
+            }
+
+
+_singleflight = None
+
+
+def get_singleflight():
+    global _singleflight
+    if _singleflight is None:
+        _singleflight = SingleFlight.from_settings()
+    return _singleflight
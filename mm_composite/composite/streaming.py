@@ -0,0 +1,105 @@
+"""
+Partial-response streaming for enriched aggregates.
+
+Clients opt in with ``?stream=ndjson`` or ``?stream=sse``. Instead of one JSON
+document built after the slowest user lookup, the response is a sequence of
+records:
+
+* the core resource(s) first (``event`` records, plus a ``page`` record on
+  list endpoints), exactly as returned by the scheduling service,
+* one ``user`` record per referenced user as soon as its lookup resolves,
+* a final ``trailer`` record listing the users that could not be resolved.
+
+Clients join users to events by ID. Nothing is buffered, so worker memory
+stays flat however large the event is.
+"""
+
+from django.http import StreamingHttpResponse
+
+from . import jsoncodec
+
+
+STREAM_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "sse": "text/event-stream",
+}
+
+
+def stream_format(request):
+    """
+    :return: The requested stream format, or None for a regular response
+    """
+    # Works for DRF and plain Django (async view) requests alike
+    fmt = getattr(request, "query_params", request.GET).get("stream")
+    return fmt if fmt in STREAM_FORMATS else None
+
+
+def encode_record(fmt, record_type, data):
+    if fmt == "sse":
+        return (f"event: {record_type}\ndata: ".encode("utf-8")
+                + jsoncodec.encode(data) + b"\n\n")
+    return jsoncodec.dumps({"type": record_type, "data": data}) + b"\n"
+
+
+def enrichment_records(head, user_ids, user_client):
+    """
+    Yield ``(type, data)`` records: the head records, then users as they
+    resolve, then the trailer.
+
+    :param head: Iterable of ``(type, data)`` records sent first
+    :param user_ids: User IDs referenced by the head records
+    :param user_client: ``UserInfoClient`` for the request
+    """
+    yield from head
+
+    resolved, failures = 0, []
+    for user_id, details, error in user_client.iter_many(user_ids):
+        if error is None and details is not None:
+            resolved += 1
+            yield "user", details
+        else:
+            failures.append({"id": user_id, "error": str(error)})
+
+    yield "trailer", {"resolved": resolved, "failures": failures}
+
+
+async def aenrichment_records(head, user_ids, user_client):
+    """
+    Async generator version of ``enrichment_records``, for an
+    ``AsyncUserInfoClient``.
+    """
+    for record in head:
+        yield record
+
+    resolved, failures = 0, []
+    async for user_id, details, error in user_client.iter_many(user_ids):
+        if error is None and details is not None:
+            resolved += 1
+            yield "user", details
+        else:
+            failures.append({"id": user_id, "error": str(error)})
+
+    yield "trailer", {"resolved": resolved, "failures": failures}
+
+
+async def aencode_records(fmt, records):
+    async for record_type, data in records:
+        yield encode_record(fmt, record_type, data)
+
+
+def streaming_response(fmt, records):
+    """
+    Stream ``(type, data)`` records in the given format.
+
+    :param records: Iterable, or async iterable for the async views
+    """
+    if hasattr(records, "__aiter__"):
+        content = aencode_records(fmt, records)
+    else:
+        content = (encode_record(fmt, record_type, data)
+                   for record_type, data in records)
+    response = StreamingHttpResponse(content, content_type=STREAM_FORMATS[fmt])
+    response["Cache-Control"] = "no-cache"
+    # Stop reverse proxies from buffering the stream
+    response["X-Accel-Buffering"] = "no"
+    return response
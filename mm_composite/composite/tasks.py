@@ -0,0 +1,346 @@
+"""
+Background work queue for jobs that should not hold up a response.
+
+A job is the dotted path of a function plus a JSON-serialisable payload. It
+is executed by a pool of worker threads; failures are retried with
+exponential backoff and jobs that exhaust their retries are moved to a
+dead-letter store. The storage backend is pluggable through ``TASK_QUEUE``:
+
+* ``ThreadQueueBackend`` keeps jobs in memory (development).
+* ``SqliteQueueBackend`` keeps jobs in a local SQLite file so they survive
+  restarts, and can also be drained by ``manage.py runworkers``.
+"""
+
+import collections
+import json
+import logging
+import queue
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULTS = {
+    'BACKEND': 'composite.tasks.ThreadQueueBackend',
+    # Worker threads started in the web process (0 to leave jobs for
+    # ``manage.py runworkers``; SQLite backend only)
+    'WORKERS': 4,
+    # Jobs waiting to run before enqueue raises QueueFull
+    'MAX_DEPTH': 1000,
+    'MAX_RETRIES': 5,
+    # Delay before retry n is BACKOFF_BASE * 2 ** (n - 1), capped at BACKOFF_MAX
+    'BACKOFF_BASE': 1.0,
+    'BACKOFF_MAX': 60.0,
+    # Dead-lettered jobs kept by the in-memory backend
+    'DEAD_LETTER_SIZE': 1000,
+    'SQLITE_PATH': 'taskqueue.sqlite3',
+    # How often idle SQLite workers look for new jobs (seconds)
+    'POLL_INTERVAL': 0.5,
+    # A job whose lease was last renewed longer ago than this (seconds) is
+    # assumed to belong to a dead worker and is handed out again; running
+    # jobs renew it every third of that
+    'LEASE_TIMEOUT': 300,
+}
+
+
+def task_queue_setting(name):
+    return getattr(settings, 'TASK_QUEUE', {}).get(name, DEFAULTS[name])
+
+
+class QueueFull(Exception):
+    """Raised by ``enqueue`` when the queue is at ``MAX_DEPTH``."""
+
+
+class Retry(Exception):
+    """
+    Raised by a job to be retried with a different payload, e.g. to retry
+    only the part of the work that failed.
+    """
+
+    def __init__(self, payload, reason=""):
+        super().__init__(reason)
+        self.payload = payload
+
+
+def backoff_delay(attempts):
+    delay = task_queue_setting('BACKOFF_BASE') * 2 ** (attempts - 1)
+    return min(delay, task_queue_setting('BACKOFF_MAX'))
+
+
+def run_job(task, payload):
+    """
+    Execute one job.
+
+    :return: ``(payload, error)``; error is None on success, payload is the
+             payload to retry with
+    """
+    try:
+        import_string(task)(payload)
+    except Retry as e:
+        return e.payload, e
+    except Exception as e:
+        return payload, e
+    return payload, None
+
+
+class ThreadQueueBackend:
+    """In-memory queue drained by worker threads in this process."""
+
+    durable = False
+
+    def __init__(self):
+        self.max_retries = task_queue_setting('MAX_RETRIES')
+        self._queue = queue.Queue(maxsize=task_queue_setting('MAX_DEPTH'))
+        self._dead_letters = collections.deque(
+            maxlen=task_queue_setting('DEAD_LETTER_SIZE'))
+        self._started = False
+        self._start_lock = threading.Lock()
+
+    def enqueue(self, task, payload, attempts=0):
+        self.start()
+        try:
+            self._queue.put_nowait((task, payload, attempts))
+        except queue.Full:
+            raise QueueFull(f"Task queue is full, cannot enqueue {task}")
+
+    def depth(self):
+        return self._queue.qsize()
+
+    def dead_letters(self):
+        return list(self._dead_letters)
+
+    def start(self):
+        if self._started:
+            return
+        with self._start_lock:
+            if self._started:
+                return
+            for i in range(task_queue_setting('WORKERS')):
+                threading.Thread(target=self._work, daemon=True,
+                                 name=f"composite-task-{i}").start()
+            self._started = True
+
+    def _work(self):
+        while True:
+            task, payload, attempts = self._queue.get()
+            try:
+                self._run(task, payload, attempts)
+            finally:
+                self._queue.task_done()
+
+    def _run(self, task, payload, attempts):
+        payload, error = run_job(task, payload)
+        if error is None:
+            return
+        attempts += 1
+        if attempts > self.max_retries:
+            logger.error("Task %s failed permanently: %s", task, error)
+            self._dead_letters.append({
+                "task": task, "payload": payload,
+                "attempts": attempts, "error": str(error),
+            })
+            return
+        logger.warning("Task %s failed (attempt %d), retrying: %s",
+                       task, attempts, error)
+        timer = threading.Timer(backoff_delay(attempts), self._requeue,
+                                args=(task, payload, attempts))
+        timer.daemon = True
+        timer.start()
+
+    def _requeue(self, task, payload, attempts):
+        try:
+            self._queue.put_nowait((task, payload, attempts))
+        except queue.Full:
+            self._dead_letters.append({
+                "task": task, "payload": payload,
+                "attempts": attempts, "error": "queue full on retry",
+            })
+
+
+class SqliteQueueBackend:
+    """
+    Durable queue in a local SQLite file, safe to share between the web
+    process and ``manage.py runworkers``. Jobs left ``running`` by a crashed
+    worker are handed out again once their lease expires; a live worker
+    keeps renewing the lease of the job it runs, however long it takes.
+    """
+
+    durable = True
+
+    schema = """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            task TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            run_at REAL NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            claimed_at REAL,
+            last_error TEXT
+        );
+        CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, run_at);
+    """
+
+    def __init__(self, path=None):
+        self.path = str(path or task_queue_setting('SQLITE_PATH'))
+        self.max_retries = task_queue_setting('MAX_RETRIES')
+        self.max_depth = task_queue_setting('MAX_DEPTH')
+        self.poll_interval = task_queue_setting('POLL_INTERVAL')
+        self.lease_timeout = task_queue_setting('LEASE_TIMEOUT')
+        self._local = threading.local()
+        self._started = False
+        self._start_lock = threading.Lock()
+        with self._connect() as conn:
+            conn.executescript(self.schema)
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30,
+                                   isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def enqueue(self, task, payload, attempts=0):
+        conn = self._connect()
+        if self.depth() >= self.max_depth:
+            raise QueueFull(f"Task queue is full, cannot enqueue {task}")
+        conn.execute(
+            "INSERT INTO jobs (task, payload, attempts, run_at) VALUES (?, ?, ?, ?)",
+            (task, json.dumps(payload), attempts, time.time()))
+        if task_queue_setting('WORKERS'):
+            self.start()
+
+    def depth(self):
+        (count,) = self._connect().execute(
+            "SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()
+        return count
+
+    def dead_letters(self):
+        rows = self._connect().execute(
+            "SELECT task, payload, attempts, last_error FROM jobs "
+            "WHERE status = 'dead' ORDER BY id").fetchall()
+        return [
+            {"task": task, "payload": json.loads(payload),
+             "attempts": attempts, "error": error}
+            for task, payload, attempts, error in rows
+        ]
+
+    def start(self, workers=None, block=False):
+        with self._start_lock:
+            if self._started:
+                return
+            self._started = True
+            if workers is None:
+                workers = task_queue_setting('WORKERS')
+            threads = [
+                threading.Thread(target=self._work, daemon=True,
+                                 name=f"composite-task-{i}")
+                for i in range(workers)
+            ]
+            for thread in threads:
+                thread.start()
+        if block:
+            for thread in threads:
+                thread.join()
+
+    def _claim(self):
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT id, task, payload, attempts FROM jobs "
+                "WHERE (status = 'queued' AND run_at <= ?) "
+                "OR (status = 'running' AND claimed_at < ?) "
+                "ORDER BY run_at, id LIMIT 1",
+                (now, now - self.lease_timeout)).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', claimed_at = ? "
+                    "WHERE id = ?", (now, row[0]))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return row
+
+    def _work(self):
+        while True:
+            try:
+                row = self._claim()
+            except sqlite3.Error as e:
+                logger.error("Task queue unavailable: %s", e)
+                row = None
+            if row is None:
+                time.sleep(self.poll_interval)
+                continue
+            self._run(*row)
+
+    def _renew_lease(self, job_id, done):
+        while not done.wait(self.lease_timeout / 3):
+            try:
+                self._connect().execute(
+                    "UPDATE jobs SET claimed_at = ? "
+                    "WHERE id = ? AND status = 'running'", (time.time(), job_id))
+            except sqlite3.Error as e:
+                logger.warning("Could not renew the lease of job %s: %s",
+                               job_id, e)
+
+    def _run(self, job_id, task, payload, attempts):
+        done = threading.Event()
+        threading.Thread(target=self._renew_lease, args=(job_id, done),
+                         daemon=True, name=f"composite-lease-{job_id}").start()
+        try:
+            payload, error = run_job(task, json.loads(payload))
+        finally:
+            done.set()
+        conn = self._connect()
+        if error is None:
+            conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+            return
+        attempts += 1
+        if attempts > self.max_retries:
+            logger.error("Task %s failed permanently: %s", task, error)
+            conn.execute(
+                "UPDATE jobs SET status = 'dead', attempts = ?, payload = ?, "
+                "last_error = ? WHERE id = ?",
+                (attempts, json.dumps(payload), str(error), job_id))
+            return
+        logger.warning("Task %s failed (attempt %d), retrying: %s",
+                       task, attempts, error)
+        conn.execute(
+            "UPDATE jobs SET status = 'queued', attempts = ?, payload = ?, "
+            "last_error = ?, run_at = ? WHERE id = ?",
+            (attempts, json.dumps(payload), str(error),
+             time.time() + backoff_delay(attempts), job_id))
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_queue():
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                _queue = import_string(task_queue_setting('BACKEND'))()
+    return _queue
+
+
+def enqueue(task, payload):
+    """
+    Queue ``task(payload)`` to run in the background.
+
+    :param task: Dotted path of the function to call
+    :param payload: JSON-serialisable argument passed to the function
+    :raises QueueFull: When the queue is at its configured depth
+    """
+    get_queue().enqueue(task, payload)
@@ -0,0 +1,95 @@
+import asyncio
+import json
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+from django.urls import path
+
+from composite import async_views, changes
+from composite.util import RemoteJWTAuthentication
+
+from .utils import StubServicesMixin, auth
+
+
+def headers(**extra):
+    """:return: ``AsyncClient`` headers authenticating as the benchmark user"""
+    return {"Authorization": auth()["HTTP_AUTHORIZATION"], **extra}
+
+
+urlpatterns = [
+    path('postevent/', async_views.AsyncEventCreateView.as_view()),
+    path('getevent/<int:event_id>/', async_views.AsyncEnrichedEventView.as_view()),
+    path('getavailability/<int:availability_id>/',
+         async_views.AsyncEnrichedAvailabilityView.as_view()),
+]
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class AsyncViewTests(StubServicesMixin, SimpleTestCase):
+    async def test_enriched_event(self):
+        response = await self.async_client.get("/getevent/10/", headers=headers())
+        self.assertEqual(response.status_code, 200)
+        event = json.loads(response.content)
+        self.assertEqual(len(event["participants"]), 3)
+        self.assertEqual(event["organizer"]["id"], 1)
+
+    async def test_cached_with_etag(self):
+        first = await self.async_client.get("/getevent/10/", headers=headers())
+        second = await self.async_client.get(
+            "/getevent/10/", headers=headers(**{"If-None-Match": first["ETag"]}))
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(second.content, b"")
+        self.assertEqual(second["ETag"], first["ETag"])
+        self.assertEqual(self.calls("scheduling"), 1)
+
+    async def test_concurrent_misses_share_one_build(self):
+        self.stub_config.latency = 0.1
+        caller = headers()
+        responses = await asyncio.gather(*(
+            self.async_client.get("/getavailability/3/", headers=caller)
+            for _ in range(3)))
+        self.assertEqual([response.status_code for response in responses],
+                         [200] * 3)
+        self.assertEqual(self.calls("scheduling"), 1)
+
+    async def test_stream(self):
+        response = await self.async_client.get(
+            "/getevent/10/", {"stream": "ndjson"}, headers=headers())
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        body = b"".join([chunk async for chunk in response.streaming_content])
+        records = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual(records[0]["type"], "event")
+        self.assertEqual([record["type"] for record in records[1:]],
+                         ["user"] * 4 + ["trailer"])
+        self.assertEqual(records[-1]["data"], {"resolved": 4, "failures": []})
+
+    async def test_token_checks_run_off_the_event_loop(self):
+        loops = []
+        validate = RemoteJWTAuthentication.get_validated_token
+
+        def get_validated_token(authenticator, raw_token):
+            try:
+                loops.append(asyncio.get_running_loop())
+            except RuntimeError:
+                loops.append(None)
+            return validate(authenticator, raw_token)
+
+        with mock.patch.object(RemoteJWTAuthentication, "get_validated_token",
+                               get_validated_token):
+            response = await self.async_client.get(
+                "/getavailability/3/", headers=headers())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(loops, [None])
+
+    async def test_unauthenticated(self):
+        response = await self.async_client.get("/getevent/10/")
+        self.assertEqual(response.status_code, 401)
+
+    async def test_created_events_evict_the_event_listing(self):
+        with mock.patch.object(changes, "evict_upstream") as evict, \
+                mock.patch.object(async_views.invitations, "dispatch_event_emails"):
+            response = await self.async_client.post(
+                "/postevent/", {"title": "T"}, content_type="application/json",
+                headers=headers())
+        self.assertEqual(response.status_code, 201)
+        evict.assert_any_call("scheduling", "/events/")
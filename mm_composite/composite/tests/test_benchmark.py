@@ -0,0 +1,75 @@
+import io
+import itertools
+import json
+from unittest import mock
+
+import requests
+from django.core.management import call_command
+from django.test import SimpleTestCase
+
+from composite.benchmark import driver
+from composite.benchmark.stubs import StubConfig, user, user_service
+
+
+class StubServiceTests(SimpleTestCase):
+    def setUp(self):
+        self.config = StubConfig(latency=0, jitter=0)
+        self.stub = user_service(self.config).start()
+        self.addCleanup(self.stub.stop)
+
+    def test_answers_and_counts_calls_per_route(self):
+        response = requests.get(self.stub.base_url + "/userinfo/5/")
+        requests.get(self.stub.base_url + "/userinfo/6/")
+        self.assertEqual(response.json(), user(5))
+        self.assertEqual(self.stub.snapshot(), {"GET /userinfo/{id}/": 2})
+        self.stub.reset()
+        self.assertEqual(self.stub.total_calls(), 0)
+
+    def test_injects_failures(self):
+        self.config.error_rate = 1.0
+        response = requests.get(self.stub.base_url + "/userinfo/5/")
+        self.assertEqual(response.status_code, 503)
+
+    def test_unknown_route(self):
+        response = requests.get(self.stub.base_url + "/nothing/")
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.stub.total_calls(), 0)
+
+
+class DriverTests(SimpleTestCase):
+    def test_percentile(self):
+        values = [float(n) for n in range(1, 101)]
+        self.assertEqual(driver.percentile(values, 0.5), 50.0)
+        self.assertEqual(driver.percentile(values, 0.99), 99.0)
+        self.assertEqual(driver.percentile([], 0.5), 0.0)
+
+    def test_result_reports_calls_per_request(self):
+        result = driver.Result("getevent", 2, [0.2, 0.1], 0, 0.5,
+                               {"users": 6, "scheduling": 2})
+        summary = result.as_dict()
+        self.assertEqual(summary["requests"], 2)
+        self.assertEqual(summary["throughput"], 4.0)
+        self.assertEqual(summary["p50_ms"], 100.0)
+        self.assertEqual(summary["upstream_calls_per_request"],
+                         {"scheduling": 1.0, "users": 3.0})
+
+
+class BenchmarkCommandTests(SimpleTestCase):
+    def test_runs_every_scenario_at_every_concurrency(self):
+        out = io.StringIO()
+        # Distinct IDs, so no request is answered from the response cache
+        ids = itertools.count(1)
+        with mock.patch.object(driver.random, "randint",
+                               lambda low, high: next(ids)):
+            call_command("benchmark", scenarios="getevent,getavailability",
+                         concurrency=[1, 2], requests=4, latency=0, jitter=0,
+                         participants=2, json=True, stdout=out)
+        results = json.loads(out.getvalue())
+        self.assertEqual([(result["scenario"], result["concurrency"])
+                          for result in results],
+                         [("getevent", 1), ("getevent", 2),
+                          ("getavailability", 1), ("getavailability", 2)])
+        for result in results:
+            self.assertEqual(result["requests"], 4)
+            self.assertEqual(result["errors"], 0)
+            self.assertEqual(result["upstream_calls_per_request"]["scheduling"], 1)
@@ -0,0 +1,97 @@
+import hashlib
+import hmac
+import json
+
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from composite import changes, users
+from composite.changes import InvalidChange
+
+from .utils import StubServicesMixin, auth
+
+
+def sign(secret, body):
+    return "sha256=" + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+@override_settings(CHANGE_NOTIFICATIONS={'SOURCES': {
+    'scheduling': {'SECRET': 's3cret', 'RESOURCES': ['event']}}})
+class ChangeWebhookTests(TestCase):
+    body = json.dumps({"resource": "event", "id": 1}).encode()
+
+    def post(self, body, signature, source="scheduling"):
+        return self.client.post("/webhooks/changes/", body,
+                                content_type="application/json",
+                                HTTP_X_WEBHOOK_SOURCE=source,
+                                HTTP_X_WEBHOOK_SIGNATURE=signature)
+
+    def test_signed_notification_is_applied(self):
+        response = self.post(self.body, sign("s3cret", self.body))
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json(), {"applied": 1})
+
+    def test_bad_signature_is_rejected(self):
+        response = self.post(self.body, sign("other", self.body))
+        self.assertEqual(response.status_code, 403)
+
+    def test_unknown_source_is_rejected(self):
+        response = self.post(self.body, sign("s3cret", self.body), source="users")
+        self.assertEqual(response.status_code, 403)
+
+    def test_resource_outside_source_is_rejected(self):
+        body = json.dumps({"resource": "user", "id": 1}).encode()
+        response = self.post(body, sign("s3cret", body))
+        self.assertEqual(response.status_code, 403)
+
+    def test_malformed_notification(self):
+        body = json.dumps({"resource": "event"}).encode()
+        response = self.post(body, sign("s3cret", body))
+        self.assertEqual(response.status_code, 400)
+
+
+class ParseChangesTests(SimpleTestCase):
+    def test_single_and_batched(self):
+        self.assertEqual(
+            changes.parse_changes({"resource": "user", "id": 7}),
+            [("user", 7, "updated", None)])
+        self.assertEqual(
+            changes.parse_changes({"changes": [
+                {"resource": "event", "id": 1, "action": "deleted"},
+                {"resource": "user", "id": 2, "data": {"id": 2}}]}),
+            [("event", 1, "deleted", None), ("user", 2, "updated", {"id": 2})])
+
+    def test_invalid(self):
+        for payload in ({"resource": "venue", "id": 1},
+                        {"resource": "user", "id": 1, "action": "renamed"},
+                        {"changes": ["user"]}):
+            with self.subTest(payload=payload), self.assertRaises(InvalidChange):
+                changes.parse_changes(payload)
+
+
+@override_settings(USER_SERVICE={'CACHE_BACKEND': 'default'})
+class ApplyChangesTests(StubServicesMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.headers = auth()
+
+    def test_event_changes_retire_cached_aggregates(self):
+        self.client.get("/getevent/10/", **self.headers)
+        changes.apply_changes([("event", 10, "updated", None)])
+        self.client.get("/getevent/10/", **self.headers)
+        self.assertEqual(self.calls("scheduling", "GET /events/{id}/"), 2)
+
+    def test_user_changes_retire_aggregates_embedding_them(self):
+        self.client.get("/getevent/10/", **self.headers)
+        changes.apply_changes([("user", 12, "updated", None)])
+        self.client.get("/getevent/10/", **self.headers)
+        self.assertEqual(self.calls("scheduling", "GET /events/{id}/"), 2)
+        # Only the evicted profile is fetched again
+        self.assertEqual(self.calls("users", "GET /userinfo/{id}/"), 5)
+
+    def test_sent_profiles_replace_cached_ones(self):
+        users.cache_users({7: {"id": 7, "username": "old"}})
+        changes.apply_changes(
+            [("user", 7, "updated", {"id": 7, "username": "new"})])
+        self.assertEqual(users.cached_users([7])[7]["username"], "new")
+        changes.apply_changes([("user", 7, "deleted", None)])
+        self.assertEqual(users.cached_users([7]), {})
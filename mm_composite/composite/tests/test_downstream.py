@@ -0,0 +1,60 @@
+import requests
+from django.conf import settings
+from django.test import SimpleTestCase, override_settings
+
+from composite import downstream
+
+from .utils import StubServicesMixin
+
+
+class DownstreamTests(StubServicesMixin, SimpleTestCase):
+    def configure(self, service, **config):
+        """Change one service's settings for the rest of the test."""
+        services = override_settings(DOWNSTREAM_SERVICES={
+            **settings.DOWNSTREAM_SERVICES,
+            service: {**settings.DOWNSTREAM_SERVICES[service], **config}})
+        services.enable()
+        self.addCleanup(services.disable)
+        downstream._sessions.clear()
+
+    def test_one_pooled_session_per_service(self):
+        session = downstream.get_session("users")
+        self.assertIs(downstream.get_session("users"), session)
+        self.assertIsNot(downstream.get_session("scheduling"), session)
+        adapter = session.get_adapter(self.stubs["users"].base_url)
+        self.assertEqual(adapter._pool_maxsize,
+                         settings.DOWNSTREAM_SERVICES["users"]["POOL_SIZE"])
+
+    def test_paths_resolve_against_the_service(self):
+        response = downstream.get("users", "/userinfo/3/")
+        self.assertEqual(response.json()["id"], 3)
+        self.assertEqual(response.url, self.stubs["users"].base_url + "/userinfo/3/")
+
+    def test_unknown_service(self):
+        with self.assertRaises(KeyError):
+            downstream.get("billing", "/")
+
+    def test_idempotent_requests_are_retried(self):
+        self.configure("users", RETRIES=2, BACKOFF_FACTOR=0)
+        self.stub_config.error_rate = 1.0
+        response = downstream.get("users", "/userinfo/3/")
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(self.calls("users"), 3)
+
+    def test_posts_are_not_retried(self):
+        self.configure("scheduling", RETRIES=2, BACKOFF_FACTOR=0)
+        self.stub_config.error_rate = 1.0
+        downstream.post("scheduling", "/events/", json={"title": "T"})
+        self.assertEqual(self.calls("scheduling"), 1)
+
+    def test_read_timeout(self):
+        self.configure("users", READ_TIMEOUT=0.05)
+        self.stub_config.latency = 0.3
+        with self.assertRaisesRegex(requests.RequestException, "Read timed out"):
+            downstream.get("users", "/userinfo/3/")
+
+    def test_decode_raises_like_response_json(self):
+        response = requests.Response()
+        response._content = b"not json"
+        with self.assertRaises(requests.JSONDecodeError):
+            downstream.decode(response)
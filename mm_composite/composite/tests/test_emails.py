@@ -0,0 +1,73 @@
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+from django.utils.html import escape
+
+from composite import emails
+from composite.emails import InvitationRenderer, SplitTemplate
+
+EVENT = {"id": 1, "title": "Launch <party>", "description": "Cake",
+         "datetime": "2026-01-01T10:00:00Z", "location": "Room 1"}
+
+
+class SplitTemplateTests(SimpleTestCase):
+    def test_renders_values_between_literals(self):
+        template = SplitTemplate("  Hi \x00first_name\x00, see \x00first_name\x00!\n")
+        self.assertEqual(template.render({"first_name": "Ann"}), "Hi Ann, see Ann!")
+
+    def test_without_fields(self):
+        self.assertEqual(SplitTemplate("Hello").render({}), "Hello")
+
+    def test_field_at_edges(self):
+        template = SplitTemplate("\x00first_name\x00")
+        self.assertEqual(template.render({"first_name": "Ann"}), "Ann")
+
+    def test_values_are_escaped(self):
+        template = SplitTemplate("<p>\x00first_name\x00</p>", escape)
+        self.assertEqual(template.render({"first_name": "<b>&"}),
+                         "<p>&lt;b&gt;&amp;</p>")
+
+
+class InvitationRendererTests(SimpleTestCase):
+    def test_event_is_rendered_once_for_all_recipients(self):
+        renderer = InvitationRenderer()
+        with mock.patch.object(emails, "EventInvitation",
+                               wraps=emails.EventInvitation) as invitation:
+            email = renderer.for_event(EVENT)
+            sent = [email({"email": f"user{n}@example.com", "first_name": f"U{n}"})
+                    for n in range(3)]
+        invitation.assert_called_once()
+        self.assertEqual(sent[2]["subject"], "New Event Invitation: Launch <party>")
+        self.assertTrue(sent[2]["body"].startswith("Hi U2,\n"))
+        self.assertIn("Event: Launch <party>\n", sent[2]["body"])
+        self.assertEqual(sent[2]["recipient_list"], "user2@example.com")
+        self.assertNotIn("html_message", sent[2])
+
+    def test_missing_names_get_the_default_greeting(self):
+        email = InvitationRenderer().for_event(EVENT)({"email": "a@example.com"})
+        self.assertTrue(email["body"].startswith("Hi Participant,"))
+
+    @override_settings(INVITATIONS={'HTML_TEMPLATE': 'composite/invitation.html'})
+    def test_html_bodies_escape_event_and_recipient_fields(self):
+        email = InvitationRenderer().for_event(EVENT)(
+            {"email": "a@example.com", "first_name": "<Ann>"})
+        self.assertIn("<p>Hi &lt;Ann&gt;,</p>", email["html_message"])
+        self.assertIn("<td>Launch &lt;party&gt;</td>", email["html_message"])
+
+    def test_one_rendering_per_locale(self):
+        renderer = InvitationRenderer()
+        with mock.patch.object(emails, "EventInvitation",
+                               wraps=emails.EventInvitation) as invitation:
+            email = renderer.for_event({**EVENT, "locale": "en"})
+            for locale in ("de", None, "de", "en"):
+                email({"email": "a@example.com", "locale": locale})
+        self.assertEqual([call.args[2] for call in invitation.call_args_list],
+                         ["de", "en"])
+
+    def test_templates_are_compiled_once(self):
+        with mock.patch.object(emails, "get_template",
+                               wraps=emails.get_template) as get_template:
+            renderer = InvitationRenderer()
+            renderer.for_event(EVENT)({"email": "a@example.com"})
+            renderer.for_event({**EVENT, "id": 2})({"email": "a@example.com"})
+        self.assertEqual(get_template.call_count, 2)
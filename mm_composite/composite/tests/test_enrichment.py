@@ -0,0 +1,72 @@
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase
+
+from composite.enrichment import AVAILABILITY, EVENT, Enricher
+
+from .utils import StubServicesMixin
+
+
+def users(ids):
+    return {user_id: {"id": user_id, "username": f"user{user_id}"}
+            for user_id in ids if user_id != 404}
+
+
+class ResourceTests(SimpleTestCase):
+    def test_organizer_falls_back_to_organizer_profile(self):
+        self.assertEqual(EVENT.wanted({"organizer_profile": 7}), {"user": {7}})
+        self.assertEqual(
+            EVENT.wanted({"organizer_id": 5, "organizer_profile": 7,
+                          "participant_ids": [5, 6, None]}),
+            {"user": {5, 6}})
+
+    def test_unresolved_objects_degrade_the_document(self):
+        doc = EVENT.attach({"organizer_id": 1, "participant_ids": [1, 404]},
+                           {"user": users([1])})
+        self.assertEqual(doc["participants"][1], {"id": 404, "unresolved": True})
+        self.assertTrue(doc["degraded"])
+        self.assertEqual(EVENT.embedded(doc), [("user", 1), ("user", 1),
+                                               ("user", 404)])
+
+    def test_only_selected_references_are_attached(self):
+        doc = EVENT.attach({"organizer_id": 1, "participant_ids": [2]},
+                           {"user": users([1, 2])}, only={"organizer"})
+        self.assertEqual(doc["organizer"]["id"], 1)
+        self.assertNotIn("participants", doc)
+
+    def test_links(self):
+        doc = AVAILABILITY.attach({"participant_id": 2, "event_id": 9},
+                                  {"user": users([2])})
+        self.assertEqual(doc["event"], "http://localhost:8002/getevent/9/")
+        self.assertNotIn("degraded", doc)
+
+
+class EnricherTests(StubServicesMixin, TestCase):
+    def test_one_batched_lookup_across_resources(self):
+        enricher = Enricher()
+        loader = mock.Mock(side_effect=users)
+        enricher.loaders["user"] = loader
+        docs = enricher.enrich([
+            (EVENT, {"organizer_id": 1, "participant_ids": [2, 3]}),
+            (EVENT, {"organizer_profile": 3, "participant_ids": [404]}),
+            (AVAILABILITY, {"participant_id": 2}),
+        ])
+        loader.assert_called_once()
+        self.assertEqual(sorted(loader.call_args.args[0]), [1, 2, 3, 404])
+        self.assertEqual(docs[1]["organizer"]["username"], "user3")
+        self.assertTrue(docs[1]["degraded"])
+        self.assertEqual(docs[2]["participant"]["id"], 2)
+
+    def test_get_against_the_services(self):
+        event = Enricher().get(EVENT, 10)
+        self.assertEqual(event["organizer"]["username"], "user1")
+        self.assertEqual([user["id"] for user in event["participants"]],
+                         [11, 12, 13])
+        self.assertEqual(self.calls("scheduling"), 1)
+        self.assertEqual(self.calls("users", "GET /userinfo/{id}/"), 4)
+
+    def test_fetch_skips_missing_documents(self):
+        enricher = Enricher()
+        self.stub_config.error_rate = 1.0
+        with self.assertLogs("composite.enrichment", "WARNING"):
+            self.assertEqual(enricher.fetch(EVENT, [1, 2]), {})
@@ -0,0 +1,59 @@
+import json
+
+from django.test import SimpleTestCase, TestCase
+
+from composite.benchmark.stubs import event, user
+from composite.views import stream_event_page
+
+from .utils import StubServicesMixin, auth
+
+
+class StreamEventPageTests(SimpleTestCase):
+    def test_events_are_sent_as_their_users_resolve(self):
+        page = [event(10, 1), event(20, 1)]
+        progress = []
+
+        def lookups():
+            for user_id in (1, 11, 21):
+                progress.append(user_id)
+                yield user_id, user(user_id), None
+
+        chunks = stream_event_page({"count": 2}, page, lookups())
+        self.assertEqual(next(chunks), b'{"count":2,"results":[')
+        first = json.loads(next(chunks))
+        # Sent before the second event's participant was looked up
+        self.assertEqual(progress, [1, 11])
+        self.assertEqual(first["participants"], [user(11)])
+        self.assertEqual(first["organizer"], user(1))
+        rest = json.loads(b"[{}" + b"".join(chunks)[:-1])
+        self.assertEqual([event_data["id"] for event_data in rest[1:]], [20])
+
+    def test_unresolved_users_degrade_their_events(self):
+        page = [event(10, 1)]
+        chunks = stream_event_page({"count": 1}, page, iter([
+            (1, user(1), None), (11, None, LookupError("gone"))]))
+        document = json.loads(b"".join(chunks))
+        self.assertTrue(document["results"][0]["degraded"])
+
+
+class EnrichedEventListTests(StubServicesMixin, TestCase):
+    def test_page_is_enriched_with_shared_user_lookups(self):
+        response = self.client.get("/getevents/", {"limit": 25}, **auth())
+        self.assertEqual(response.status_code, 200)
+        document = json.loads(b"".join(response.streaming_content))
+        self.assertEqual(document["count"], 1000)
+        self.assertEqual(len(document["results"]), 25)
+        first = document["results"][0]
+        self.assertEqual(first["organizer"], user(1))
+        self.assertEqual([p["id"] for p in first["participants"]], [2, 3, 4])
+        # The organizer and participants 2 to 28, each fetched once
+        self.assertEqual(self.calls("users", "GET /userinfo/{id}/"), 28)
+        self.assertEqual(self.calls("scheduling", "GET /events/"), 1)
+
+    def test_scheduling_failure(self):
+        headers = auth()
+        # Resolves the caller before the services start failing
+        self.client.get("/getavailability/1/", **headers)
+        self.stub_config.error_rate = 1.0
+        response = self.client.get("/getevents/", **headers)
+        self.assertEqual(response.status_code, 500)
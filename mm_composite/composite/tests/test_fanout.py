@@ -0,0 +1,135 @@
+import asyncio
+import threading
+import time
+
+from django.test import SimpleTestCase, TestCase
+
+from composite.fanout import FanOutTimeout, async_fan_out, fan_out, iter_fan_out
+from composite.resilience import end_deadline, remaining_budget, start_deadline
+
+from .utils import StubServicesMixin, auth
+
+
+class ConcurrencyProbe:
+    """Callable recording how many calls overlapped."""
+
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.active = self.peak = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, item):
+        with self._lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        try:
+            time.sleep(self.delay)
+            return item * 2
+        finally:
+            with self._lock:
+                self.active -= 1
+
+
+class FanOutTests(SimpleTestCase):
+    def test_results_and_failures_by_item(self):
+        def double(item):
+            if item == 3:
+                raise ValueError("bad item")
+            return item * 2
+
+        results, failures = fan_out(double, [1, 2, 3, 2])
+        self.assertEqual(results, {1: 2, 2: 4})
+        self.assertEqual(list(failures), [3])
+        self.assertIsInstance(failures[3], ValueError)
+
+    def test_runs_concurrently_within_max_in_flight(self):
+        probe = ConcurrencyProbe()
+        results, _ = fan_out(probe, range(8), max_in_flight=3)
+        self.assertEqual(results, {n: n * 2 for n in range(8)})
+        self.assertEqual(probe.peak, 3)
+
+    def test_items_missing_the_deadline_time_out(self):
+        def slow_one(item):
+            time.sleep(1 if item == 2 else 0)
+            return item
+
+        start = time.monotonic()
+        results, failures = fan_out(slow_one, [1, 2], timeout=0.1)
+        self.assertLess(time.monotonic() - start, 0.5)
+        self.assertEqual(results, {1: 1})
+        self.assertIsInstance(failures[2], FanOutTimeout)
+
+    def test_request_deadline_caps_timeout(self):
+        token = start_deadline(0.2)
+        try:
+            _, failures = fan_out(lambda item: time.sleep(1), [1, 2], timeout=10)
+        finally:
+            end_deadline(token)
+        self.assertIsInstance(failures[1], FanOutTimeout)
+
+    def test_workers_see_the_request_deadline(self):
+        token = start_deadline(5)
+        try:
+            results, _ = fan_out(lambda item: remaining_budget(), [1, 2])
+        finally:
+            end_deadline(token)
+        for budget in results.values():
+            self.assertIsNotNone(budget)
+            self.assertLess(budget, 5)
+
+    def test_iter_yields_in_completion_order(self):
+        def sleep_for(item):
+            time.sleep(item / 10)
+            return item
+
+        order = [item for item, _, _ in iter_fan_out(sleep_for, [3, 1, 2])]
+        self.assertEqual(order, [1, 2, 3])
+
+    def test_single_item_runs_inline(self):
+        results, _ = fan_out(lambda item: threading.current_thread(), [1])
+        self.assertIs(results[1], threading.current_thread())
+
+
+class AsyncFanOutTests(SimpleTestCase):
+    def test_results_failures_and_timeouts(self):
+        async def lookup(item):
+            if item == 2:
+                raise ValueError("bad item")
+            await asyncio.sleep(1 if item == 3 else 0)
+            return item
+
+        results, failures = asyncio.run(
+            async_fan_out(lookup, [1, 2, 3], timeout=0.1))
+        self.assertEqual(results, {1: 1})
+        self.assertIsInstance(failures[2], ValueError)
+        self.assertIsInstance(failures[3], FanOutTimeout)
+
+    def test_max_in_flight(self):
+        active = peak = 0
+
+        async def lookup(item):
+            nonlocal active, peak
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.01)
+            active -= 1
+            return item
+
+        asyncio.run(async_fan_out(lookup, range(10), max_in_flight=4))
+        self.assertEqual(peak, 4)
+
+
+class EnrichedEventFanOutTests(StubServicesMixin, TestCase):
+    participants = 5
+
+    def test_participants_are_fetched_concurrently(self):
+        self.stub_config.latency = 0.2
+        start = time.monotonic()
+        response = self.client.get("/getevent/10/", **auth())
+        elapsed = time.monotonic() - start
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()["participants"]), 5)
+        # Caller, event and six users one after another would take 1.6s
+        self.assertEqual(self.calls("users", "GET /userinfo/{id}/"), 6)
+        self.assertLess(elapsed, 1.2)
@@ -0,0 +1,87 @@
+from django.test import SimpleTestCase, TestCase
+
+from composite.enrichment import EVENT
+from composite.fieldsets import FieldSelection
+
+from .utils import StubServicesMixin, auth
+
+
+class FieldSelectionTests(SimpleTestCase):
+    def test_fields_imply_expansions(self):
+        self.assertIsNone(FieldSelection().expansions(EVENT))
+        self.assertEqual(
+            FieldSelection(fields=["id", "participants.username"]).expansions(EVENT),
+            {"participants"})
+        self.assertEqual(FieldSelection(expand=[]).expansions(EVENT), set())
+
+    def test_unknown_expansions(self):
+        with self.assertRaisesMessage(ValueError, "Unknown expansion: venue"):
+            FieldSelection(expand=["venue"]).expansions(EVENT)
+
+    def test_apply_prunes_nested_objects(self):
+        selection = FieldSelection(fields=["title", "organizer", "participants.username"])
+        doc = {"id": 1, "title": "T", "location": "Room 1", "degraded": True,
+               "organizer": {"id": 1, "username": "a", "email": "a@example.com"},
+               "participants": [{"id": 2, "username": "b", "email": "b@example.com"},
+                                {"id": 3, "unresolved": True}]}
+        self.assertEqual(selection.apply(doc), {
+            "id": 1, "title": "T", "degraded": True,
+            "organizer": {"id": 1, "username": "a", "email": "a@example.com"},
+            "participants": [{"id": 2, "username": "b"},
+                             {"id": 3, "unresolved": True}]})
+
+    def test_equivalent_selections_share_a_key(self):
+        self.assertEqual(FieldSelection().key, "")
+        self.assertEqual(
+            FieldSelection(fields=["b.y", "a", "b.x"]).key,
+            FieldSelection(fields=["a", "b.x", "b.y"]).key)
+        self.assertNotEqual(FieldSelection(fields=["a"]).key,
+                            FieldSelection(fields=["a"], expand=[]).key)
+
+
+class SparseFieldsetViewTests(StubServicesMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.headers = auth()
+        # Resolves the caller, so only enrichment lookups are counted below
+        self.client.get("/getavailability/1/", **self.headers)
+        self.users_before = self.calls("users", "GET /userinfo/{id}/")
+
+    def get(self, path="/getevent/10/", **params):
+        response = self.client.get(path, params, **self.headers)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def user_lookups(self):
+        return self.calls("users", "GET /userinfo/{id}/") - self.users_before
+
+    def test_unexpanded_references_cost_no_calls(self):
+        event = self.get(fields="id,title,participant_ids")
+        self.assertEqual(event, {"id": 10, "title": "Event 10",
+                                 "participant_ids": [11, 12, 13]})
+        self.assertEqual(self.user_lookups(), 0)
+
+    def test_expand_one_reference(self):
+        event = self.get(expand="organizer")
+        self.assertEqual(event["organizer"]["id"], 1)
+        self.assertNotIn("participants", event)
+        self.assertEqual(event["participant_ids"], [11, 12, 13])
+
+    def test_nested_fields(self):
+        event = self.get(fields="participants.username")
+        self.assertEqual(event["participants"],
+                         [{"id": 11, "username": "user11"},
+                          {"id": 12, "username": "user12"},
+                          {"id": 13, "username": "user13"}])
+        self.assertEqual(self.user_lookups(), 3)
+
+    def test_availability(self):
+        self.assertEqual(self.get("/getavailability/3/", fields="id,event"),
+                         {"id": 3, "event": "http://localhost:8002/getevent/3/"})
+        self.assertEqual(self.user_lookups(), 0)
+
+    def test_unknown_expansion_is_rejected(self):
+        response = self.client.get("/getevent/10/", {"expand": "venue"},
+                                   **self.headers)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.calls("scheduling", "GET /events/{id}/"), 0)
@@ -0,0 +1,136 @@
+import asyncio
+import threading
+import time
+
+import httpx
+import requests
+from django.test import SimpleTestCase, override_settings
+
+from composite import httpcache
+
+
+def upstream_response(status=200, content=b'{"id": 1}', **headers):
+    response = requests.Response()
+    response.status_code = status
+    response.headers = requests.structures.CaseInsensitiveDict(headers)
+    response._content = content
+    return response
+
+
+@override_settings(HTTP_CACHE={'BACKEND': 'default'})
+class HTTPCacheTests(SimpleTestCase):
+    url = "http://scheduling/event/1/"
+
+    def setUp(self):
+        self.http_cache = httpcache.HTTPCache('default')
+        self.http_cache.cache.clear()
+        self.sent = []
+
+    def send(self, *responses):
+        responses = list(responses)
+
+        def send(**kwargs):
+            self.sent.append(kwargs.get("headers") or {})
+            return responses.pop(0)
+        return send
+
+    def get(self, send, **kwargs):
+        return self.http_cache.get("scheduling", self.url, kwargs, send)
+
+    def test_fresh_response_is_served_from_cache(self):
+        send = self.send(upstream_response(**{"Cache-Control": "max-age=60"}))
+        self.get(send)
+        response = self.get(send)
+        self.assertEqual(len(self.sent), 1)
+        self.assertEqual(response.json(), {"id": 1})
+
+    def test_stale_response_is_revalidated(self):
+        send = self.send(
+            upstream_response(**{"Cache-Control": "no-cache", "ETag": '"v1"'}),
+            upstream_response(304, b"", ETag='"v1"'))
+        self.get(send)
+        response = self.get(send)
+        self.assertEqual(self.sent[1], {"If-None-Match": '"v1"'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"id": 1})
+
+    def test_revalidated_by_modification_date(self):
+        modified = "Wed, 01 Jan 2026 00:00:00 GMT"
+        send = self.send(upstream_response(**{"Last-Modified": modified}),
+                         upstream_response(304, b""))
+        self.get(send)
+        self.assertEqual(self.get(send).json(), {"id": 1})
+        self.assertEqual(self.sent[1], {"If-Modified-Since": modified})
+
+    def test_stale_while_revalidate_refreshes_in_background(self):
+        refreshed = threading.Event()
+        send = self.send(
+            upstream_response(**{
+                "Cache-Control": "max-age=0, stale-while-revalidate=60",
+                "ETag": '"v1"'}),
+            upstream_response(content=b'{"id": 2}', **{
+                "Cache-Control": "max-age=60", "ETag": '"v2"'}))
+
+        def send_and_signal(**kwargs):
+            try:
+                return send(**kwargs)
+            finally:
+                if len(self.sent) == 2:
+                    refreshed.set()
+
+        self.get(send_and_signal)
+        stale = self.get(send_and_signal)
+        self.assertEqual(stale.json(), {"id": 1})
+        self.assertTrue(refreshed.wait(5))
+        # The refreshed entry is stored once the background call returns
+        for _ in range(50):
+            if self.get(send_and_signal).json() == {"id": 2}:
+                break
+            time.sleep(0.01)
+        self.assertEqual(self.get(send_and_signal).json(), {"id": 2})
+        self.assertEqual(len(self.sent), 2)
+
+    def test_evict_retires_stored_response(self):
+        send = self.send(upstream_response(**{"Cache-Control": "max-age=60"}),
+                         upstream_response(content=b'{"id": 2}'))
+        self.get(send)
+        self.http_cache.evict(self.url)
+        self.assertEqual(self.get(send).json(), {"id": 2})
+
+    def test_no_store_is_not_cached(self):
+        send = self.send(upstream_response(**{"Cache-Control": "no-store"}),
+                         upstream_response(**{"Cache-Control": "no-store"}))
+        self.get(send)
+        self.get(send)
+        self.assertEqual(len(self.sent), 2)
+
+    def test_callers_do_not_share_entries(self):
+        send = self.send(
+            upstream_response(**{"Cache-Control": "max-age=60"}),
+            upstream_response(content=b'{"id": 2}',
+                              **{"Cache-Control": "max-age=60"}))
+        self.get(send, headers={"Authorization": "Bearer a"})
+        response = self.get(send, headers={"Authorization": "Bearer b"})
+        self.assertEqual(response.json(), {"id": 2})
+        self.assertEqual(self.get(send, headers={"Authorization": "Bearer a"}).json(),
+                         {"id": 1})
+
+    def test_async_revalidation(self):
+        responses = [
+            httpx.Response(200, content=b'{"id": 1}',
+                           headers={"Cache-Control": "no-cache", "ETag": '"v1"'}),
+            httpx.Response(304, headers={"ETag": '"v1"'}),
+        ]
+
+        async def send(**kwargs):
+            self.sent.append(kwargs.get("headers") or {})
+            return responses.pop(0)
+
+        async def get_twice():
+            await self.http_cache.aget("scheduling", self.url, {}, send)
+            return await self.http_cache.aget("scheduling", self.url, {}, send)
+
+        response = asyncio.run(get_twice())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"id": 1})
+        self.assertEqual(self.sent[1], {"If-None-Match": '"v1"'})
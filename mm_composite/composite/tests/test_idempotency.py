@@ -0,0 +1,158 @@
+import json
+import threading
+import time
+from types import SimpleNamespace
+from unittest import mock
+
+from django.db import OperationalError, connection
+from django.http import JsonResponse
+from django.test import (RequestFactory, TestCase, TransactionTestCase,
+                         override_settings)
+
+from composite import idempotency, invitations
+from composite.models import IdempotencyRecord
+
+from .utils import StubServicesMixin, auth
+
+
+def respond(body, status):
+    return JsonResponse(body, status=status, safe=False)
+
+
+def idempotent_request(body=b'{"title": "T"}', key="key-1"):
+    request = RequestFactory().post("/postevent/", body,
+                                    content_type="application/json",
+                                    HTTP_IDEMPOTENCY_KEY=key)
+    request.user = SimpleNamespace(id=1)
+    return request
+
+
+class IdempotencyTests(TestCase):
+    def test_replays_completed_request(self):
+        calls = []
+
+        def handler():
+            calls.append(1)
+            return JsonResponse({"id": len(calls)}, status=201)
+
+        first = idempotency.idempotent(idempotent_request(), handler, respond)
+        second = idempotency.idempotent(idempotent_request(), handler, respond)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(second.status_code, 201)
+        self.assertEqual(json.loads(second.content), json.loads(first.content))
+        self.assertEqual(second[idempotency.REPLAYED_HEADER], "true")
+
+    def test_key_reused_for_other_body(self):
+        idempotency.idempotent(idempotent_request(),
+                               lambda: JsonResponse({}, status=201), respond)
+        response = idempotency.idempotent(
+            idempotent_request(b'{"title": "Other"}'),
+            lambda: JsonResponse({}, status=201), respond)
+        self.assertEqual(response.status_code, 422)
+
+    def test_retryable_statuses_release_key(self):
+        for status in (408, 409, 429, 503):
+            with self.subTest(status=status):
+                idempotency.idempotent(
+                    idempotent_request(key=f"key-{status}"),
+                    lambda: JsonResponse({}, status=status), respond)
+                self.assertFalse(IdempotencyRecord.objects.filter(
+                    key=f"key-{status}").exists())
+
+    @override_settings(IDEMPOTENCY={'WAIT_TIMEOUT': 0.2, 'POLL_INTERVAL': 0.01})
+    def test_duplicate_of_unfinished_request_conflicts(self):
+        request_hash = idempotency.fingerprint(idempotent_request())
+        idempotency.claim("user=1", "key-1", request_hash)
+        response = idempotency.idempotent(
+            idempotent_request(), lambda: JsonResponse({}, status=201), respond)
+        self.assertEqual(response.status_code, 409)
+
+    @override_settings(IDEMPOTENCY={'POLL_INTERVAL': 0.01})
+    def test_claim_polls_through_locked_database(self):
+        create = IdempotencyRecord.objects.create
+        failures = [OperationalError("database is locked")]
+
+        def locked_once(**kwargs):
+            if failures:
+                raise failures.pop()
+            return create(**kwargs)
+
+        with mock.patch.object(IdempotencyRecord.objects, "create", locked_once):
+            record, owned = idempotency.claim("user=1", "key-1", "hash")
+        self.assertTrue(owned)
+        self.assertEqual(record.key, "key-1")
+
+    @override_settings(IDEMPOTENCY={'POLL_INTERVAL': 0.01})
+    def test_outcome_is_recorded_through_locked_database(self):
+        record, _ = idempotency.claim("user=1", "key-1", "hash")
+        save = IdempotencyRecord.save
+        failures = [OperationalError("database table is locked")]
+
+        def locked_once(record, **kwargs):
+            if failures:
+                raise failures.pop()
+            return save(record, **kwargs)
+
+        with mock.patch.object(IdempotencyRecord, "save", locked_once):
+            idempotency.finish(record, JsonResponse({"id": 1}, status=201))
+        record.refresh_from_db()
+        self.assertEqual(record.state, IdempotencyRecord.COMPLETED)
+
+    @override_settings(IDEMPOTENCY={'PURGE_INTERVAL': 0})
+    def test_purge_skipped_while_database_is_locked(self):
+        with mock.patch("django.db.models.QuerySet.delete",
+                        side_effect=OperationalError("database table is locked")), \
+                self.assertLogs("composite.idempotency", "WARNING"):
+            record, owned = idempotency.claim("user=1", "key-1", "hash")
+        self.assertTrue(owned)
+
+
+@override_settings(IDEMPOTENCY={'POLL_INTERVAL': 0.01})
+class IdempotencyRaceTests(TransactionTestCase):
+    def test_concurrent_duplicates_run_handler_once(self):
+        calls = []
+        responses = []
+        start = threading.Barrier(4)
+
+        def handler():
+            calls.append(1)
+            time.sleep(0.1)
+            return JsonResponse({"id": 1}, status=201)
+
+        def duplicate():
+            try:
+                start.wait()
+                responses.append(idempotency.idempotent(
+                    idempotent_request(), handler, respond))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=duplicate) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sorted(response.status_code for response in responses),
+                         [201] * 4)
+        self.assertEqual(sum(response.has_header(idempotency.REPLAYED_HEADER)
+                             for response in responses), 3)
+
+
+class IdempotentCreateTests(StubServicesMixin, TestCase):
+    def post(self, headers, key="key-1"):
+        return self.client.post(
+            "/postevent/", {"title": "T", "participant_ids": [2]},
+            content_type="application/json", HTTP_IDEMPOTENCY_KEY=key, **headers)
+
+    def test_retries_create_one_event_and_send_one_invitation(self):
+        headers = auth()
+        with mock.patch.object(invitations, "dispatch_event_emails") as dispatch:
+            first = self.post(headers)
+            retry = self.post(headers)
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(retry[idempotency.REPLAYED_HEADER], "true")
+        self.assertEqual(self.calls("scheduling", "POST /events/"), 1)
+        dispatch.assert_called_once()
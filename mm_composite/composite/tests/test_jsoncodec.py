@@ -0,0 +1,107 @@
+import json
+import pickle
+import unittest
+from datetime import datetime
+from decimal import Decimal
+
+from django.core.exceptions import ImproperlyConfigured
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework.renderers import JSONRenderer as DRFJSONRenderer
+
+from composite import jsoncodec
+
+from .utils import StubServicesMixin, auth
+
+
+class CodecTests(SimpleTestCase):
+    data = {"id": 1, "title": "Café", "when": datetime(2026, 1, 1, 10, 0),
+            "price": Decimal("1.50"), "tags": ["a", None]}
+
+    def test_fallback_matches_drf(self):
+        self.assertEqual(jsoncodec.StdlibCodec().dumps(self.data),
+                         DRFJSONRenderer().render(self.data))
+
+    def test_auto_picks_an_installed_codec(self):
+        codec = jsoncodec.build_codec("auto")
+        installed = [name for name, (module, _) in jsoncodec.CODECS.items()
+                     if module() is not None]
+        self.assertEqual(codec.name, installed[0])
+
+    def test_unknown_or_missing_codecs(self):
+        with self.assertRaises(ImproperlyConfigured):
+            jsoncodec.build_codec("simplejson")
+        for name in ("orjson", "msgspec"):
+            if getattr(jsoncodec, name) is None:
+                with self.subTest(name), self.assertRaises(ImproperlyConfigured):
+                    jsoncodec.build_codec(name)
+
+    @unittest.skipIf(jsoncodec.orjson is None, "orjson is not installed")
+    def test_orjson_agrees_with_the_fallback(self):
+        self.assertEqual(json.loads(jsoncodec.OrjsonCodec().dumps(self.data)),
+                         json.loads(jsoncodec.StdlibCodec().dumps(self.data)))
+
+    @unittest.skipIf(jsoncodec.msgspec is None, "msgspec is not installed")
+    def test_msgspec_agrees_with_the_fallback(self):
+        self.assertEqual(json.loads(jsoncodec.MsgspecCodec().dumps(self.data)),
+                         json.loads(jsoncodec.StdlibCodec().dumps(self.data)))
+        with self.assertRaises(ValueError):
+            jsoncodec.MsgspecCodec().loads(b"{")
+
+
+@override_settings(JSON_CODEC={'RAW_PASSTHROUGH': True})
+class RawDocumentTests(SimpleTestCase):
+    raw = b'{"id": 1,  "title": "Caf\\u00e9", "score": 1.50}'
+
+    def test_added_fields_are_spliced_into_upstream_bytes(self):
+        document = jsoncodec.decode(self.raw, raw=True)
+        self.assertIsInstance(document, jsoncodec.RawDocument)
+        document["participants"] = [{"id": 2}]
+        encoded = jsoncodec.encode(document)
+        self.assertTrue(encoded.startswith(self.raw[:-1]))
+        self.assertEqual(json.loads(encoded), {
+            "id": 1, "title": "Café", "score": 1.5, "participants": [{"id": 2}]})
+
+    def test_untouched_document_is_re_emitted_as_is(self):
+        self.assertEqual(jsoncodec.encode(jsoncodec.decode(self.raw, raw=True)),
+                         self.raw)
+
+    def test_empty_object(self):
+        document = jsoncodec.decode(b"{ }", raw=True)
+        document["a"] = 1
+        self.assertEqual(json.loads(jsoncodec.encode(document)), {"a": 1})
+
+    def test_changed_upstream_field_is_re_encoded(self):
+        document = jsoncodec.decode(self.raw, raw=True)
+        document["title"] = "Other"
+        document.pop("score")
+        self.assertEqual(json.loads(jsoncodec.encode(document)),
+                         {"id": 1, "title": "Other"})
+
+    def test_pickled_copy_stays_raw_only_while_intact(self):
+        document = jsoncodec.decode(self.raw, raw=True)
+        self.assertEqual(pickle.loads(pickle.dumps(document)).raw, self.raw)
+        document["id"] = 2
+        self.assertIs(type(pickle.loads(pickle.dumps(document))), dict)
+
+    @override_settings(JSON_CODEC={'RAW_PASSTHROUGH': False})
+    def test_disabled_by_default(self):
+        self.assertIs(type(jsoncodec.decode(self.raw, raw=True)), dict)
+
+
+
+class CodecViewTests(StubServicesMixin, TestCase):
+    def test_malformed_request_bodies(self):
+        response = self.client.post("/postevent/", b"{", content_type="application/json",
+                                    **auth())
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("JSON parse error", response.json()["detail"])
+
+    @override_settings(JSON_CODEC={'RAW_PASSTHROUGH': True})
+    def test_passthrough_responses(self):
+        response = self.client.get("/getevent/10/", **auth())
+        # The upstream bytes, with the stub's spacing, are sent as they came
+        self.assertTrue(response.content.startswith(b'{"id": 10, "title": "Event 10"'))
+        event = response.json()
+        self.assertEqual(event["title"], "Event 10")
+        self.assertEqual([user["id"] for user in event["participants"]],
+                         [11, 12, 13])
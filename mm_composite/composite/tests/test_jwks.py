@@ -0,0 +1,122 @@
+import base64
+import time
+import uuid
+from unittest import mock
+
+import jwt
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from composite import jwks
+from composite.benchmark.stubs import StubConfig, StubService
+
+from .utils import StubServicesMixin, reset_composite_state
+
+
+def jwk(kid, secret, alg="HS256"):
+    encoded = base64.urlsafe_b64encode(secret).rstrip(b"=").decode()
+    return {"kty": "oct", "kid": kid, "alg": alg, "k": encoded}
+
+
+def token(kid, secret, alg="HS256", **claims):
+    payload = {"token_type": "access", "user_id": "1", "username": "user1",
+               "email": "user1@example.com", "jti": uuid.uuid4().hex,
+               "exp": int(time.time()) + 300, **claims}
+    return jwt.encode(payload, secret, algorithm=alg, headers={"kid": kid})
+
+
+KEY_1 = b"k" * 64
+KEY_2 = b"r" * 64
+
+
+class JWKSTests(StubServicesMixin, TestCase):
+    """Tokens verified with the keys an auth stub publishes."""
+
+    jwt_verification = {'MODE': 'local', 'AUTH_SERVICE': 'auth',
+                        'JWKS_PATH': '/jwks/', 'JWKS_MIN_REFRESH_INTERVAL': 0}
+
+    def setUp(self):
+        super().setUp()
+        self.keys = [jwk("k1", KEY_1)]
+        self.revoked = []
+        auth = StubService("auth", [
+            ("GET", r"/jwks/", "/jwks/", lambda *_: (200, {"keys": self.keys})),
+            ("GET", r"/revoked/", "/revoked/",
+             lambda *_: (200, {"revoked": self.revoked})),
+        ], StubConfig(latency=0, jitter=0)).start()
+        self.auth = auth
+        self.addCleanup(auth.stop)
+        overrides = override_settings(
+            DOWNSTREAM_SERVICES={**settings.DOWNSTREAM_SERVICES,
+                                 'auth': {'BASE_URL': auth.base_url, 'RETRIES': 0}},
+            JWT_VERIFICATION=self.jwt_verification)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        reset_composite_state()
+
+    def get(self, raw_token):
+        return self.client.get("/getavailability/3/",
+                               HTTP_AUTHORIZATION=f"Bearer {raw_token}")
+
+    def test_local_mode_trusts_verified_claims(self):
+        self.assertEqual(self.get(token("k1", KEY_1)).status_code, 200)
+        self.assertEqual(self.calls("users", "GET /userinfo/"), 0)
+        self.get(token("k1", KEY_1))
+        self.assertEqual(self.auth.snapshot(), {"GET /jwks/": 1})
+
+    def test_rotated_keys_are_fetched(self):
+        self.get(token("k1", KEY_1))
+        self.keys = [jwk("k1", KEY_1), jwk("k2", KEY_2)]
+        self.assertEqual(self.get(token("k2", KEY_2)).status_code, 200)
+        self.assertEqual(self.auth.snapshot(), {"GET /jwks/": 2})
+
+    @override_settings(JWT_VERIFICATION={**jwt_verification,
+                                         'JWKS_MIN_REFRESH_INTERVAL': 60})
+    def test_unknown_keys_refetch_at_most_once_per_interval(self):
+        self.get(token("k1", KEY_1))
+        for _ in range(3):
+            self.assertEqual(self.get(token("k9", KEY_2)).status_code, 401)
+        self.assertEqual(self.auth.snapshot(), {"GET /jwks/": 1})
+
+    def test_bad_signatures_are_rejected(self):
+        self.assertEqual(self.get(token("k1", KEY_2)).status_code, 401)
+
+    def test_algorithm_comes_from_the_key(self):
+        self.assertEqual(self.get(token("k1", KEY_1, alg="HS512")).status_code, 401)
+
+    @override_settings(JWT_VERIFICATION={**jwt_verification,
+                                         'ALGORITHMS': ['HS512']})
+    def test_disallowed_algorithms(self):
+        self.assertEqual(self.get(token("k1", KEY_1)).status_code, 401)
+
+    def test_missing_claims_fall_back_to_the_user_service(self):
+        raw_token = token("k1", KEY_1)
+        claims = jwt.decode(raw_token, KEY_1, algorithms=["HS256"])
+        del claims["email"]
+        raw_token = jwt.encode(claims, KEY_1, algorithm="HS256",
+                               headers={"kid": "k1"})
+        self.assertEqual(self.get(raw_token).status_code, 200)
+        self.assertEqual(self.calls("users", "GET /userinfo/"), 1)
+
+    @override_settings(JWT_VERIFICATION={**jwt_verification,
+                                         'REVOCATION_PATH': '/revoked/'})
+    def test_revoked_tokens_are_looked_up_remotely(self):
+        raw_token = token("k1", KEY_1)
+        jti = jwt.decode(raw_token, KEY_1, algorithms=["HS256"])["jti"]
+        self.revoked = [jti]
+        # Refreshed here instead of by the background thread
+        with mock.patch.object(jwks.RevocationList, "start"):
+            jwks.get_revocation_list().refresh()
+        self.get(raw_token)
+        self.assertEqual(self.calls("users", "GET /userinfo/"), 1)
+        self.get(token("k1", KEY_1))
+        self.assertEqual(self.calls("users", "GET /userinfo/"), 1)
+
+
+class CheckCryptoTests(SimpleTestCase):
+    def test_public_keys_need_cryptography(self):
+        with mock.patch.object(jwks, "has_crypto", False):
+            jwks.check_crypto({"keys": [jwk("k1", KEY_1)]})
+            with self.assertRaises(ImproperlyConfigured):
+                jwks.check_crypto({"keys": [{"kty": "RSA", "kid": "r1"}]})
@@ -0,0 +1,59 @@
+from django.test import SimpleTestCase, TestCase
+
+from composite.loaders import DataLoader
+
+from .utils import StubServicesMixin, auth
+
+
+class DataLoaderTests(SimpleTestCase):
+    def setUp(self):
+        self.batches = []
+
+        def batch_load(keys):
+            self.batches.append(keys)
+            return {key: key * 10 for key in keys if key != 404}
+
+        self.loader = DataLoader(batch_load)
+
+    def test_queued_keys_are_fetched_in_one_batch(self):
+        self.loader.prefetch([1, 2, None])
+        self.assertEqual(self.batches, [])
+        self.assertEqual(self.loader.load(3), 30)
+        self.assertEqual(self.batches, [[1, 2, 3]])
+
+    def test_keys_are_fetched_once(self):
+        self.assertEqual(self.loader.load_many([1, 404]), {1: 10})
+        self.assertEqual(self.loader.load(1), 10)
+        self.assertIsNone(self.loader.load(404))
+        self.assertEqual(self.loader.load_many([1, 2]), {1: 10, 2: 20})
+        self.assertEqual(self.batches, [[1, 404], [2]])
+        self.assertEqual(self.loader.batches, 2)
+
+
+class GraphQLBatchingTests(StubServicesMixin, TestCase):
+    def query(self, query):
+        response = self.client.post("/graphql/", {"query": query},
+                                    content_type="application/json", **auth())
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertNotIn("errors", body)
+        return body["data"]
+
+    def test_aliased_events_share_user_lookups(self):
+        data = self.query("""{
+            a: enrichedEvent(eventId: 10) { participants { id username } }
+            b: enrichedEvent(eventId: 11) {
+                organizer { username } participants { id username } }
+        }""")
+        self.assertEqual([user["id"] for user in data["a"]["participants"]],
+                         [11, 12, 13])
+        self.assertEqual(data["b"]["organizer"], {"username": "user1"})
+        # Users 1 and 11 to 14, each fetched once
+        self.assertEqual(self.calls("users", "GET /userinfo/{id}/"), 5)
+        self.assertEqual(self.calls("scheduling", "GET /events/{id}/"), 2)
+
+    def test_ids_alone_need_no_user_lookups(self):
+        data = self.query("{ enrichedEvent(eventId: 10) { participants { id } } }")
+        self.assertEqual(data["enrichedEvent"]["participants"],
+                         [{"id": 11}, {"id": 12}, {"id": 13}])
+        self.assertEqual(self.calls("users"), 0)
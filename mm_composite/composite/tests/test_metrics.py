@@ -0,0 +1,111 @@
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from composite import metrics
+from composite.metrics import Counter, Histogram, Registry
+
+from .utils import StubServicesMixin, auth
+
+
+def sample(name, labels=""):
+    """:return: A sample's current value on ``/metrics``, 0 if absent"""
+    prefix = f"{name}{labels} "
+    for line in metrics.REGISTRY.expose().splitlines():
+        if line.startswith(prefix):
+            return float(line[len(prefix):])
+    return 0
+
+
+def total(name):
+    """:return: The sum of a metric's samples across all their labels"""
+    return sum(float(line.rsplit(" ", 1)[1])
+               for line in metrics.REGISTRY.expose().splitlines()
+               if line.startswith((f"{name} ", f"{name}{{")))
+
+
+class ExpositionTests(SimpleTestCase):
+    def setUp(self):
+        self.registry = Registry()
+        # Keeps the test metrics out of the global registry
+        with mock.patch.object(metrics, "REGISTRY", self.registry):
+            self.counter = Counter("test_total", "Test counter.", ("path",))
+            self.histogram = Histogram("test_seconds", "Test histogram.",
+                                       buckets=(0.1, 1.0))
+
+    def test_counter(self):
+        self.counter.inc('a"b')
+        self.counter.inc('a"b', amount=2)
+        lines = self.registry.expose().splitlines()
+        self.assertIn("# TYPE test_total counter", lines)
+        self.assertIn('test_total{path="a\\"b"} 3', lines)
+
+    def test_histogram_buckets_are_cumulative(self):
+        for value in (0.05, 0.5, 5):
+            self.histogram.observe(value=value)
+        lines = self.registry.expose().splitlines()
+        self.assertIn('test_seconds_bucket{le="0.1"} 1', lines)
+        self.assertIn('test_seconds_bucket{le="1.0"} 2', lines)
+        self.assertIn('test_seconds_bucket{le="+Inf"} 3', lines)
+        self.assertIn("test_seconds_sum 5.55", lines)
+        self.assertIn("test_seconds_count 3", lines)
+
+    def test_failing_collectors_are_skipped(self):
+        self.registry.register_collector(mock.Mock(side_effect=RuntimeError))
+        self.registry.register_collector(lambda: [
+            ("test_depth", "gauge", "Test gauge.", {(("queue", "a"),): 2})])
+        with self.assertLogs("composite.metrics", "ERROR"):
+            lines = self.registry.expose().splitlines()
+        self.assertIn('test_depth{queue="a"} 2', lines)
+
+
+class MetricsEndpointTests(SimpleTestCase):
+    def test_served_to_allowed_addresses(self):
+        response = self.client.get("/metrics/")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"# TYPE composite_requests_in_flight gauge",
+                      response.content)
+
+    def test_refused_elsewhere(self):
+        response = self.client.get("/metrics/", REMOTE_ADDR="203.0.113.5")
+        self.assertEqual(response.status_code, 403)
+
+    @override_settings(METRICS={'TOKEN': 'scrape', 'ALLOWED_IPS': ['10.0.0.0/8']})
+    def test_token_or_allowed_network(self):
+        self.assertEqual(self.client.get(
+            "/metrics/", REMOTE_ADDR="10.1.2.3").status_code, 200)
+        self.assertEqual(self.client.get(
+            "/metrics/", REMOTE_ADDR="203.0.113.5",
+            HTTP_AUTHORIZATION="Bearer scrape").status_code, 200)
+        self.assertEqual(self.client.get(
+            "/metrics/", REMOTE_ADDR="203.0.113.5",
+            HTTP_AUTHORIZATION="Bearer wrong").status_code, 403)
+
+
+class InstrumentationTests(StubServicesMixin, TestCase):
+    def test_request_is_recorded(self):
+        upstream = ('composite_upstream_requests_total'
+                    '{service="scheduling",status="200"}')
+        view = ('composite_view_duration_seconds_count'
+                '{view="getevent/<int:event_id>/",method="GET",status="200"}')
+        fanout = "composite_fanout_size_count"
+        auth_count = "composite_auth_duration_seconds_count"
+        before = {name: sample(name) for name in (upstream, view, fanout)}
+        authenticated = total(auth_count)
+        response = self.client.get("/getevent/10/", **auth())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sample(upstream), before[upstream] + 1)
+        self.assertEqual(sample(view), before[view] + 1)
+        self.assertGreater(sample(fanout), before[fanout])
+        self.assertEqual(total(auth_count), authenticated + 1)
+        self.assertEqual(sample("composite_requests_in_flight"), 0)
+
+    def test_upstream_errors_by_status(self):
+        headers = auth()
+        self.client.get("/getavailability/3/", **headers)
+        failed = ('composite_upstream_requests_total'
+                  '{service="scheduling",status="503"}')
+        before = sample(failed)
+        self.stub_config.error_rate = 1.0
+        self.client.get("/getavailability/4/", **headers)
+        self.assertEqual(sample(failed), before + 1)
@@ -0,0 +1,114 @@
+import threading
+from unittest import mock
+
+from django.conf import settings
+from django.test import SimpleTestCase, override_settings
+
+from composite import notifications
+from composite.benchmark.stubs import StubConfig, StubService, notification_service
+from composite.notifications import DeliveryFailed, NotificationDispatcher
+
+from .utils import reset_composite_state
+
+
+def email(n):
+    return {"subject": "Invitation", "message": "Hello",
+            "recipient_list": [f"user{n}@example.com"]}
+
+
+def batch_service():
+    """Notifications service whose batch endpoint reports per recipient."""
+    def send_batch(match, query, body):
+        results = []
+        for email_data in body["emails"]:
+            recipient = email_data["recipient_list"][0]
+            if recipient.startswith("user2@"):
+                results.append({"ok": False, "error": "mailbox full"})
+            elif recipient.startswith("user3@"):
+                # Not an object: nothing known about this recipient
+                results.append("sent")
+            else:
+                results.append({"status": "sent"})
+        return 200, {"results": results}
+
+    return StubService("notifications", [
+        ("POST", r"/send-email/batch", "/send-email/batch", send_batch),
+    ], StubConfig(latency=0, jitter=0)).start()
+
+
+class NotificationTestsMixin:
+    def use(self, stub):
+        self.addCleanup(stub.stop)
+        services = override_settings(DOWNSTREAM_SERVICES={
+            **settings.DOWNSTREAM_SERVICES,
+            "notifications": {"BASE_URL": stub.base_url, "RETRIES": 0}})
+        services.enable()
+        self.addCleanup(services.disable)
+        reset_composite_state()
+        return stub
+
+
+@override_settings(NOTIFICATIONS={'BATCH_PATH': '/send-email/batch'})
+class BatchDeliveryTests(NotificationTestsMixin, SimpleTestCase):
+    def setUp(self):
+        self.stub = self.use(batch_service())
+
+    def test_outcome_per_recipient(self):
+        results = NotificationDispatcher().send_many(
+            {n: email(n) for n in (1, 2, 3)})
+        self.assertIsNone(results[1])
+        self.assertIsInstance(results[2], DeliveryFailed)
+        self.assertEqual(str(results[2]), "mailbox full")
+        self.assertIsNone(results[3])
+        self.assertEqual(self.stub.snapshot(), {"POST /send-email/batch": 1})
+
+    def test_full_batches_go_out_without_waiting(self):
+        dispatcher = NotificationDispatcher(batch_size=2, flush_interval=60)
+        futures = [dispatcher.submit(email(n)) for n in (1, 4)]
+        self.assertEqual([future.result(1) for future in futures], [None, None])
+
+    def test_unexpected_errors_resolve_every_email(self):
+        dispatcher = NotificationDispatcher()
+        with mock.patch.object(dispatcher, "_deliver_batch",
+                               side_effect=KeyError("results")):
+            results = dispatcher.send_many({n: email(n) for n in (1, 4)})
+        self.assertIsInstance(results[1], KeyError)
+        self.assertIsInstance(results[4], KeyError)
+
+    @override_settings(NOTIFICATIONS={'WAIT_TIMEOUT': 0.1})
+    def test_lost_outcomes_stop_the_wait(self):
+        dispatcher = NotificationDispatcher()
+        with mock.patch.object(dispatcher, "_deliver"):
+            results = dispatcher.send_many({1: email(1)})
+        self.assertIsInstance(results[1], DeliveryFailed)
+
+
+class SingleDeliveryTests(NotificationTestsMixin, SimpleTestCase):
+    def setUp(self):
+        self.stub = self.use(
+            notification_service(StubConfig(latency=0, jitter=0)).start())
+
+    @override_settings(NOTIFICATIONS={'BATCH_PATH': '/send-email/batch'})
+    def test_falls_back_without_a_batch_endpoint(self):
+        dispatcher = NotificationDispatcher()
+        results = dispatcher.send_many({n: email(n) for n in (1, 2)})
+        self.assertEqual(results, {1: None, 2: None})
+        self.assertEqual(self.stub.snapshot()["POST /send-email"], 2)
+        self.assertIsNone(dispatcher.batch_path)
+
+    def test_sends_run_on_their_own_pool(self):
+        threads = []
+
+        def send_email(email_data):
+            threads.append(threading.current_thread().name)
+
+        with mock.patch.object(notifications, "send_email", send_email):
+            NotificationDispatcher().send_many({n: email(n) for n in (1, 2)})
+        self.assertEqual(len(threads), 2)
+        for name in threads:
+            self.assertTrue(name.startswith("composite-notifications"), name)
+
+    def test_failed_sends(self):
+        self.stub.config.error_rate = 1.0
+        results = NotificationDispatcher().send_many({1: email(1)})
+        self.assertIsNotNone(results[1])
@@ -0,0 +1,90 @@
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock
+
+from django.core.management import CommandError, call_command
+from django.test import TestCase, override_settings
+
+from composite import replica
+from composite.models import SyncCursor, UserReplica
+
+from .utils import StubServicesMixin, auth
+
+
+def changed_users(*users):
+    return [{"id": user_id, "username": f"u{user_id}", "updated_at": updated_at}
+            for user_id, updated_at in users]
+
+
+@override_settings(USER_REPLICA={'ENABLED': True, 'PAGE_SIZE': 2})
+class ReplicaSyncTests(TestCase):
+    users = changed_users((1, "2026-01-01T00:00:00Z"), (2, "2026-01-01T00:00:00Z"),
+                          (3, "2026-01-01T00:00:00Z"), (4, "2026-01-02T00:00:00Z"))
+
+    def setUp(self):
+        self.requests = []
+        get = mock.patch("composite.downstream.get", self.changes_since)
+        decode = mock.patch("composite.downstream.decode",
+                            lambda response: response.page)
+        get.start()
+        decode.start()
+        self.addCleanup(get.stop)
+        self.addCleanup(decode.stop)
+
+    def changes_since(self, service, path, params=None, headers=None):
+        """Users after ``(since, since_id)``, as the user service pages them"""
+        self.requests.append(dict(params))
+        position = (params.get("since", ""), int(params.get("since_id", 0)))
+        page = [user for user in self.users
+                if (user["updated_at"], user["id"]) > position][:params["limit"]]
+        return SimpleNamespace(page=page, raise_for_status=lambda: None)
+
+    def test_users_sharing_a_timestamp_across_pages_are_kept(self):
+        self.assertEqual(replica.sync(), 4)
+        self.assertEqual(sorted(UserReplica.objects.values_list("id", flat=True)),
+                         [1, 2, 3, 4])
+        self.assertEqual(self.requests[1], {
+            "limit": 2, "since": "2026-01-01T00:00:00Z", "since_id": "2"})
+
+    def test_resumes_from_stored_cursor(self):
+        replica.sync()
+        self.requests.clear()
+        self.assertEqual(replica.sync(), 0)
+        self.assertEqual(self.requests, [{
+            "limit": 2, "since": "2026-01-02T00:00:00Z", "since_id": "4"}])
+
+    def test_reads_plain_timestamp_cursor(self):
+        SyncCursor.objects.create(name=replica.CURSOR_NAME,
+                                  value="2026-01-01T12:00:00Z")
+        self.assertEqual(replica.sync(), 1)
+        self.assertEqual(self.requests[0],
+                         {"limit": 2, "since": "2026-01-01T12:00:00Z"})
+
+    def test_fetched_users_look_like_replica_hits(self):
+        replica.store(changed_users((5, "2026-01-03T00:00:00Z")))
+        fetched = replica.project({6: {"id": 6, "username": "u6", "extra": 1}})
+        self.assertEqual(set(fetched[6]), set(replica.lookup([5])[5]))
+
+    def test_backfill_command(self):
+        replica.sync()
+        out = StringIO()
+        call_command("sync_users", "--full", stdout=out)
+        self.assertEqual(out.getvalue(), "Synced 4 users\n")
+
+    @override_settings(USER_REPLICA={'ENABLED': False})
+    def test_command_needs_the_replica(self):
+        with self.assertRaises(CommandError):
+            call_command("sync_users")
+
+
+@override_settings(USER_REPLICA={'ENABLED': True})
+class ReplicaLookupTests(StubServicesMixin, TestCase):
+    def test_enrichment_reads_the_replica_and_fetches_the_rest(self):
+        replica.store(changed_users((1, None), (11, None), (12, None)))
+        response = self.client.get("/getevent/10/", **auth())
+        participants = response.json()["participants"]
+        self.assertEqual([user["username"] for user in participants],
+                         ["u11", "u12", "user13"])
+        # Only user 13 is not replicated
+        self.assertEqual(self.calls("users", "GET /userinfo/{id}/"), 1)
+        self.assertTrue(UserReplica.objects.filter(id=13).exists())
@@ -0,0 +1,154 @@
+import asyncio
+from unittest import mock
+
+from django.http import StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+
+from composite import resilience
+from composite.logutil import current_request_id
+from composite.middleware import DeadlineMiddleware, RequestIdMiddleware
+from composite.resilience import (
+    CircuitBreaker, CircuitOpen, DeadlineExceeded, call_budget, end_deadline,
+    remaining_budget, start_deadline)
+
+from .utils import StubServicesMixin, auth
+
+
+@override_settings(RESILIENCE={
+    'BREAKER_MIN_CALLS': 4, 'BREAKER_FAILURE_RATE': 0.5,
+    'BREAKER_OPEN_SECONDS': 10, 'BREAKER_HALF_OPEN_CALLS': 2})
+class CircuitBreakerTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch("composite.resilience.time")
+        self.clock = patcher.start().monotonic
+        self.clock.return_value = 1000.0
+        self.addCleanup(patcher.stop)
+        self.breaker = CircuitBreaker("test")
+
+    def open_breaker(self):
+        for _ in range(2):
+            self.breaker.record_success()
+        for _ in range(2):
+            self.breaker.record_failure()
+
+    def test_opens_at_failure_rate(self):
+        self.breaker.record_success()
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        with self.assertRaises(CircuitOpen):
+            self.breaker.before_call()
+
+    def test_half_open_after_cool_down_then_closes(self):
+        self.open_breaker()
+        self.clock.return_value += 10
+        self.breaker.before_call()
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+        self.breaker.before_call()
+        with self.assertRaises(CircuitOpen):
+            self.breaker.before_call()
+        self.breaker.record_success()
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_failed_trial_reopens(self):
+        self.open_breaker()
+        self.clock.return_value += 10
+        self.breaker.before_call()
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        with self.assertRaises(CircuitOpen):
+            self.breaker.before_call()
+
+    def test_unreported_trials_do_not_wedge_half_open(self):
+        self.open_breaker()
+        self.clock.return_value += 10
+        self.breaker.before_call()
+        self.breaker.before_call()
+        self.clock.return_value += 10
+        self.breaker.before_call()
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+
+    def test_inconclusive_trials_free_their_slot(self):
+        self.open_breaker()
+        self.clock.return_value += 10
+        self.breaker.before_call()
+        self.breaker.before_call()
+        self.breaker.record_inconclusive()
+        self.breaker.before_call()
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+
+
+class CallBudgetTests(SimpleTestCase):
+    def test_outside_a_request(self):
+        self.assertEqual(call_budget(1, 5), ((1, 5), {}))
+
+    def test_timeouts_fit_the_remaining_budget(self):
+        token = start_deadline(2.1)
+        try:
+            (connect, read), headers = call_budget(1, 5)
+        finally:
+            end_deadline(token)
+        self.assertEqual(connect, 1)
+        self.assertLessEqual(read, 2)
+        self.assertLessEqual(int(headers["X-Request-Deadline-Ms"]), 2000)
+
+    def test_spent_budget(self):
+        token = start_deadline(0)
+        try:
+            with self.assertRaises(DeadlineExceeded):
+                call_budget(1, 5)
+        finally:
+            end_deadline(token)
+
+
+def streamed_view(request):
+    def body():
+        yield b"budget" if remaining_budget() is not None else b"none"
+        yield b"," + (current_request_id() or "none").encode()
+    return StreamingHttpResponse(body())
+
+
+async def async_streamed_view(request):
+    async def body():
+        await asyncio.sleep(0)
+        yield b"budget" if remaining_budget() is not None else b"none"
+        yield b"," + (current_request_id() or "none").encode()
+    return StreamingHttpResponse(body())
+
+
+class StreamedContextTests(SimpleTestCase):
+    def request(self):
+        return RequestFactory().get("/", HTTP_X_REQUEST_ID="abc123")
+
+    def test_streamed_bodies_keep_the_deadline_and_request_id(self):
+        response = RequestIdMiddleware(DeadlineMiddleware(streamed_view))(
+            self.request())
+        self.assertEqual(b"".join(response.streaming_content), b"budget,abc123")
+        self.assertIsNone(remaining_budget())
+
+    def test_async_streamed_bodies_too(self):
+        async def run():
+            middleware = RequestIdMiddleware(DeadlineMiddleware(async_streamed_view))
+            response = await middleware(self.request())
+            return b"".join([chunk async for chunk in response.streaming_content])
+
+        self.assertEqual(asyncio.run(run()), b"budget,abc123")
+
+
+@override_settings(RESILIENCE={'BREAKER_MIN_CALLS': 2})
+class ShortDeadlineTests(StubServicesMixin, TestCase):
+    def test_short_caller_deadlines_do_not_open_the_breaker(self):
+        headers = auth()
+        self.assertEqual(
+            self.client.get("/getavailability/1/", **headers).status_code, 200)
+        self.stub_config.latency = 0.5
+        for availability_id in (2, 3):
+            response = self.client.get(
+                f"/getavailability/{availability_id}/",
+                HTTP_X_REQUEST_DEADLINE_MS="300", **headers)
+            self.assertEqual(response.status_code, 500)
+        self.assertEqual(resilience.get_breaker("scheduling").state,
+                         CircuitBreaker.CLOSED)
@@ -0,0 +1,80 @@
+from unittest import mock
+
+from django.test import TestCase
+
+from composite import changes, metrics
+from composite.response_cache import get_response_cache
+
+from .utils import StubServicesMixin, auth
+
+
+class ResponseCacheTests(StubServicesMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.headers = auth()
+
+    def get(self, path="/getevent/10/", **extra):
+        return self.client.get(path, **self.headers, **extra)
+
+    def test_repeated_reads_are_served_from_the_cache(self):
+        first = self.get()
+        second = self.get()
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(first["Cache-Control"], "private, max-age=30")
+        self.assertEqual(self.calls("scheduling"), 1)
+        self.assertEqual(get_response_cache().stats()["hits"], 1)
+
+    def test_matching_etag_gets_a_bodiless_304(self):
+        etag = self.get()["ETag"]
+        response = self.get(HTTP_IF_NONE_MATCH=f'"other", W/{etag}')
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+        self.assertEqual(response["ETag"], etag)
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+
+    def test_fieldsets_are_cached_separately(self):
+        full = self.get()
+        sparse = self.get(data={"fields": "id,title"})
+        self.assertEqual(sparse.json(), {"id": 10, "title": "Event 10"})
+        self.assertNotEqual(sparse["ETag"], full["ETag"])
+        self.assertEqual(self.calls("scheduling"), 2)
+
+    def test_invalidation_retires_every_copy(self):
+        self.get()
+        get_response_cache().invalidate("event", 10)
+        self.get()
+        self.assertEqual(self.calls("scheduling"), 2)
+
+    def test_a_changed_embedded_user_retires_the_aggregate(self):
+        self.get()
+        get_response_cache().invalidate("user", 11)
+        self.get()
+        self.assertEqual(self.calls("scheduling"), 2)
+
+    def test_failures_are_not_cached(self):
+        # Resolves the caller before the services start failing
+        self.get("/getavailability/3/")
+        self.stub_config.error_rate = 1.0
+        self.assertEqual(self.get("/getavailability/4/").status_code, 500)
+        self.stub_config.error_rate = 0.0
+        self.assertEqual(self.get("/getavailability/4/").status_code, 200)
+
+    def test_staleness_is_exported(self):
+        self.get()
+        self.get()
+        exported = {name: values for name, _, _, values
+                    in metrics.collect_components()}
+        self.assertEqual(
+            exported["composite_response_cache_hit_ratio"], {(): 0.5})
+        ages = exported["composite_response_cache_served_age_seconds"]
+        self.assertEqual(set(ages), {(("stat", "avg"),), (("stat", "max"),)})
+        self.assertGreater(ages[(("stat", "max"),)], 0)
+
+    def test_created_events_evict_the_event_listing(self):
+        with mock.patch.object(changes, "evict_upstream") as evict:
+            response = self.client.post(
+                "/postevent/", {"title": "T", "participant_ids": []},
+                content_type="application/json", **self.headers)
+        self.assertEqual(response.status_code, 201)
+        evict.assert_any_call("scheduling", "/events/")
+        self.assertEqual(get_response_cache().stats()["invalidations"], 1)
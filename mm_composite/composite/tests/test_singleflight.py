@@ -0,0 +1,172 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+from django.core.cache import caches
+from django.test import SimpleTestCase, override_settings
+
+from composite.singleflight import SingleFlight, authorization_scope
+
+from .utils import StubServicesMixin, auth
+
+
+class SingleFlightTests(SimpleTestCase):
+    def setUp(self):
+        self.flights = SingleFlight()
+        self.calls = 0
+        self.release = threading.Event()
+
+    def build(self):
+        self.calls += 1
+        # Only the first build is held up
+        if self.calls == 1:
+            self.release.wait(5)
+        return {"built": self.calls}
+
+    def followers(self, count, key="event:1", func=None):
+        """Start a leader and ``count`` followers; :return: their futures"""
+        pool = ThreadPoolExecutor(count + 1)
+        self.addCleanup(pool.shutdown)
+        futures = [pool.submit(self.flights.do, key, func or self.build)]
+        while self.flights.stats()["in_flight"] == 0:
+            pass
+        futures += [pool.submit(self.flights.do, key, func or self.build)
+                    for _ in range(count)]
+        while self.flights.stats()["shared"] < count:
+            pass
+        return futures
+
+    def test_concurrent_calls_share_one_build(self):
+        futures = self.followers(3)
+        self.release.set()
+        self.assertEqual([future.result(5) for future in futures],
+                         [{"built": 1}] * 4)
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(self.flights.stats(), {
+            "led": 1, "shared": 3, "shared_remote": 0, "in_flight": 0})
+
+    def test_leader_errors_reach_followers(self):
+        def fail():
+            self.release.wait(5)
+            raise ValueError("upstream down")
+
+        futures = self.followers(2, func=fail)
+        self.release.set()
+        for future in futures:
+            with self.assertRaisesMessage(ValueError, "upstream down"):
+                future.result(5)
+
+    @override_settings(SINGLEFLIGHT={'WAIT_TIMEOUT': 0.05})
+    def test_followers_give_up_and_build(self):
+        futures = self.followers(1)
+        with self.assertLogs("composite.singleflight", "WARNING"):
+            self.assertEqual(futures[1].result(5), {"built": 2})
+        self.release.set()
+        self.assertEqual(futures[0].result(5), {"built": 2})
+        self.assertEqual(self.calls, 2)
+
+    def test_different_keys_build_separately(self):
+        self.release.set()
+        self.flights.do("event:1", self.build)
+        self.flights.do("event:2", self.build)
+        self.assertEqual(self.calls, 2)
+
+
+class SharedSingleFlightTests(SimpleTestCase):
+    def setUp(self):
+        self.cache = caches["default"]
+        self.cache.clear()
+        self.flights = SingleFlight(shared_backend="default")
+
+    @override_settings(SINGLEFLIGHT={'POLL_INTERVAL': 0.01})
+    def test_waits_for_another_workers_result(self):
+        lock_key = f"{SingleFlight.key_prefix}:lock:event:1"
+        result_key = f"{SingleFlight.key_prefix}:result:event:1"
+        self.cache.add(lock_key, "other-worker")
+
+        def other_worker_publishes():
+            self.cache.set(result_key, {"built": "elsewhere"})
+            self.cache.delete(lock_key)
+
+        timer = threading.Timer(0.05, other_worker_publishes)
+        timer.start()
+        self.addCleanup(timer.cancel)
+        self.assertEqual(self.flights.do("event:1", lambda: {"built": "here"}),
+                         {"built": "elsewhere"})
+        self.assertEqual(self.flights.stats()["shared_remote"], 1)
+
+    @override_settings(SINGLEFLIGHT={'WAIT_TIMEOUT': 0.05, 'POLL_INTERVAL': 0.01})
+    def test_stuck_locks_do_not_block(self):
+        self.cache.add(f"{SingleFlight.key_prefix}:lock:event:1", "dead-worker")
+        self.assertEqual(self.flights.do("event:1", lambda: {"built": "here"}),
+                         {"built": "here"})
+
+    def test_leader_publishes_and_unlocks(self):
+        self.flights.do("event:1", lambda: {"built": "here"})
+        self.assertEqual(
+            self.cache.get(f"{SingleFlight.key_prefix}:result:event:1"),
+            {"built": "here"})
+        self.assertIsNone(self.cache.get(f"{SingleFlight.key_prefix}:lock:event:1"))
+
+
+class AsyncSingleFlightTests(SimpleTestCase):
+    def test_concurrent_tasks_share_one_build(self):
+        flights = SingleFlight()
+        calls = []
+
+        async def build():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return len(calls)
+
+        async def run():
+            return await asyncio.gather(
+                *(flights.ado("event:1", build) for _ in range(3)))
+
+        self.assertEqual(asyncio.run(run()), [1, 1, 1])
+        self.assertEqual(flights.stats()["shared"], 2)
+
+    def test_followers_rebuild_if_the_leader_is_cancelled(self):
+        flights = SingleFlight()
+
+        async def build():
+            await asyncio.sleep(0.05)
+            return "built"
+
+        async def run():
+            leader = asyncio.ensure_future(flights.ado("event:1", build))
+            await asyncio.sleep(0)
+            follower = asyncio.ensure_future(flights.ado("event:1", build))
+            await asyncio.sleep(0)
+            leader.cancel()
+            return await follower
+
+        self.assertEqual(asyncio.run(run()), "built")
+
+
+class AuthorizationScopeTests(SimpleTestCase):
+    def request(self, **claims):
+        return SimpleNamespace(auth=claims, user=SimpleNamespace(id=7))
+
+    def test_per_caller_by_default(self):
+        self.assertEqual(authorization_scope(self.request(tenant="a")), "user=7")
+
+    @override_settings(SINGLEFLIGHT={'SCOPE_CLAIM': 'tenant'})
+    def test_shared_by_claim(self):
+        self.assertEqual(authorization_scope(self.request(tenant="a")), "tenant=a")
+        self.assertEqual(authorization_scope(self.request()), "user=7")
+
+
+class SingleFlightViewTests(StubServicesMixin, SimpleTestCase):
+    def test_concurrent_misses_share_one_build(self):
+        headers = auth()
+        self.client.get("/getavailability/1/", **headers)
+        self.stub_config.latency = 0.1
+        with ThreadPoolExecutor(3) as pool:
+            responses = list(pool.map(
+                lambda _: self.client_class().get("/getavailability/3/", **headers),
+                range(3)))
+        self.assertEqual([response.status_code for response in responses],
+                         [200] * 3)
+        self.assertEqual(self.calls("scheduling", "GET /availabilities/{id}/"), 2)
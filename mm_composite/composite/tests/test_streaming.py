@@ -0,0 +1,73 @@
+import json
+
+from django.test import SimpleTestCase, TestCase
+
+from composite.benchmark.stubs import user
+from composite.streaming import encode_record, enrichment_records
+
+from .utils import StubServicesMixin, auth
+
+
+def ndjson(response):
+    return [json.loads(line)
+            for line in b"".join(response.streaming_content).splitlines()]
+
+
+class EncodeRecordTests(SimpleTestCase):
+    def test_formats(self):
+        self.assertEqual(encode_record("ndjson", "user", {"id": 1}),
+                         b'{"type":"user","data":{"id":1}}\n')
+        self.assertEqual(encode_record("sse", "user", {"id": 1}),
+                         b'event: user\ndata: {"id":1}\n\n')
+
+
+class EnrichmentRecordsTests(SimpleTestCase):
+    def test_failed_users_are_listed_in_the_trailer(self):
+        class Users:
+            def iter_many(self, user_ids):
+                yield 1, user(1), None
+                yield 2, None, LookupError("gone")
+
+        records = list(enrichment_records([("event", {"id": 5})], [1, 2], Users()))
+        self.assertEqual(records, [
+            ("event", {"id": 5}),
+            ("user", user(1)),
+            ("trailer", {"resolved": 1,
+                         "failures": [{"id": 2, "error": "gone"}]}),
+        ])
+
+
+class StreamingViewTests(StubServicesMixin, TestCase):
+    def test_event_as_ndjson(self):
+        response = self.client.get("/getevent/10/", {"stream": "ndjson"}, **auth())
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        self.assertEqual(response["X-Accel-Buffering"], "no")
+        records = ndjson(response)
+        self.assertEqual(records[0]["type"], "event")
+        self.assertEqual(records[0]["data"]["participant_ids"], [11, 12, 13])
+        self.assertEqual(sorted(record["data"]["id"] for record in records[1:-1]),
+                         [1, 11, 12, 13])
+        self.assertEqual(records[-1], {"type": "trailer",
+                                       "data": {"resolved": 4, "failures": []}})
+
+    def test_event_as_server_sent_events(self):
+        response = self.client.get("/getevent/10/", {"stream": "sse"}, **auth())
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        body = b"".join(response.streaming_content).decode()
+        events = [block.split("\n")[0] for block in body.split("\n\n") if block]
+        self.assertEqual(events, ["event: event"] + ["event: user"] * 4
+                         + ["event: trailer"])
+
+    def test_event_list(self):
+        response = self.client.get("/getevents/", {"stream": "ndjson"}, **auth())
+        records = ndjson(response)
+        self.assertEqual(records[0], {"type": "page", "data": {
+            "count": 1000, "next": None, "previous": None}})
+        self.assertEqual([record["type"] for record in records[1:26]],
+                         ["event"] * 25)
+        self.assertEqual(records[-1]["data"]["resolved"], 28)
+
+    def test_unknown_format_gets_a_regular_response(self):
+        response = self.client.get("/getevent/10/", {"stream": "xml"}, **auth())
+        self.assertEqual(response["Content-Type"], "application/json")
+        self.assertEqual(response.json()["id"], 10)
@@ -0,0 +1,177 @@
+import tempfile
+import time
+from pathlib import Path
+from unittest import mock
+
+from django.core.checks import run_checks
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from composite import invitations, tasks
+from composite.users import UserInfoClient
+
+from .utils import StubServicesMixin, auth
+
+# Jobs run by the tests, by dotted path
+ran = []
+
+
+def record(payload):
+    ran.append(payload)
+
+
+def fail_then_succeed(payload):
+    ran.append(payload)
+    if payload.get("failed"):
+        return
+    raise tasks.Retry({**payload, "failed": True}, "first attempt fails")
+
+
+def always_fail(payload):
+    ran.append(payload)
+    raise RuntimeError("broken")
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("Condition not met in time")
+        time.sleep(0.01)
+
+
+QUICK_RETRIES = {'WORKERS': 1, 'MAX_RETRIES': 1, 'BACKOFF_BASE': 0.01}
+
+
+class QueueBackendTestsMixin:
+    def setUp(self):
+        ran.clear()
+
+    def test_runs_jobs(self):
+        self.queue.enqueue(f"{__name__}.record", {"n": 1})
+        self.drain(lambda: ran)
+        self.assertEqual(ran, [{"n": 1}])
+
+    def test_retry_with_the_remaining_work(self):
+        self.queue.enqueue(f"{__name__}.fail_then_succeed", {"n": 1})
+        self.drain(lambda: len(ran) == 2)
+        self.assertEqual(ran, [{"n": 1}, {"n": 1, "failed": True}])
+
+    def test_exhausted_jobs_are_dead_lettered(self):
+        self.queue.enqueue(f"{__name__}.always_fail", {"n": 1})
+        self.drain(self.queue.dead_letters)
+        self.assertEqual(len(ran), 2)
+        self.assertEqual(self.queue.dead_letters(), [{
+            "task": f"{__name__}.always_fail", "payload": {"n": 1},
+            "attempts": 2, "error": "broken"}])
+
+
+@override_settings(TASK_QUEUE=QUICK_RETRIES)
+class ThreadQueueBackendTests(QueueBackendTestsMixin, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        self.queue = tasks.ThreadQueueBackend()
+
+    def drain(self, until):
+        wait_for(until)
+
+    @override_settings(TASK_QUEUE={**QUICK_RETRIES, 'MAX_DEPTH': 1})
+    def test_full_queue(self):
+        queue = tasks.ThreadQueueBackend()
+        # Not started, so nothing drains it
+        queue._started = True
+        queue.enqueue(f"{__name__}.record", {})
+        with self.assertRaises(tasks.QueueFull):
+            queue.enqueue(f"{__name__}.record", {})
+
+
+# Jobs are run by the test itself rather than by worker threads, which would
+# outlive the test's database file
+@override_settings(TASK_QUEUE={**QUICK_RETRIES, 'WORKERS': 0})
+class SqliteQueueBackendTests(QueueBackendTestsMixin, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = Path(directory.name) / "queue.sqlite3"
+        self.queue = tasks.SqliteQueueBackend(self.path)
+
+    def drain(self, until):
+        """Run jobs as ``runworkers`` would until ``until()`` holds."""
+        def run_next():
+            row = self.queue._claim()
+            if row is not None:
+                self.queue._run(*row)
+            return until()
+
+        wait_for(run_next)
+
+    def test_jobs_survive_a_restart(self):
+        tasks.SqliteQueueBackend(self.path).enqueue(f"{__name__}.record", {"n": 1})
+        self.assertEqual(self.queue.depth(), 1)
+        self.drain(lambda: ran)
+        self.assertEqual(ran, [{"n": 1}])
+        self.assertEqual(self.queue.depth(), 0)
+
+    @override_settings(TASK_QUEUE={**QUICK_RETRIES, 'WORKERS': 0,
+                                   'LEASE_TIMEOUT': 0})
+    def test_expired_leases_are_handed_out_again(self):
+        queue = tasks.SqliteQueueBackend(self.path)
+        queue.enqueue(f"{__name__}.record", {"n": 1})
+        # A worker claims the job, then dies
+        self.assertIsNotNone(queue._claim())
+        self.assertIsNotNone(queue._claim())
+
+
+class InvitationTests(StubServicesMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        tasks._queue = None
+        self.addCleanup(setattr, tasks, "_queue", None)
+
+    def test_invitations_are_sent_in_the_background(self):
+        response = self.client.post(
+            "/postevent/", {"title": "T", "participant_ids": [2, 3, 4]},
+            content_type="application/json", **auth())
+        self.assertEqual(response.status_code, 201)
+        wait_for(lambda: self.calls("notifications") == 3)
+        self.assertEqual(self.calls("users", "GET /userinfo/{id}/"), 3)
+
+    def test_in_memory_queue_looks_users_up_with_the_callers_token(self):
+        with mock.patch.object(invitations, "UserInfoClient",
+                               wraps=UserInfoClient) as client:
+            invitations.dispatch_event_emails(
+                {"id": 1, "participant_ids": [2]}, "caller-token")
+            wait_for(lambda: self.calls("notifications") == 1)
+        client.assert_called_once_with("Bearer caller-token")
+
+    @override_settings(INVITATIONS={'SERVICE_TOKEN': 'service-token'})
+    def test_service_token_is_preferred(self):
+        with mock.patch.object(tasks, "enqueue") as enqueue:
+            invitations.dispatch_event_emails(
+                {"id": 1, "participant_ids": [2]}, "caller-token")
+        enqueue.assert_called_once_with(
+            invitations.SEND_EVENT_EMAILS,
+            {"event": {"id": 1, "participant_ids": [2]}})
+
+    def test_durable_queue_never_stores_the_callers_token(self):
+        queue = mock.Mock(durable=True)
+        with mock.patch.object(tasks, "get_queue", return_value=queue):
+            invitations.dispatch_event_emails(
+                {"id": 1, "participant_ids": [2]}, "caller-token")
+        ((_, payload), _), = queue.enqueue.call_args_list
+        self.assertNotIn("auth_header", payload)
+
+
+class ServiceTokenCheckTests(SimpleTestCase):
+    def errors(self):
+        return [error.id for error in run_checks()
+                if error.id == "composite.E002"]
+
+    @override_settings(TASK_QUEUE={'BACKEND': 'composite.tasks.SqliteQueueBackend'})
+    def test_durable_queue_requires_a_service_token(self):
+        self.assertEqual(self.errors(), ["composite.E002"])
+        with override_settings(INVITATIONS={'SERVICE_TOKEN': 'service-token'}):
+            self.assertEqual(self.errors(), [])
+
+    def test_in_memory_queue_does_not(self):
+        self.assertEqual(self.errors(), [])
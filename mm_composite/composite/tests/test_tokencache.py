@@ -0,0 +1,80 @@
+import time
+
+from django.test import SimpleTestCase, TestCase
+
+from composite.tokencache import TokenCache
+
+from .utils import StubServicesMixin, auth, reset_composite_state
+
+ALICE = {"id": 1, "username": "alice"}
+BOB = {"id": 2, "username": "bob"}
+
+
+class TokenCacheTests(SimpleTestCase):
+    def setUp(self):
+        reset_composite_state()
+
+    def test_hit_and_miss(self):
+        cache = TokenCache(max_entries=10, ttl=60)
+        self.assertIsNone(cache.get("token-a"))
+        cache.set("token-a", ALICE)
+        self.assertEqual(cache.get("token-a"), ALICE)
+        self.assertEqual(cache.stats(), {"hits": 1, "misses": 1,
+                                         "evictions": 0, "size": 1})
+
+    def test_entries_expire_with_the_token(self):
+        cache = TokenCache(max_entries=10, ttl=60)
+        cache.set("expired", ALICE, exp=time.time() - 1)
+        cache.set("expiring", BOB, exp=time.time() + 0.05)
+        self.assertIsNone(cache.get("expired"))
+        self.assertEqual(cache.get("expiring"), BOB)
+        time.sleep(0.1)
+        self.assertIsNone(cache.get("expiring"))
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = TokenCache(max_entries=2, ttl=60)
+        cache.set("a", ALICE)
+        cache.set("b", BOB)
+        cache.get("a")
+        cache.set("c", BOB)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), ALICE)
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_shared_tier_serves_other_processes(self):
+        TokenCache(max_entries=10, ttl=60, shared_backend='default').set(
+            "token-a", ALICE)
+        other_worker = TokenCache(max_entries=10, ttl=60, shared_backend='default')
+        self.assertEqual(other_worker.get("token-a"), ALICE)
+
+    def test_raw_tokens_are_not_used_as_keys(self):
+        cache = TokenCache(max_entries=10, ttl=60)
+        cache.set("secret-token", ALICE)
+        self.assertNotIn("secret-token", cache._entries)
+
+    def test_evict_user(self):
+        cache = TokenCache(max_entries=10, ttl=60)
+        cache.set("a1", ALICE)
+        cache.set("a2", ALICE)
+        cache.set("b", BOB)
+        self.assertEqual(cache.evict_user(1), 2)
+        self.assertIsNone(cache.get("a1"))
+        self.assertEqual(cache.get("b"), BOB)
+
+
+class AuthenticationCacheTests(StubServicesMixin, TestCase):
+    def test_token_is_resolved_once(self):
+        headers = auth()
+        for _ in range(3):
+            self.assertEqual(
+                self.client.get("/getavailability/1/", **headers).status_code, 200)
+        self.assertEqual(self.calls("users", "GET /userinfo/"), 1)
+
+    def test_failed_resolution_is_not_cached(self):
+        self.stub_config.error_rate = 1.0
+        headers = auth()
+        self.assertEqual(
+            self.client.get("/getavailability/1/", **headers).status_code, 401)
+        self.stub_config.error_rate = 0.0
+        self.assertEqual(
+            self.client.get("/getavailability/1/", **headers).status_code, 200)
@@ -0,0 +1,186 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import Future
+from unittest import mock
+
+from django.conf import settings
+from django.test import SimpleTestCase, override_settings
+
+from composite import users
+from composite.benchmark.stubs import StubConfig, StubService, user
+from composite.resilience import end_deadline, start_deadline
+from composite.users import AsyncUserInfoClient, UserInfoClient
+
+from .utils import reset_composite_state
+
+
+def user_service_with_bulk():
+    def get_user(match, query, body):
+        return 200, user(int(match.group(1)))
+
+    def get_bulk(match, query, body):
+        ids = [int(uid) for uid in query["ids"][0].split(",")]
+        # User 404 does not exist
+        return 200, {"results": [user(uid) for uid in ids if uid != 404]}
+
+    return StubService("users", [
+        ("GET", r"/userinfo/bulk/", "/userinfo/bulk/", get_bulk),
+        ("GET", r"/userinfo/(\d+)/", "/userinfo/{id}/", get_user),
+    ], StubConfig(latency=0, jitter=0)).start()
+
+
+class UserInfoClientTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.stub = user_service_with_bulk()
+        cls.addClassCleanup(cls.stub.stop)
+
+    def setUp(self):
+        reset_composite_state()
+        self.stub.reset()
+        services = override_settings(DOWNSTREAM_SERVICES={
+            **settings.DOWNSTREAM_SERVICES,
+            "users": {"BASE_URL": self.stub.base_url, "RETRIES": 0}})
+        services.enable()
+        self.addCleanup(services.disable)
+
+    def test_single_lookups(self):
+        found = UserInfoClient("Bearer t").get_many([1, 2, 2, None])
+        self.assertEqual(found, {1: user(1), 2: user(2)})
+        self.assertEqual(self.stub.snapshot(), {"GET /userinfo/{id}/": 2})
+
+    @override_settings(USER_SERVICE={'BULK_PATH': '/userinfo/bulk/',
+                                     'BULK_MAX_IDS': 2})
+    def test_bulk_lookups_in_chunks(self):
+        found = UserInfoClient("Bearer t").get_many([1, 2, 3, 404])
+        self.assertEqual(set(found), {1, 2, 3})
+        self.assertEqual(self.stub.snapshot(), {"GET /userinfo/bulk/": 2})
+
+    @override_settings(USER_SERVICE={'CACHE_BACKEND': 'default'})
+    def test_profile_cache(self):
+        UserInfoClient("Bearer t").get_many([1, 2])
+        found = UserInfoClient("Bearer other").get_many([1, 2])
+        self.assertEqual(found, {1: user(1), 2: user(2)})
+        self.assertEqual(self.stub.total_calls(), 2)
+
+    def test_iter_many_yields_each_user(self):
+        records = list(UserInfoClient("Bearer t").iter_many([1, 2]))
+        self.assertEqual(sorted((uid, error) for uid, _, error in records),
+                         [(1, None), (2, None)])
+
+
+class CoalescingTests(SimpleTestCase):
+    def setUp(self):
+        users._in_flight.clear()
+        self.addCleanup(users._in_flight.clear)
+        self.release = threading.Event()
+        self.fetches = []
+
+    def blocking_fetch(self, user_ids):
+        self.fetches.append(list(user_ids))
+        self.release.wait(5)
+        return {uid: user(uid) for uid in user_ids}, {}
+
+    def start_owner(self, client, results):
+        owner = threading.Thread(
+            target=lambda: results.append(client.get_many([5])))
+        owner.start()
+        for _ in range(100):
+            if 5 in users._in_flight:
+                break
+            time.sleep(0.01)
+        return owner
+
+    def test_overlapping_lookups_share_one_call(self):
+        results = []
+        with mock.patch.object(UserInfoClient, "_fetch", self.blocking_fetch):
+            owner = self.start_owner(UserInfoClient("Bearer a"), results)
+            joiner = threading.Thread(target=lambda: results.append(
+                UserInfoClient("Bearer b").get_many([5])))
+            joiner.start()
+            time.sleep(0.1)
+            self.release.set()
+            owner.join()
+            joiner.join()
+        self.assertEqual(self.fetches, [[5]])
+        self.assertEqual(results, [{5: user(5)}, {5: user(5)}])
+        self.assertEqual(users._in_flight, {})
+
+    def test_failed_lookup_resolves_waiters(self):
+        def failing_fetch(client, user_ids):
+            self.release.wait(5)
+            raise RuntimeError("user service down")
+
+        results = []
+        with mock.patch.object(UserInfoClient, "_fetch", failing_fetch):
+            owner = self.start_owner(UserInfoClient(), results)
+            waiter = Future()
+            users._in_flight[5].add_done_callback(waiter.set_result)
+            self.release.set()
+            owner.join()
+        self.assertIsInstance(waiter.result(1).exception(), RuntimeError)
+        self.assertEqual(results, [{}])
+        self.assertEqual(users._in_flight, {})
+
+    def test_failure_storing_users_resolves_waiters(self):
+        with mock.patch.object(UserInfoClient, "_fetch", self.blocking_fetch), \
+                mock.patch.object(users, "remember_users",
+                                  side_effect=RuntimeError("cache down")):
+            self.release.set()
+            with self.assertRaises(RuntimeError):
+                UserInfoClient().get_many([5])
+        self.assertEqual(users._in_flight, {})
+
+    def test_joined_wait_is_bounded_by_the_request_deadline(self):
+        users._in_flight[5] = Future()
+        token = start_deadline(0.2)
+        start = time.monotonic()
+        try:
+            found = UserInfoClient().get_many([5])
+        finally:
+            end_deadline(token)
+        self.assertEqual(found, {})
+        self.assertLess(time.monotonic() - start, 1)
+
+
+class AsyncCoalescingTests(SimpleTestCase):
+    def test_overlapping_lookups_share_one_call(self):
+        fetches = []
+
+        async def fetch(client, user_ids):
+            fetches.append(list(user_ids))
+            await asyncio.sleep(0.05)
+            return {uid: user(uid) for uid in user_ids}, {}
+
+        async def run():
+            return await asyncio.gather(
+                AsyncUserInfoClient("Bearer a").get_many([5, 6]),
+                AsyncUserInfoClient("Bearer b").get_many([5]))
+
+        with mock.patch.object(AsyncUserInfoClient, "_fetch", fetch):
+            both = asyncio.run(run())
+        self.assertEqual(fetches, [[5, 6]])
+        self.assertEqual(both, [{5: user(5), 6: user(6)}, {5: user(5)}])
+
+    def test_cancelled_owner_resolves_waiters(self):
+        async def fetch(client, user_ids):
+            await asyncio.sleep(10)
+
+        async def run():
+            owner = asyncio.ensure_future(AsyncUserInfoClient().get_many([5]))
+            await asyncio.sleep(0.01)
+            waiter = asyncio.ensure_future(AsyncUserInfoClient().get_many([5]))
+            await asyncio.sleep(0.01)
+            owner.cancel()
+            start = time.monotonic()
+            found = await waiter
+            in_flight = users._async_in_flight[asyncio.get_running_loop()]
+            return found, time.monotonic() - start, dict(in_flight)
+
+        with mock.patch.object(AsyncUserInfoClient, "_fetch", fetch):
+            found, elapsed, in_flight = asyncio.run(run())
+        self.assertEqual(found, {})
+        self.assertLess(elapsed, 1)
+        self.assertEqual(in_flight, {})
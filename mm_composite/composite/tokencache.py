@@ -0,0 +1,159 @@
+"""
+Cache of resolved users keyed by bearer token.
+
+``RemoteJWTAuthentication`` asks the auth service who a token belongs to on
+every request. The answer does not change for the lifetime of the token, so
+it is kept in a bounded in-process LRU until the token's ``exp`` claim or the
+configured TTL runs out, whichever comes first. A Django cache alias can be
+configured as a second tier so several workers share entries.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+DEFAULTS = {
+    # Entries kept in the in-process LRU
+    'MAX_ENTRIES': 10000,
+    # Upper bound (seconds) on how long a resolved user is trusted
+    'TTL': 300,
+    # Optional Django cache alias shared between workers, e.g. 'default'
+    'SHARED_BACKEND': None,
+}
+
+
+def token_cache_setting(name):
+    return getattr(settings, 'TOKEN_CACHE', {}).get(name, DEFAULTS[name])
+
+
+class TokenCache:
+    """
+    Bounded LRU of ``token -> user info`` with per-entry expiry.
+
+    :param max_entries: Maximum number of entries kept in process
+    :param ttl: Maximum lifetime of an entry in seconds
+    :param shared_backend: Optional Django cache alias used as a second tier
+    """
+
+    key_prefix = "composite:token:"
+
+    def __init__(self, max_entries, ttl, shared_backend=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.shared_backend = shared_backend
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            max_entries=token_cache_setting('MAX_ENTRIES'),
+            ttl=token_cache_setting('TTL'),
+            shared_backend=token_cache_setting('SHARED_BACKEND'),
+        )
+
+    def _key(self, token):
+        # Never keep raw tokens around as keys, especially in a shared cache
+        return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+    def get(self, token):
+        """
+        :return: Cached user info for the token, or None on a miss
+        """
+        key = self._key(token)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, user_info = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return user_info
+                del self._entries[key]
+
+        if self.shared_backend:
+            entry = caches[self.shared_backend].get(self.key_prefix + key)
+            if entry is not None and entry[0] > now:
+                self._store(key, entry)
+                with self._lock:
+                    self.hits += 1
+                return entry[1]
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, token, user_info, exp=None):
+        """
+        Remember the user a token resolved to.
+
+        :param token: Raw bearer token
+        :param user_info: Dict returned by the auth service
+        :param exp: The token's ``exp`` claim (epoch seconds), if any
+        """
+        expires_at = time.time() + self.ttl
+        if exp is not None:
+            expires_at = min(expires_at, float(exp))
+        timeout = expires_at - time.time()
+        if timeout <= 0:
+            return
+
+        key = self._key(token)
+        entry = (expires_at, user_info)
+        self._store(key, entry)
+        if self.shared_backend:
+            caches[self.shared_backend].set(
+                self.key_prefix + key, entry, timeout=int(timeout) or 1)
+
+    def _store(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def evict_user(self, user_id):
+        """
+        Forget every in-process entry resolving to a user, e.g. after their
+        profile changed. Shared entries cannot be looked up by user and
+        expire on their own.
+        """
+        with self._lock:
+            stale = [key for key, (_, user_info) in self._entries.items()
+                     if user_info.get("id") == user_id]
+            for key in stale:
+                del self._entries[key]
+        return len(stale)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self._entries),
+            }
+
+
+_token_cache = None
+
+
+def get_token_cache():
+    global _token_cache
+    if _token_cache is None:
+        _token_cache = TokenCache.from_settings()
+    return _token_cache
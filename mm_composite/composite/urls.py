@@ -1,13 +1,17 @@
+from django.conf import settings
 from django.urls import include, path
 from graphene_django.views import GraphQLView
 from django.views.decorators.csrf import csrf_exempt
 
-from . import views
+from . import async_views, changes, metrics, views
+from .loaders import Loaders
 
 
 class GraphQLContext:
     def __init__(self, request):
         self.request = request
+        # Batching loaders shared by all resolvers of this request
+        self.loaders = Loaders(request)
 
     # class CustomGraphQLView(GraphQLView):
         # def get_context(self, request):
@@ -27,11 +31,27 @@ class CustomGraphQLView(GraphQLView):
         return context
 
 
+# The async views run all downstream I/O on the event loop (ASGI); the sync
+# DRF views stay available so both can be compared
+if getattr(settings, 'COMPOSITE_ASYNC_VIEWS', False):
+    EventCreateView = async_views.AsyncEventCreateView
+    EnrichedEventView = async_views.AsyncEnrichedEventView
+    EnrichedAvailabilityView = async_views.AsyncEnrichedAvailabilityView
+else:
+    EventCreateView = views.EventCreateView
+    EnrichedEventView = views.EnrichedEventView
+    EnrichedAvailabilityView = views.EnrichedAvailabilityView
+
+
 urlpatterns = [
-    path('postevent/', views.EventCreateView.as_view(), name='event-create'),
+    path('postevent/', EventCreateView.as_view(), name='event-create'),
     path('getevent/<int:event_id>/',
-         views.EnrichedEventView.as_view(), name='get-event'),
+         EnrichedEventView.as_view(), name='get-event'),
+    path('getevents/',
+         views.EnrichedEventListView.as_view(), name='list-events'),
     path('getavailability/<int:availability_id>/',
-         views.EnrichedAvailabilityView.as_view(), name='get-event'),
+         EnrichedAvailabilityView.as_view(), name='get-event'),
     path("graphql/", csrf_exempt(CustomGraphQLView.as_view(graphiql=True))),
+    path('metrics/', metrics.metrics_view, name='metrics'),
+    path('webhooks/changes/', changes.change_webhook, name='change-webhook'),
 ]
@@ -0,0 +1,398 @@
+"""
+Client for user details held by the user service.
+
+Enrichment paths hand the full set of user IDs they need to
+``UserInfoClient.get_many``, which fetches them in as few upstream calls as
+possible: one bulk call when the user service exposes a bulk endpoint,
+otherwise bounded parallel single lookups (see ``fanout.py``).
+
+Lookups for the same ID that overlap in time are coalesced: the first caller
+performs the upstream call and everybody else waits on its result. Profiles
+are treated as public within the composite service: every caller has been
+authenticated by it, and the profile cache and the replica share them
+between callers too, so a lookup made with one caller's token serves all.
+
+With ``USER_REPLICA['ENABLED']``, users are read from the local replica
+first (see ``replica.py``) and only the missing ones are looked up remotely.
+
+With ``USER_SERVICE['CACHE_BACKEND']`` set, resolved profiles are also kept
+in that Django cache for ``CACHE_TTL`` seconds. Change notifications from
+the user service (see ``changes.py``) refresh or evict entries, so the TTL
+only bounds how long a missed notification can go unnoticed.
+"""
+
+import asyncio
+import logging
+import threading
+import weakref
+from concurrent.futures import Future, wait
+
+import requests
+from django.conf import settings
+from django.core.cache import caches
+
+from . import async_downstream, downstream, replica
+from .fanout import (
+    async_fan_out, async_iter_fan_out, fan_out, fanout_timeout, iter_fan_out)
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULTS = {
+    'USERINFO_PATH': '/userinfo/{id}/',
+    # e.g. '/userinfo/bulk/' (called with ?ids=1,2,3)
+    'BULK_PATH': None,
+    # Largest number of IDs sent in one bulk call
+    'BULK_MAX_IDS': 100,
+    # Optional Django cache alias holding resolved profiles
+    'CACHE_BACKEND': None,
+    'CACHE_TTL': 300,
+}
+
+# user_id -> Future for lookups currently in progress
+_in_flight = {}
+_in_flight_lock = threading.Lock()
+
+# event loop -> {user_id: asyncio.Future} for AsyncUserInfoClient
+_async_in_flight = weakref.WeakKeyDictionary()
+
+
+def user_service_setting(name):
+    return getattr(settings, 'USER_SERVICE', {}).get(name, DEFAULTS[name])
+
+
+def user_cache():
+    alias = user_service_setting('CACHE_BACKEND')
+    return caches[alias] if alias else None
+
+
+def user_cache_key(user_id):
+    return f"composite:user:{user_id}"
+
+
+def cached_users(user_ids):
+    """:return: Dict of the users found in the profile cache"""
+    cache = user_cache()
+    if cache is None or not user_ids:
+        return {}
+    found = cache.get_many([user_cache_key(uid) for uid in user_ids])
+    return {uid: found[user_cache_key(uid)] for uid in user_ids
+            if user_cache_key(uid) in found}
+
+
+def cache_users(user_details):
+    """:param user_details: Dict mapping user ID to user details"""
+    cache = user_cache()
+    if cache is not None and user_details:
+        cache.set_many(
+            {user_cache_key(uid): user for uid, user in user_details.items()},
+            timeout=user_service_setting('CACHE_TTL'))
+
+
+def evict_user(user_id):
+    cache = user_cache()
+    if cache is not None:
+        cache.delete(user_cache_key(user_id))
+
+
+def local_users(user_ids):
+    """:return: Dict of the users known without asking the user service"""
+    found = replica.lookup(user_ids)
+    found.update(cached_users([uid for uid in user_ids if uid not in found]))
+    return found
+
+
+def remember_users(user_details):
+    """
+    Keep users just fetched from the user service for later lookups.
+
+    :return: The users as later lookups will return them
+    """
+    replica.store(list(user_details.values()))
+    user_details = replica.project(user_details)
+    cache_users(user_details)
+    return user_details
+
+
+class UserInfoClient:
+    """
+    Fetch user details on behalf of one incoming request.
+
+    :param auth_header: Value of the Authorization header to forward, if any
+    """
+
+    def __init__(self, auth_header=None):
+        self.headers = {}
+        if auth_header:
+            self.headers["Authorization"] = auth_header
+
+    @classmethod
+    def for_request(cls, request):
+        """Build a client forwarding the bearer token of a DRF request."""
+        return cls(f"Bearer {request.auth}" if request.auth else None)
+
+    def get(self, user_id):
+        """
+        Fetch a single user.
+
+        :return: User details, or None if the lookup failed
+        """
+        return self.get_many([user_id]).get(user_id)
+
+    def get_many(self, user_ids):
+        """
+        Fetch details for every user ID.
+
+        :param user_ids: Iterable of user IDs (duplicates and falsy IDs ignored)
+        :return: Dict mapping user ID to user details (failed lookups omitted)
+        """
+        user_ids = [uid for uid in dict.fromkeys(user_ids) if uid]
+        user_details = local_users(user_ids)
+        owned, joined = {}, {}
+        with _in_flight_lock:
+            for user_id in user_ids:
+                if user_id in user_details:
+                    continue
+                if user_id in _in_flight:
+                    joined[user_id] = _in_flight[user_id]
+                else:
+                    owned[user_id] = _in_flight[user_id] = Future()
+
+        if owned:
+            results, failures = {}, {}
+            try:
+                try:
+                    results, failures = self._fetch(list(owned))
+                except Exception as e:
+                    failures = {uid: e for uid in owned}
+                results = remember_users(results)
+            finally:
+                # Whatever happened, waiters must not be left hanging
+                with _in_flight_lock:
+                    for user_id in owned:
+                        _in_flight.pop(user_id, None)
+                for user_id, future in owned.items():
+                    if user_id in results:
+                        future.set_result(results[user_id])
+                    else:
+                        future.set_exception(failures.get(
+                            user_id, LookupError(f"User {user_id} not returned")))
+            user_details.update(results)
+            for user_id, e in failures.items():
+                logger.warning("Failed to fetch user %s: %s", user_id, e)
+
+        if joined:
+            wait(joined.values(), timeout=fanout_timeout(None))
+            for user_id, future in joined.items():
+                if future.done() and not future.exception():
+                    user_details[user_id] = future.result()
+
+        return user_details
+
+    def iter_many(self, user_ids):
+        """
+        Yield ``(user_id, details, error)`` as each user resolves, for
+        streaming responses. ``error`` is None on success.
+
+        With a bulk endpoint everything arrives in one response anyway, so
+        this simply unpacks ``get_many``.
+        """
+        user_ids = [uid for uid in dict.fromkeys(user_ids) if uid]
+        cached = local_users(user_ids)
+        for user_id, user in cached.items():
+            yield user_id, user, None
+        user_ids = [uid for uid in user_ids if uid not in cached]
+        if user_service_setting('BULK_PATH'):
+            user_details = self.get_many(user_ids)
+            for user_id in user_ids:
+                if user_id in user_details:
+                    yield user_id, user_details[user_id], None
+                else:
+                    yield user_id, None, LookupError(f"User {user_id} not returned")
+            return
+        for user_id, user, error in iter_fan_out(self._fetch_one, user_ids):
+            if error is None:
+                user = remember_users({user_id: user})[user_id]
+            yield user_id, user, error
+
+    def _fetch(self, user_ids):
+        if user_service_setting('BULK_PATH'):
+            try:
+                return self._fetch_bulk(user_ids)
+            except requests.RequestException as e:
+                logger.warning("Bulk user lookup failed, falling back: %s", e)
+        return fan_out(self._fetch_one, user_ids)
+
+    def _fetch_one(self, user_id):
+        user_response = downstream.get(
+            "users", user_service_setting('USERINFO_PATH').format(id=user_id),
+            headers=self.headers
+        )
+        user_response.raise_for_status()
+        return downstream.decode(user_response)
+
+    def _fetch_bulk(self, user_ids):
+        path = user_service_setting('BULK_PATH')
+        size = user_service_setting('BULK_MAX_IDS')
+        chunks = [user_ids[i:i + size] for i in range(0, len(user_ids), size)]
+
+        def fetch_chunk(chunk):
+            response = downstream.get(
+                "users", path,
+                params={"ids": ",".join(str(uid) for uid in chunk)},
+                headers=self.headers
+            )
+            response.raise_for_status()
+            return downstream.decode(response)
+
+        chunk_results, chunk_failures = fan_out(fetch_chunk, map(tuple, chunks))
+        if chunk_failures and not chunk_results:
+            raise next(iter(chunk_failures.values()))
+
+        results, failures = {}, {}
+        for chunk, e in chunk_failures.items():
+            failures.update({uid: e for uid in chunk})
+        for payload in chunk_results.values():
+            # Accept either a list of users or a paginated envelope
+            if isinstance(payload, dict):
+                payload = payload.get("results", [])
+            for user in payload:
+                results[user.get("id")] = user
+        return results, failures
+
+
+class AsyncUserInfoClient(UserInfoClient):
+    """
+    ``UserInfoClient`` for the async views: upstream calls run on the event
+    loop through ``async_downstream``, coalesced per loop.
+    """
+
+    async def get(self, user_id):
+        return (await self.get_many([user_id])).get(user_id)
+
+    async def get_many(self, user_ids):
+        user_ids = [uid for uid in dict.fromkeys(user_ids) if uid]
+        loop = asyncio.get_running_loop()
+        in_flight = _async_in_flight.setdefault(loop, {})
+        user_details = await self._cached(user_ids)
+        owned, joined = {}, {}
+        for user_id in user_ids:
+            if user_id in user_details:
+                continue
+            if user_id in in_flight:
+                joined[user_id] = in_flight[user_id]
+            else:
+                owned[user_id] = in_flight[user_id] = loop.create_future()
+
+        if owned:
+            results, failures = {}, {}
+            try:
+                try:
+                    results, failures = await self._fetch(list(owned))
+                except Exception as e:
+                    failures = {uid: e for uid in owned}
+                results = await self._store(results)
+            finally:
+                # Also on cancellation: waiters must not be left hanging
+                for user_id, future in owned.items():
+                    in_flight.pop(user_id, None)
+                    # Waiters only check for a result; avoid "never retrieved"
+                    future.set_result(results.get(user_id))
+            user_details.update(results)
+            for user_id, e in failures.items():
+                logger.warning("Failed to fetch user %s: %s", user_id, e)
+
+        if joined:
+            await asyncio.wait(joined.values(), timeout=fanout_timeout(None))
+            for user_id, future in joined.items():
+                if future.done() and future.result() is not None:
+                    user_details[user_id] = future.result()
+
+        return user_details
+
+    async def iter_many(self, user_ids):
+        """Async generator version of ``UserInfoClient.iter_many``."""
+        user_ids = [uid for uid in dict.fromkeys(user_ids) if uid]
+        cached = await self._cached(user_ids)
+        for user_id, user in cached.items():
+            yield user_id, user, None
+        user_ids = [uid for uid in user_ids if uid not in cached]
+        if user_service_setting('BULK_PATH'):
+            user_details = await self.get_many(user_ids)
+            for user_id in user_ids:
+                if user_id in user_details:
+                    yield user_id, user_details[user_id], None
+                else:
+                    yield user_id, None, LookupError(f"User {user_id} not returned")
+            return
+        async for user_id, user, error in async_iter_fan_out(
+                self._fetch_one, user_ids):
+            if error is None:
+                user = (await self._store({user_id: user}))[user_id]
+            yield user_id, user, error
+
+    async def _cached(self, user_ids):
+        found = await replica.alookup(user_ids)
+        user_ids = [uid for uid in user_ids if uid not in found]
+        cache = user_cache()
+        if cache is None or not user_ids:
+            return found
+        cached = await cache.aget_many([user_cache_key(uid) for uid in user_ids])
+        found.update({uid: cached[user_cache_key(uid)] for uid in user_ids
+                      if user_cache_key(uid) in cached})
+        return found
+
+    async def _store(self, user_details):
+        await replica.astore(list(user_details.values()))
+        user_details = replica.project(user_details)
+        cache = user_cache()
+        if cache is not None and user_details:
+            await cache.aset_many(
+                {user_cache_key(uid): user for uid, user in user_details.items()},
+                timeout=user_service_setting('CACHE_TTL'))
+        return user_details
+
+    async def _fetch(self, user_ids):
+        if user_service_setting('BULK_PATH'):
+            try:
+                return await self._fetch_bulk(user_ids)
+            except Exception as e:
+                logger.warning("Bulk user lookup failed, falling back: %s", e)
+        return await async_fan_out(self._fetch_one, user_ids)
+
+    async def _fetch_one(self, user_id):
+        user_response = await async_downstream.get(
+            "users", user_service_setting('USERINFO_PATH').format(id=user_id),
+            headers=self.headers
+        )
+        user_response.raise_for_status()
+        return async_downstream.decode(user_response)
+
+    async def _fetch_bulk(self, user_ids):
+        path = user_service_setting('BULK_PATH')
+        size = user_service_setting('BULK_MAX_IDS')
+        chunks = [user_ids[i:i + size] for i in range(0, len(user_ids), size)]
+
+        async def fetch_chunk(chunk):
+            response = await async_downstream.get(
+                "users", path,
+                params={"ids": ",".join(str(uid) for uid in chunk)},
+                headers=self.headers
+            )
+            response.raise_for_status()
+            return async_downstream.decode(response)
+
+        chunk_results, chunk_failures = await async_fan_out(
+            fetch_chunk, map(tuple, chunks))
+        if chunk_failures and not chunk_results:
+            raise next(iter(chunk_failures.values()))
+
+        results, failures = {}, {}
+        for chunk, e in chunk_failures.items():
+            failures.update({uid: e for uid in chunk})
+        for payload in chunk_results.values():
+            if isinstance(payload, dict):
+                payload = payload.get("results", [])
+            for user in payload:
+                results[user.get("id")] = user
+        return results, failures
@@ -1,11 +1,18 @@
 # from rest_framework.authentication import BaseAuthentication
+import time
+
 import requests
 from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
 from rest_framework.exceptions import AuthenticationFailed
 
+from . import downstream, jwks, metrics
+from .tokencache import get_token_cache
+
 
 class RemoteJWTAuthentication(JWTAuthentication):
-    AUTH_SERVICE_URL = "http://localhost:8001/userinfo/"
+    AUTH_SERVICE = "users"
+    AUTH_SERVICE_PATH = "/userinfo/"
 
     def get_header(self, request):
         header = request.headers.get("Authorization")
@@ -14,21 +21,69 @@ class RemoteJWTAuthentication(JWTAuthentication):
         return header
 
     def authenticate(self, request):
-        validated_token = self.get_validated_token(self.get_raw_token(request))
-        user_info = self.fetch_user_info(validated_token)
+        raw_token = self.get_raw_token(request)
+        validated_token = self.get_validated_token(raw_token)
+        start = time.perf_counter()
+
+        token_cache = get_token_cache()
+        user_info = self.local_user_info(validated_token)
+        result = "local"
+        # Reuse the user this token resolved to until it expires, unless the
+        # token was revoked since
+        if user_info is None and not self.is_revoked(validated_token):
+            user_info = token_cache.get(raw_token)
+            result = "cached"
+        if user_info is None:
+            user_info = self.fetch_user_info(validated_token)
+            result = "remote"
+            if user_info:
+                token_cache.set(raw_token, user_info,
+                                exp=validated_token.get("exp"))
 
+        if not user_info:
+            result = "failed"
+        metrics.AUTH_LATENCY.observe(result, value=time.perf_counter() - start)
         if not user_info:
             raise AuthenticationFailed("User not found")
 
         request.user = self.create_user_representation(user_info)
         return (request.user, validated_token)
 
+    def get_validated_token(self, raw_token):
+        if not jwks.jwt_setting('JWKS_PATH'):
+            return super().get_validated_token(raw_token)
+        try:
+            return jwks.JWKSAccessToken(raw_token)
+        except TokenError as e:
+            raise InvalidToken({
+                "detail": "Given token not valid for any token type",
+                "messages": [{"token_class": "JWKSAccessToken",
+                              "token_type": "access", "message": e.args[0]}],
+            })
+
+    def local_user_info(self, token):
+        """
+        In local mode, the caller as described by the token claims.
+
+        :return: User info, or None if the user service has to be asked
+                 (remote mode, missing claims or a revoked token)
+        """
+        if jwks.jwt_setting('MODE') != 'local' or self.is_revoked(token):
+            return None
+        return jwks.claims_user_info(token)
+
+    def is_revoked(self, token):
+        if not jwks.jwt_setting('REVOCATION_PATH'):
+            return False
+        return jwks.get_revocation_list().contains(token)
+
     def fetch_user_info(self, token):
         headers = {"Authorization": f"Bearer {token}"}
         try:
-            response = requests.get(self.AUTH_SERVICE_URL, headers=headers)
+            response = downstream.get(
+                self.AUTH_SERVICE, self.AUTH_SERVICE_PATH, headers=headers)
             if response.status_code == 200:
-                return response.json()
+                return downstream.decode(response)
         except requests.RequestException:
             pass
         return None
@@ -52,9 +107,6 @@ class RemoteJWTAuthentication(JWTAuthentication):
         if not header:
             raise AuthenticationFailed("Authorization header missing")
 
-        # Debug the header
-        print("Authorization Header:", header)
-
         # Extract token
         parts = header.split()
         if len(parts) != 2 or parts[0].lower() != "bearer":
@@ -1,12 +1,25 @@
 # Create your views here.
 
+import logging
+from urllib.parse import parse_qs, urlparse
+
 import requests
+from django.http import StreamingHttpResponse
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 from rest_framework.views import APIView
 from rest_framework.response import Response
 # from rest_framework.authentication import BaseAuthentication
 from rest_framework.permissions import IsAuthenticated, AllowAny
+from . import changes, downstream, invitations, jsoncodec
+from .enrichment import AVAILABILITY, EVENT, Enricher, merge_wanted
+from .fieldsets import FieldSelection
+from .idempotency import idempotent
+from .response_cache import get_response_cache
+from .streaming import enrichment_records, stream_format, streaming_response
 from .util import RemoteJWTAuthentication
-from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
 
 
 class EventCreateView(APIView):
@@ -14,12 +27,21 @@ class EventCreateView(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
+        # Retries carrying the same Idempotency-Key get the first outcome
+        return idempotent(request, lambda: self.create(request),
+                          lambda body, status: Response(body, status=status))
+
+    def create(self, request):
         # Forward event data to the scheduling microservice
         event_data = request.data
-        print(request.data)
-        print("About to request from events microservice:")
-        event_response = requests.post(
-            "http://localhost:8000/events/",
+        if not isinstance(event_data, dict):
+            return Response({"detail": "Event data must be a JSON object"},
+                            status=400)
+        participant_ids = event_data.get('participant_ids')
+        logger.debug("Creating event with %d participants",
+                     len(participant_ids) if isinstance(participant_ids, list) else 0)
+        event_response = downstream.post(
+            "scheduling", "/events/",
             json=event_data,
             headers={"Authorization": f"Bearer {request.auth}"}
         )
@@ -27,149 +49,65 @@ class EventCreateView(APIView):
         # Check if event creation was successful
         if event_response.status_code == 201 or event_response.status_code == 200:
             # Parse the created event data
-            created_event = event_response.json()
+            created_event = downstream.decode(event_response, raw=True)
+
+            # Drop what the new event makes stale, e.g. event list pages
+            if created_event.get('id') is not None:
+                changes.apply_changes(
+                    [("event", created_event['id'], "created", created_event)],
+                    source="composite")
 
             # Send emails to participants
             self.send_event_emails(created_event, request.auth)
 
-        print(event_response.text)
-        return Response(event_response.json(), status=event_response.status_code)
+        else:
+            logger.warning("Scheduling service rejected event: %s",
+                           event_response.status_code)
+            created_event = downstream.decode(event_response)
+        return Response(created_event, status=event_response.status_code)
 
     def send_event_emails(self, event, auth_token):
         """
-        Send email notifications to all participants about the newly created event.
+        Queue email notifications to all participants about the newly created
+        event. Delivery happens on a background worker (see invitations.py).
 
         :param event: Dict containing event details
         :param auth_token: Authentication token for making requests
         """
-        # Collect participant IDs
-        participant_ids = event.get('participant_ids', [])
-
-        # Fetch details for each participant
-        for participant_id in participant_ids:
-            try:
-                # Fetch participant details
-                user_response = requests.get(
-                    f"http://localhost:8001/userinfo/{participant_id}/",
-                    headers={"Authorization": f"Bearer {auth_token}"}
-                )
-                user_response.raise_for_status()
-                participant = user_response.json()
-
-                # Prepare email data
-                email_data = {
-                    "subject": f"New Event Invitation: {event.get('title', 'Untitled Event')}",
-                    "body": self.construct_event_email_body(event, participant),
-                    "recipient_list": participant.get('email'),
-                    "time": datetime.now().strftime("%Y-%m-%d %H:%M")
-                }
-
-                # Send email
-                self.send_email(email_data)
-
-            except requests.RequestException as e:
-                print(f"Failed to send email to participant {
-                      participant_id}: {e}")
-
-    def construct_event_email_body(self, event, participant):
-        """
-        Construct a personalized email body for the event invitation.
-
-        :param event: Dict containing event details
-        :param participant: Dict containing participant details
-        :return: Formatted email body
-        """
-        return f"""Hi {participant.get('first_name', 'Participant')},
-
-You've been invited to a new event:
-
-Event: {event.get('title', 'Untitled Event')}
-Description: {event.get('description', 'No description provided')}
-Start Time: {event.get('start_time', 'Not specified')}
-Location: {event.get('location', 'Not specified')}
-
-Please check your event details and confirm your availability.
-
-Best regards,
-Your Event Management Team"""
-
-    def send_email(self, email_data):
-        """
-        Send email via the email microservice.
-
-        :param email_data: Dict containing email details
-        """
-        try:
-            email_response = requests.post(
-                "http://localhost:8003/send-email",
-                json=email_data
-            )
-            email_response.raise_for_status()
-            print(f"Email sent successfully to {email_data['recipient_list']}")
-        except requests.RequestException as e:
-            print(f"Failed to send email: {e}")
+        invitations.dispatch_event_emails(event, auth_token)
 
 
-def get_enriched_event(request, event_id):
+def get_enriched_event(request, event_id, selection=None):
     """
     Retrieve an event from the scheduling service and enrich
     participant and organizer information with user details.
 
     :param request: The original request (for authentication)
     :param event_id: ID of the event to retrieve
+    :param selection: ``FieldSelection`` limiting what is fetched and returned
     :return: Enriched event dictionary
     """
+    selection = selection or FieldSelection()
     try:
-        # Retrieve the event from scheduling service
-        print(f"request.auth: {request.auth}")
-        event_response = requests.get(
-            f"http://localhost:8000/events/{event_id}/",
-            headers={"Authorization": f"Bearer {request.auth}"}
-        )
-        event_response.raise_for_status()  # Raise an exception for bad responses
-        event_data = event_response.json()
-
-        # Collect unique user IDs
-        user_ids = set()
-        # Add organizer ID
-        if event_data.get('organizer_id'):
-            user_ids.add(event_data['organizer_id'])
-
-        # Add participant IDs
-        if event_data.get('participant_ids'):
-            user_ids.update(event_data['participant_ids'])
-
-        # Fetch user details for each unique user ID
-        user_details = {}
-        for user_id in user_ids:
-            try:
-                print(f"User id = {user_id}")
-                user_response = requests.get(
-                    f"http://localhost:8001/userinfo/{user_id}/",
-                    headers={"Authorization": f"Bearer {request.auth}"}
-                )
-                user_response.raise_for_status()
-                user_details[user_id] = user_response.json()
-            except requests.RequestException as e:
-                print(f"Failed to fetch user {user_id}: {e}")
-
-        # Enrich event data with user objects
-        if event_data.get('organizer_id'):
-            event_data['organizer'] = user_details.get(
-                event_data['organizer_id'])
-
-        # Replace participant IDs with user objects
-        if event_data.get('participant_ids'):
-            event_data['participants'] = [
-                user_details.get(pid) for pid in event_data['participant_ids']
-                if pid in user_details
-            ]
-
-        return event_data
-
+        event_data = Enricher.for_request(request).get(
+            EVENT, event_id, only=selection.expansions(EVENT))
     except requests.RequestException as e:
-        print(f"Error retrieving event: {e}")
+        logger.warning("Error retrieving event %s: %s", event_id, e)
         return None
+    return selection.apply(event_data)
+
+
+def parse_selection(request, resource):
+    """
+    :return: ``(selection, error_response)``; the response is set if the
+             query parameters are invalid
+    """
+    selection = FieldSelection.from_request(request)
+    try:
+        selection.expansions(resource)
+    except ValueError as e:
+        return None, Response({"detail": str(e)}, status=400)
+    return selection, None
 
 
 class EnrichedEventView(APIView):
@@ -177,64 +115,182 @@ class EnrichedEventView(APIView):
     permission_classes = [AllowAny]
 
     def get(self, request, event_id):
-        enriched_event = get_enriched_event(request, event_id)
+        selection, error = parse_selection(request, EVENT)
+        if error is not None:
+            return error
+
+        fmt = stream_format(request)
+        if fmt:
+            return self.stream(request, event_id, fmt, selection)
+
+        response_cache = get_response_cache()
+        entry = response_cache.get_or_build(
+            "event", event_id, request,
+            lambda: get_enriched_event(request, event_id, selection),
+            variant=selection.key, depends_on=EVENT.embedded)
 
-        if enriched_event is None:
+        if entry is None:
             return Response({"detail": "Failed to retrieve event"}, status=500)
 
-        return Response(enriched_event)
+        return response_cache.respond(request, entry)
 
+    def stream(self, request, event_id, fmt, selection):
+        """
+        Send the event core first, then each user as it resolves. Only
+        ``expand`` applies: records are sent as the services return them.
+        """
+        enricher = Enricher.for_request(request)
+        try:
+            event_data = enricher.fetch_one(EVENT, event_id)
+        except requests.RequestException as e:
+            logger.warning("Error retrieving event %s: %s", event_id, e)
+            return Response({"detail": "Failed to retrieve event"}, status=500)
 
-def get_enriched_availability(request, availability_id):
-    try:
-        # Retrieve the availability from scheduling service
-        print(f"request.auth: {request.auth}")
-        availability_response = requests.get(
-            f"http://localhost:8000/availabilities/{availability_id}/",
-            headers={"Authorization": f"Bearer {request.auth}"}
-        )
-        # Raise an exception for bad responses
-        availability_response.raise_for_status()
-        availability_data = availability_response.json()
-
-        # Collect unique user ID (participant)
-        user_ids = set()
-        if availability_data.get('participant_id'):
-            user_ids.add(availability_data['participant_id'])
-
-        # Fetch user details for the participant
-        user_details = {}
-        for user_id in user_ids:
-            try:
-                print(f"User id = {user_id}")
-                user_response = requests.get(
-                    f"http://localhost:8001/userinfo/{user_id}/",
-                    headers={"Authorization": f"Bearer {request.auth}"}
-                )
-                user_response.raise_for_status()
-                user_details[user_id] = user_response.json()
-            except requests.RequestException as e:
-                print(f"Failed to fetch user {user_id}: {e}")
-
-        # Enrich availability data with user object
-        if availability_data.get('participant_id'):
-            availability_data['participant'] = user_details.get(
-                availability_data['participant_id'])
-
-        # Enrich with event link (URL)
-        event_id = availability_data.get('event_id')
-        # TODO: Proper HATEOS setup here
-        print(availability_data)
-        if event_id:
-            event_url = f"http://localhost:8002/getevent/{event_id}/"
-            # Return event URL instead of full event data
-            availability_data['event'] = event_url
-
-        return availability_data
+        return streaming_response(fmt, enrichment_records(
+            [("event", event_data)],
+            EVENT.wanted(event_data, selection.expansions(EVENT)).get("user", set()),
+            enricher.users))
+
+
+def upstream_link(request, url):
+    """
+    Translate a next/previous link of the scheduling service into the same
+    window on this endpoint.
+    """
+    if not url:
+        return None
+    params = parse_qs(urlparse(url).query)
+    link = request.build_absolute_uri()
+    for name in ("limit", "offset"):
+        if params.get(name):
+            link = replace_query_param(link, name, params[name][0])
+        else:
+            link = remove_query_param(link, name)
+    return link
+
+
+def get_event_page(request, paginator):
+    """
+    Retrieve one page of events from the scheduling service.
+
+    Query parameters are forwarded so upstream filters keep working. When the
+    scheduling service paginates, only the requested window is transferred
+    and its page is used as is, with its count and links; a plain list is
+    paginated locally instead.
+
+    :param request: The original request (for authentication and paging)
+    :param paginator: The view's ``LimitOffsetPagination`` instance
+    :return: ``(events, page_info)``; ``page_info`` holds ``count``,
+             ``next`` and ``previous``
+    """
+    params = request.query_params.dict()
+    params["limit"] = paginator.get_limit(request)
+    params["offset"] = paginator.get_offset(request)
+    events_response = downstream.get(
+        "scheduling", "/events/",
+        params=params,
+        headers={"Authorization": f"Bearer {request.auth}"}
+    )
+    events_response.raise_for_status()
+    events = downstream.decode(events_response)
+
+    if isinstance(events, dict):
+        results = events.get("results", [])
+        return results, {
+            "count": events.get("count", len(results)),
+            "next": upstream_link(request, events.get("next")),
+            "previous": upstream_link(request, events.get("previous")),
+        }
+
+    page = paginator.paginate_queryset(events, request)
+    return page, {
+        "count": paginator.count,
+        "next": paginator.get_next_link(),
+        "previous": paginator.get_previous_link(),
+    }
+
+
+def stream_event_page(page_info, page, lookups):
+    """
+    Yield the paginated JSON document one enriched event at a time. The
+    page's users are looked up together, and each event is sent, in page
+    order, as soon as the users it references have resolved, so the page is
+    neither held back by its slowest user nor held in memory as a whole.
 
+    :param lookups: ``(user_id, details, error)`` for the page's users, as
+                    yielded by ``UserInfoClient.iter_many``
+    """
+    yield jsoncodec.dumps(page_info)[:-1] + b',"results":['
+    waiting = [(event_data, set(EVENT.wanted(event_data).get("user", ())))
+               for event_data in page]
+    users, done, sent = {}, set(), 0
+
+    def ready(flush=False):
+        nonlocal sent
+        while sent < len(waiting):
+            event_data, user_ids = waiting[sent]
+            if not flush and not user_ids <= done:
+                return
+            yield (b"," if sent else b"") + jsoncodec.encode(
+                EVENT.attach(event_data, {"user": users}))
+            sent += 1
+
+    yield from ready()
+    for user_id, details, error in lookups:
+        done.add(user_id)
+        if error is None and details is not None:
+            users[user_id] = details
+        else:
+            logger.warning("Failed to fetch user %s: %s", user_id, error)
+        yield from ready()
+    yield from ready(flush=True)
+    yield b"]}"
+
+
+class EnrichedEventListView(APIView):
+    """
+    Enrich a page of events in one call. The users referenced by the whole
+    page are deduplicated and fetched once, and each event is streamed out
+    as soon as its own users are in.
+    """
+    authentication_classes = [RemoteJWTAuthentication]
+    permission_classes = [AllowAny]
+    pagination_class = api_settings.DEFAULT_PAGINATION_CLASS
+
+    def get(self, request):
+        paginator = self.pagination_class()
+        try:
+            page, page_info = get_event_page(request, paginator)
+        except requests.RequestException as e:
+            logger.warning("Error retrieving events: %s", e)
+            return Response({"detail": "Failed to retrieve events"}, status=500)
+
+        enricher = Enricher.for_request(request)
+        wanted = merge_wanted((EVENT, event_data) for event_data in page)
+
+        fmt = stream_format(request)
+        if fmt:
+            head = [("page", page_info)]
+            head += [("event", event_data) for event_data in page]
+            return streaming_response(fmt, enrichment_records(
+                head, wanted.get("user", set()), enricher.users))
+
+        return StreamingHttpResponse(
+            stream_event_page(page_info, page,
+                              enricher.users.iter_many(wanted.get("user", set()))),
+            content_type="application/json")
+
+
+def get_enriched_availability(request, availability_id, selection=None):
+    selection = selection or FieldSelection()
+    try:
+        availability_data = Enricher.for_request(request).get(
+            AVAILABILITY, availability_id,
+            only=selection.expansions(AVAILABILITY))
     except requests.RequestException as e:
-        print(f"Error retrieving availability: {e}")
+        logger.warning("Error retrieving availability %s: %s", availability_id, e)
         return None
+    return selection.apply(availability_data)
 
 
 class EnrichedAvailabilityView(APIView):
@@ -242,10 +298,18 @@ class EnrichedAvailabilityView(APIView):
     permission_classes = [AllowAny]
 
     def get(self, request, availability_id):
-        enriched_availability = get_enriched_availability(
-            request, availability_id)
-
-        if enriched_availability is None:
+        selection, error = parse_selection(request, AVAILABILITY)
+        if error is not None:
+            return error
+
+        response_cache = get_response_cache()
+        entry = response_cache.get_or_build(
+            "availability", availability_id, request,
+            lambda: get_enriched_availability(
+                request, availability_id, selection),
+            variant=selection.key, depends_on=AVAILABILITY.embedded)
+
+        if entry is None:
             return Response({"detail": "Failed to retrieve availability"}, status=500)
 
-        return Response(enriched_availability)
+        return response_cache.respond(request, entry)
@@ -44,6 +44,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'composite.middleware.MetricsMiddleware',
+    'composite.middleware.RequestIdMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -51,6 +53,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'composite.middleware.DeadlineMiddleware',
 ]
 
 ROOT_URLCONF = 'mm_composite.urls'
@@ -134,6 +137,15 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.AllowAny',
     ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'composite.jsoncodec.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'composite.jsoncodec.JSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.LimitOffsetPagination',
     'PAGE_SIZE': 10
 }
@@ -141,3 +153,256 @@ REST_FRAMEWORK = {
 GRAPHENE = {
     "SCHEMA": "composite.schema.schema",
 }
+
+# Concurrent fan-out of per-resource downstream lookups (see composite/fanout.py)
+COMPOSITE_FANOUT = {
+    'POOL_SIZE': 64,
+    'MAX_IN_FLIGHT': 16,
+    'TIMEOUT': 10.0,
+}
+
+# User service lookups (see composite/users.py). Set BULK_PATH when the user
+# service exposes a bulk endpoint accepting ?ids=1,2,3. Set CACHE_BACKEND to
+# a CACHES alias to cache resolved profiles for CACHE_TTL seconds.
+USER_SERVICE = {
+    'USERINFO_PATH': '/userinfo/{id}/',
+    'BULK_PATH': None,
+    'BULK_MAX_IDS': 100,
+    'CACHE_BACKEND': None,
+    'CACHE_TTL': 300,
+}
+
+# Local replica of the user directory (see composite/replica.py). Run
+# `manage.py migrate` and `manage.py sync_users --full` before enabling it,
+# then keep it fresh with `manage.py sync_users --follow`.
+USER_REPLICA = {
+    'ENABLED': False,
+    'SYNC_PATH': '/userinfo/changes/',
+    'PAGE_SIZE': 500,
+    'SYNC_INTERVAL': 60,
+    'SERVICE_TOKEN': None,
+}
+
+# Cache of users resolved from bearer tokens (see composite/tokencache.py).
+# Entries expire at the token's exp claim or after TTL seconds, whichever is
+# first. Set SHARED_BACKEND to a CACHES alias to share entries across workers.
+TOKEN_CACHE = {
+    'MAX_ENTRIES': 10000,
+    'TTL': 300,
+    'SHARED_BACKEND': None,
+}
+
+# Downstream microservices (see composite/downstream.py). Each service gets a
+# pooled keep-alive session; timeouts are in seconds, RETRIES applies to
+# idempotent requests only.
+DOWNSTREAM_SERVICES = {
+    'scheduling': {
+        'BASE_URL': 'http://localhost:8000',
+        'POOL_SIZE': 20,
+        'CONNECT_TIMEOUT': 2.0,
+        'READ_TIMEOUT': 10.0,
+        'RETRIES': 2,
+        'BACKOFF_FACTOR': 0.1,
+    },
+    'users': {
+        'BASE_URL': 'http://localhost:8001',
+        'POOL_SIZE': 50,
+        'CONNECT_TIMEOUT': 2.0,
+        'READ_TIMEOUT': 5.0,
+        'RETRIES': 2,
+        'BACKOFF_FACTOR': 0.1,
+    },
+    'notifications': {
+        'BASE_URL': 'http://localhost:8003',
+        'POOL_SIZE': 10,
+        'CONNECT_TIMEOUT': 2.0,
+        'READ_TIMEOUT': 10.0,
+        'RETRIES': 0,
+        'BACKOFF_FACTOR': 0.1,
+    },
+}
+
+# HTTP cache of upstream GET responses honouring Cache-Control, ETag and
+# Last-Modified (see composite/httpcache.py). BACKEND is a CACHES alias, or
+# None to disable it. Django's own cache backends serve the async views
+# through a thread hand-off per lookup, so it is off by default; enable it
+# with a shared backend where upstream round trips cost more than that.
+HTTP_CACHE = {
+    'BACKEND': None,
+    'MAX_ENTRY_SIZE': 1024 * 1024,
+    'RETAIN': 3600,
+}
+
+# Route the async composite views (composite/async_views.py) instead of the
+# sync DRF views. Requires httpx and an ASGI server (mm_composite.asgi).
+# /getevents/ and GraphQL are served by the sync views in both modes.
+COMPOSITE_ASYNC_VIEWS = False
+
+# Background work queue (see composite/tasks.py). Use
+# 'composite.tasks.SqliteQueueBackend' in production so queued invitations
+# survive restarts; it can also be drained by `manage.py runworkers`.
+TASK_QUEUE = {
+    'BACKEND': 'composite.tasks.ThreadQueueBackend',
+    'WORKERS': 4,
+    'MAX_DEPTH': 1000,
+    'MAX_RETRIES': 5,
+    'BACKOFF_BASE': 1.0,
+    'BACKOFF_MAX': 60.0,
+    'SQLITE_PATH': BASE_DIR / 'taskqueue.sqlite3',
+}
+
+# Notifications service delivery (see composite/notifications.py). Emails are
+# grouped into batches of BATCH_SIZE, or flushed after FLUSH_INTERVAL seconds.
+# Without BATCH_PATH they are sent individually, MAX_IN_FLIGHT at a time.
+# WAIT_TIMEOUT bounds how long an invitation task waits for the outcomes.
+NOTIFICATIONS = {
+    'SEND_PATH': '/send-email',
+    'BATCH_PATH': None,
+    'BATCH_SIZE': 50,
+    'FLUSH_INTERVAL': 0.05,
+    'MAX_IN_FLIGHT': 8,
+    'WAIT_TIMEOUT': 300.0,
+}
+
+# Invitation email templates (see composite/emails.py). Set HTML_TEMPLATE,
+# e.g. to 'composite/invitation.html', to also send an HTML body.
+# SERVICE_TOKEN is what the background worker looks participants up with;
+# without it the caller's token is used, which only the in-memory task queue
+# allows (a durable queue never stores it).
+INVITATIONS = {
+    'SUBJECT_TEMPLATE': 'composite/invitation_subject.txt',
+    'TEXT_TEMPLATE': 'composite/invitation.txt',
+    'HTML_TEMPLATE': None,
+    'LOCALE': None,
+    'SERVICE_TOKEN': None,
+}
+
+# Idempotency-Key handling for event creation (see composite/idempotency.py).
+# Outcomes are stored in the database for TTL seconds.
+IDEMPOTENCY = {
+    'HEADER': 'Idempotency-Key',
+    'TTL': 24 * 3600,
+    'LOCK_TIMEOUT': 60,
+    'WAIT_TIMEOUT': 10.0,
+}
+
+# Access to the Prometheus endpoint (see composite/metrics.py): scrapers
+# must connect from ALLOWED_IPS (addresses or networks) or send TOKEN as a
+# bearer token.
+METRICS = {
+    'TOKEN': None,
+    'ALLOWED_IPS': ['127.0.0.1', '::1'],
+}
+
+# JSON codec for upstream bodies, requests and responses
+# (see composite/jsoncodec.py). BACKEND is 'auto', 'orjson', 'msgspec' or
+# 'json'; RAW_PASSTHROUGH re-emits the scheduling service's bytes for the
+# unmodified fields of events and availabilities.
+JSON_CODEC = {
+    'BACKEND': 'auto',
+    'RAW_PASSTHROUGH': False,
+}
+
+# Per-caller cache of enriched responses with ETag support
+# (see composite/response_cache.py). BACKEND is a CACHES alias.
+RESPONSE_CACHE = {
+    'BACKEND': 'default',
+    'TTL': 30,
+}
+
+# Collapse concurrent identical aggregations (see composite/singleflight.py).
+# Set SHARED_BACKEND to a CACHES alias to also coordinate workers, and
+# SCOPE_CLAIM to share flights between callers with the same claim value.
+SINGLEFLIGHT = {
+    'SCOPE_CLAIM': None,
+    'SHARED_BACKEND': None,
+    'LOCK_TIMEOUT': 10,
+    'RESULT_TTL': 5,
+    'WAIT_TIMEOUT': 10.0,
+}
+
+# Circuit breakers and deadline budgets for downstream calls
+# (see composite/resilience.py). Times are in seconds.
+RESILIENCE = {
+    'REQUEST_BUDGET': 8.0,
+    'RESPONSE_RESERVE': 0.1,
+    'DEADLINE_HEADER': 'X-Request-Deadline-Ms',
+    'BREAKER_WINDOW': 30,
+    'BREAKER_MIN_CALLS': 10,
+    'BREAKER_FAILURE_RATE': 0.5,
+    'BREAKER_OPEN_SECONDS': 15,
+    'BREAKER_HALF_OPEN_CALLS': 3,
+}
+
+# Structured JSON logging written from a background thread
+# (see composite/logutil.py). Debug records are sampled at DEBUG_SAMPLE_RATE;
+# raise a logger's level to silence it, or lower it to DEBUG to trace it.
+DEBUG_SAMPLE_RATE = 0.01
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'sample_debug': {
+            '()': 'composite.logutil.SamplingFilter',
+            'rate': DEBUG_SAMPLE_RATE,
+        },
+        'redact': {'()': 'composite.logutil.RedactingFilter'},
+        'request_id': {'()': 'composite.logutil.RequestIdFilter'},
+    },
+    'formatters': {
+        'structured': {'()': 'composite.logutil.StructuredFormatter'},
+    },
+    'handlers': {
+        'queue': {
+            'class': 'composite.logutil.QueueStreamHandler',
+            'stream': 'ext://sys.stdout',
+            'maxsize': 10000,
+            'formatter': 'structured',
+            'filters': ['sample_debug', 'redact', 'request_id'],
+        },
+    },
+    'loggers': {
+        'composite': {
+            'handlers': ['queue'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+        'composite.downstream': {'level': 'INFO'},
+        'composite.tasks': {'level': 'INFO'},
+        'django.request': {
+            'handlers': ['queue'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
+}
+
+# Change notifications from upstream services (see composite/changes.py).
+# A source's notifications are accepted once its SECRET is set; the caches
+# they invalidate (RESPONSE_CACHE, USER_SERVICE, HTTP_CACHE) must then be
+# shared between workers, e.g. Redis, not the default LocMemCache.
+CHANGE_NOTIFICATIONS = {
+    'SOURCES': {
+        'users': {'SECRET': None, 'RESOURCES': ['user']},
+        'scheduling': {'SECRET': None, 'RESOURCES': ['event', 'availability']},
+    },
+    'REDIS_URL': 'redis://localhost:6379/0',
+    'CHANNELS': ['composite.changes'],
+}
+
+# Access token verification (see composite/jwks.py). In 'local' mode the
+# caller is taken from the token claims instead of the user service; set
+# JWKS_PATH to verify with the auth service's published keys (RSA and EC
+# keys need the cryptography package). ALGORITHMS optionally restricts the
+# algorithms those keys may be used with.
+JWT_VERIFICATION = {
+    'MODE': 'remote',
+    'AUTH_SERVICE': 'users',
+    'JWKS_PATH': None,
+    'JWKS_TTL': 3600,
+    'JWKS_MIN_REFRESH_INTERVAL': 30,
+    'ALGORITHMS': None,
+    'REVOCATION_PATH': None,
+    'REVOCATION_REFRESH': 30,
+}